@@ -1,17 +1,120 @@
+import hashlib
+
+from django.core.cache import cache
+from django.http import Http404
+from django.views.generic import View
 from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .. import settings as app_settings
+from ..search import template_search
+from ..sharing import SHARED_FLAGS, get_tag_names, get_template_asset
+from ..views import asset_response
+
+
+class TemplateCursorPagination(CursorPagination):
+    """
+    paginates with a cursor (which does not slow down on
+    deep pages like ``OFFSET``), ordering search results
+    by relevance and other results by name
+    """
+    ordering = ('name',)
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        if 'rank' in queryset.query.annotations:
+            return ('-rank', 'name')
+        return self.ordering
 
 
 class BaseSearchTemplate(ListAPIView):
+    """
+    searches public templates, query string parameters:
+
+    - ``q``: terms searched in the name, description and
+      tags of templates, results are ordered by relevance
+    - ``name``, ``des``: filter templates whose name or
+      description contains the given text
+    - ``fields``: comma separated list of the fields returned,
+      by default all the fields except the (possibly large)
+      ``config`` and ``variable``
+    - ``cursor``, ``page_size``: pagination
+    """
+    template_model = None
+    pagination_class = TemplateCursorPagination
+    default_fields = ('id', 'name', 'description', 'backend',
+                      'type', 'tags', 'key', 'created', 'modified')
+
+    def get_fields(self):
+        available = self.serializer_class.Meta.fields
+        requested = self.request.query_params.get('fields', '').split(',')
+        fields = [name for name in requested if name in available]
+        return fields or list(self.default_fields)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'] = self.get_fields()
+        return super(BaseSearchTemplate, self).get_serializer(*args, **kwargs)
+
     def get_queryset(self):
-        queryset = self.template_model.objects.filter(flag='public')
-        name = self.request.GET.get('name', None)
-        des = self.request.GET.get('des', None)
+        fields = self.get_fields()
+        columns = [name for name in fields if name != 'tags']
+        queryset = self.template_model.objects.filter(flag='public').only('id', 'name', *columns)
+        search = self.request.query_params.get('q', '').strip()
+        name = self.request.query_params.get('name')
+        des = self.request.query_params.get('des')
         if name:
-            print(name, "\n\n\n")
-            queryset = queryset.filter(name__contains='{}'.format(name))
-            for i in queryset:
-                print(i.name)
-            print("\n\n\n\n")
+            queryset = queryset.filter(name__contains=name)
         if des:
             queryset = queryset.filter(description__contains=des)
+        if search:
+            queryset = template_search(queryset, search)
         return queryset
+
+    def paginate_queryset(self, queryset):
+        page = super(BaseSearchTemplate, self).paginate_queryset(queryset)
+        if page and 'tags' in self.get_fields():
+            self._load_tag_names(page)
+        return page
+
+    def _load_tag_names(self, templates):
+        # prefetch_related does not match UUID primary keys on sqlite
+        tag_names = get_tag_names(self.template_model, templates)
+        for template in templates:
+            template._tag_names = tag_names[template.pk]
+
+    def list(self, request, *args, **kwargs):
+        timeout = app_settings.SEARCH_CACHE_TIMEOUT
+        if not timeout:
+            return super(BaseSearchTemplate, self).list(request, *args, **kwargs)
+        # the links to the other pages contain the host of the request
+        url = request.build_absolute_uri().encode()
+        cache_key = 'netjsonconfig-template-search-{0}'.format(hashlib.md5(url).hexdigest())
+        data = cache.get(cache_key)
+        if data is None:
+            data = super(BaseSearchTemplate, self).list(request, *args, **kwargs).data
+            cache.set(cache_key, data, timeout)
+        return Response(data)
+
+
+class BaseTemplateDistribution(View):
+    """
+    returns the document of a public or shared template
+    (see ``sharing.get_template_data``) by key, gzipped if
+    supported by the client; clients revalidate it with
+    its ETag, which changes only when the template changes
+    """
+    template_model = None
+
+    def get(self, request, key):
+        try:
+            template = self.template_model.objects.only('id', 'key', 'flag', 'modified') \
+                                                  .get(key=key, flag__in=SHARED_FLAGS)
+        except self.template_model.DoesNotExist:
+            raise Http404()
+        asset = get_template_asset(template, request.build_absolute_uri())
+        # shared secret templates are not stored by shared caches
+        scope = 'public' if template.flag == 'public' else 'private'
+        return asset_response(request, asset, 'application/json', '{0}, no-cache'.format(scope))
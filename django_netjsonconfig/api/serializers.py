@@ -0,0 +1,31 @@
+from rest_framework import serializers
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ``ModelSerializer`` which outputs only the
+    fields passed in the ``fields`` argument
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class BaseTemplateSerializer(DynamicFieldsModelSerializer):
+    tags = serializers.SerializerMethodField()
+    config = serializers.JSONField(read_only=True)
+    variable = serializers.JSONField(read_only=True)
+
+    class Meta:
+        fields = ('id', 'name', 'description', 'backend', 'type',
+                  'tags', 'key', 'created', 'modified', 'config', 'variable')
+        read_only_fields = fields
+
+    def get_tags(self, obj):
+        # tag names loaded for a whole page (see ``BaseSearchTemplate``)
+        if hasattr(obj, '_tag_names'):
+            return obj._tag_names
+        return [tag.name for tag in obj.tags.all()]
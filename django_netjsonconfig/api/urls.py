@@ -0,0 +1,12 @@
+from django.conf.urls import url
+
+from . import views
+
+app_name = 'django_netjsonconfig'
+
+urlpatterns = [
+    url(r'^api/v1/template/search/$', views.search_template, name='search_template'),
+    url(r'^api/v1/template/(?P<key>[^/\.]+)\.json$',
+        views.template_distribution,
+        name='template_distribution'),
+]
@@ -0,0 +1,21 @@
+from ..models import Template
+from .generics import BaseSearchTemplate, BaseTemplateDistribution
+from .serializers import BaseTemplateSerializer
+
+
+class TemplateSerializer(BaseTemplateSerializer):
+    class Meta(BaseTemplateSerializer.Meta):
+        model = Template
+
+
+class SearchTemplateView(BaseSearchTemplate):
+    template_model = Template
+    serializer_class = TemplateSerializer
+
+
+class TemplateDistributionView(BaseTemplateDistribution):
+    template_model = Template
+
+
+search_template = SearchTemplateView.as_view()
+template_distribution = TemplateDistributionView.as_view()
@@ -1,10 +1,12 @@
 from django.apps import AppConfig
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.db.models.signals import m2m_changed, post_delete
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_migrate
 from django.utils.translation import ugettext_lazy as _
 
-from .settings import REGISTRATION_ENABLED, SHARED_SECRET
+from . import backends, template_lookups
+from .settings import BACKENDS_WARMUP, REGISTRATION_ENABLED, SHARED_SECRET
 
 
 class DjangoNetjsonconfigApp(AppConfig):
@@ -25,6 +27,9 @@ class DjangoNetjsonconfigApp(AppConfig):
         * m2m validation before templates are added/removed to a config
         * automatic vpn client management on m2m_changed
         * automatic vpn client removal
+        * invalidation of the cached template lookups
+        * check of the global context after migrations
+        * repair of the search tables after migrations
         """
         m2m_changed.connect(self.config_model.clean_templates,
                             sender=self.config_model.templates.through)
@@ -34,6 +39,26 @@ class DjangoNetjsonconfigApp(AppConfig):
                             sender=self.config_model.templates.through)
         post_delete.connect(self.vpnclient_model.post_delete,
                             sender=self.vpnclient_model)
+        template_lookups.connect_signals(self.config_model.get_template_model())
+        post_migrate.connect(self.check_context_after_migrate, sender=self)
+        post_migrate.connect(self.repair_search_tables, sender=self)
+
+    def check_context_after_migrate(self, **kwargs):
+        from .tasks import check_global_context
+        context_model = self.get_model('ContextVariable')
+        # the app may have been migrated backwards
+        if context_model._meta.db_table in connection.introspection.table_names():
+            check_global_context(self.config_model._meta.label)
+
+    def repair_search_tables(self, using='default', **kwargs):
+        """
+        recreates the triggers of the FTS5 tables which are dropped
+        when migrations rebuild tables (see ``search.repair_fts_table``)
+        """
+        from .search import repair_fts_table
+        device_model = self.config_model._meta.get_field('device').related_model
+        for model in (device_model, self.config_model.get_template_model()):
+            repair_fts_table(model, using)
 
     def check_settings(self):
         if settings.DEBUG is False and REGISTRATION_ENABLED and not SHARED_SECRET:  # pragma: nocover
@@ -45,3 +70,5 @@ class DjangoNetjsonconfigApp(AppConfig):
         self.__setmodels__()
         self.check_settings()
         self.connect_signals()
+        if BACKENDS_WARMUP:
+            backends.warm_up()
@@ -0,0 +1,102 @@
+"""
+Registry of the netjsonconfig backends
+
+Each backend is imported and its schemas are processed once per process
+(see ``get_backend``), optionally when the application is loaded (see
+``NETJSONCONFIG_BACKENDS_WARMUP``), instead of each time a configuration
+is validated or a schema is requested.
+"""
+from collections import namedtuple
+from copy import deepcopy
+
+from django.utils.module_loading import import_string
+from jsonschema import FormatChecker, validators
+from jsonschema.exceptions import ValidationError as JsonSchemaError
+
+from netjsonconfig.backends.base.backend import BaseBackend
+from netjsonconfig.exceptions import ValidationError as SchemaError
+
+from .settings import BACKENDS, VPN_BACKENDS
+
+Backend = namedtuple('Backend', ['path', 'backend_class', 'schema', 'validator'])
+Backend.__doc__ = """
+``schema`` is the JSON schema shown by the configuration editor (which
+must not be modified), ``validator`` is the jsonschema validator of the
+schema of ``backend_class``, whose meta-schema validation is performed
+once instead of each time a configuration is validated
+"""
+
+_backends = {}
+_validators = {}
+
+
+def get_backend(path):
+    """
+    returns the ``Backend`` of the netjsonconfig backend
+    class at ``path``, which is built on first use
+    """
+    backend = _backends.get(path)
+    if backend is None:
+        backend_class = import_string(path)
+        backend = Backend(path=path,
+                          backend_class=backend_class,
+                          schema=get_editor_schema(path, backend_class),
+                          validator=get_validator(backend_class))
+        _backends[path] = backend
+    return backend
+
+
+def get_editor_schema(path, backend_class):
+    """
+    returns the JSON schema of a backend
+    as shown by the configuration editor
+    """
+    schema = deepcopy(backend_class.schema)
+    # must use conditional because some custom backends might not specify an hostname
+    if 'general' in schema.get('properties', {}):
+        # hide hostname because it's handled via models
+        if 'hostname' in schema['properties']['general']['properties']:
+            del schema['properties']['general']['properties']['hostname']
+        # remove hosname from required properties
+        if 'hostname' in schema['properties']['general'].get('required', []):
+            del schema['properties']['general']['required']
+    # start editor empty by default, except for VPN schemas
+    if path not in dict(VPN_BACKENDS):
+        schema['defaultProperties'] = []
+    return schema
+
+
+def get_validator(backend_class):
+    """
+    returns the validator of the schema of ``backend_class``
+    """
+    validator = _validators.get(backend_class)
+    if validator is None:
+        cls = validators.validator_for(backend_class.schema)
+        cls.check_schema(backend_class.schema)
+        validator = cls(backend_class.schema, format_checker=FormatChecker())
+        _validators[backend_class] = validator
+    return validator
+
+
+def validate(backend):
+    """
+    validates the configuration of a backend instance like
+    ``backend.validate()``, but with the validator of the registry;
+    backends which redefine ``validate`` are validated by it
+    """
+    if type(backend).validate is not BaseBackend.validate:
+        backend.validate()
+        return
+    try:
+        get_validator(type(backend)).validate(backend.config)
+    except JsonSchemaError as e:
+        raise SchemaError(e)
+
+
+def warm_up():
+    """
+    builds the registry of the configured backends
+    """
+    for path, label in BACKENDS + VPN_BACKENDS:
+        get_backend(path)
@@ -1,22 +1,39 @@
+import hashlib
+import json
 import logging
 
+import django
 from django import forms
 from django.conf import settings
 from django.conf.urls import url
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.admin.templatetags.admin_static import static
-from django.core.exceptions import FieldDoesNotExist, ValidationError
-from django.http import Http404, HttpResponse
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.contrib.auth import get_permission_codename
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, PermissionDenied, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.template.loader import select_template
 from django.template.response import TemplateResponse
-from django.urls import reverse
+from django.urls import reverse, reverse_lazy
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 
 from openwisp_utils.admin import TimeReadonlyAdminMixin
 
 from .. import settings as app_settings
-from ..utils import send_file
-from ..widgets import JsonSchemaWidget
+from ..export import FORMATS, iter_config_archives, stream_archive
+from ..search import fts_search, get_exact_lookup, has_fts_table
+from ..template_lookups import get_template_ids
+from ..utils import call_with_budget, send_file
+from ..widgets import JsonSchemaWidget, SortedAutocompleteWidget
 
 logger = logging.getLogger(__name__)
 prefix = 'django-netjsonconfig/'
@@ -31,6 +48,203 @@ class BaseAdmin(TimeReadonlyAdminMixin, ModelAdmin):
     pass
 
 
+CURSOR_VAR = 'cursor'
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimated_count(queryset):
+    """
+    returns the number of rows of ``queryset`` as estimated
+    by the PostgreSQL query planner; an exact count is
+    performed on other databases or if the estimate is low
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) {0}'.format(sql), params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]['Plan']['Plan Rows']
+        if estimate >= ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+    return queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class DeferredJSONChangeList(ChangeList):
+    """
+    ChangeList which does not load the JSON columns of the
+    listed objects and of the related objects specified
+    in ``list_select_related``, which list pages do not show
+    """
+    def get_queryset(self, request):
+        queryset = super(DeferredJSONChangeList, self).get_queryset(request)
+        related = self.list_select_related
+        if not isinstance(related, (list, tuple)):
+            related = []
+        return queryset.defer_json(*related)
+
+
+class KeysetChangeList(DeferredJSONChangeList):
+    """
+    ChangeList which shows estimated counts and paginates
+    with a cursor on ``(created, id)`` instead of OFFSET,
+    whose cost grows with the number of skipped rows
+    """
+    ordering = ['-created', '-pk']
+
+    def get_filters_params(self, params=None):
+        lookup_params = super(KeysetChangeList, self).get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        return self.ordering[:]
+
+    def get_cursor(self, obj):
+        return '{0}_{1}'.format(obj.created.isoformat(), obj.pk.hex)
+
+    def parse_cursor(self, cursor):
+        created, _, pk = cursor.rpartition('_')
+        try:
+            created = parse_datetime(created)
+            pk = self.model._meta.pk.to_python(pk)
+        except (ValueError, ValidationError):
+            created = None
+        if not created:
+            raise IncorrectLookupParameters('Invalid cursor: {0}'.format(cursor))
+        return created, pk
+
+    def get_results(self, request):
+        queryset = self.queryset
+        self.cursor = self.params.get(CURSOR_VAR)
+        if self.cursor:
+            created, pk = self.parse_cursor(self.cursor)
+            queryset = queryset.filter(Q(created__lt=created) |
+                                       Q(created=created, pk__lt=pk))
+        # fetch one more row to know whether there's a next page
+        result_list = list(queryset[:self.list_per_page + 1])
+        self.result_list = result_list[:self.list_per_page]
+        self.has_next = len(result_list) > self.list_per_page
+        self.paginator = self.model_admin.get_paginator(request, self.queryset,
+                                                        self.list_per_page)
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.can_show_all = False
+        self.multi_page = self.has_next or bool(self.cursor)
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+    @property
+    def next_page_url(self):
+        if not self.has_next:
+            return None
+        cursor = self.get_cursor(self.result_list[-1])
+        return self.get_query_string({CURSOR_VAR: cursor}, remove=[PAGE_VAR])
+
+
+class InputFilter(admin.ListFilter):
+    """
+    List filter rendered as a text input with autocompletion,
+    used instead of filters which list every available option
+    """
+    template = 'admin/django_netjsonconfig/input_filter.html'
+    parameter_name = None
+    lookup = None
+
+    def __init__(self, request, params, model, model_admin):
+        super(InputFilter, self).__init__(request, params, model, model_admin)
+        self.value = params.pop(self.parameter_name, None)
+        self.model_admin = model_admin
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_name]
+
+    def queryset(self, request, queryset):
+        if self.value:
+            return queryset.filter(**{self.lookup: self.value})
+
+    def get_options(self):
+        """
+        static autocompletion options, list of (value, label) tuples
+        """
+        return []
+
+    def get_autocomplete_url(self):
+        """
+        URL which returns autocompletion options for the ``q`` parameter
+        """
+        return None
+
+    def choices(self, changelist):
+        ignored = [self.parameter_name, CURSOR_VAR, PAGE_VAR]
+        yield {
+            'parameter_name': self.parameter_name,
+            'value': self.value or '',
+            'options': self.get_options(),
+            'autocomplete_url': self.get_autocomplete_url(),
+            'hidden_params': sorted((key, value) for key, value in changelist.params.items()
+                                    if key not in ignored),
+            'clear_query_string': changelist.get_query_string(remove=ignored)
+        }
+
+
+class BackendFilter(InputFilter):
+    title = _('backend')
+    parameter_name = 'backend'
+    lookup = 'config__backend'
+
+    def get_options(self):
+        return app_settings.BACKENDS
+
+
+class TemplateFilter(InputFilter):
+    title = _('template')
+    parameter_name = 'template'
+    lookup = 'config__templates__name'
+
+    def get_autocomplete_url(self):
+        opts = self.model_admin.model._meta
+        url_name = 'admin:{0}_{1}_template_autocomplete'.format(opts.app_label, opts.model_name)
+        return reverse(url_name)
+
+
+def can_view(user, model):
+    """
+    returns ``True`` if ``user`` has the permission to view the
+    objects of ``model`` (the change permission on django < 2.1,
+    which does not have the view permission)
+    """
+    opts = model._meta
+    actions = ('view', 'change') if django.VERSION >= (2, 1) else ('change',)
+    return any(user.has_perm('{0}.{1}'.format(opts.app_label, get_permission_codename(action, opts)))
+               for action in actions)
+
+
+def render_preview(instance, templates, context):
+    """
+    merges the templates, evaluates the variables, validates
+    and renders the configuration of a preview (without queries,
+    the data is loaded from the database beforehand)
+    """
+    backend = instance.get_backend_instance(template_instances=templates, context=context)
+    instance.clean_netjsonconfig_backend(backend)
+    return backend.render()
+
+
 class BaseConfigAdmin(BaseAdmin):
     preview_template = None
     actions_on_bottom = True
@@ -66,13 +280,16 @@ class BaseConfigAdmin(BaseAdmin):
                 ctx['download_url'] = None
         return ctx
 
+    def get_changelist(self, request, **kwargs):
+        return DeferredJSONChangeList
+
     def add_view(self, request, form_url='', extra_context=None):
         extra_context = extra_context or {}
         extra_context.update(self.get_extra_context())
         instance = self.model()
         if hasattr(instance, 'get_default_templates'):
-            templates = instance.get_default_templates()
-            templates = [str(t.id) for t in templates]
+            templates = get_template_ids(instance.get_default_templates())
+            templates = [str(pk) for pk in templates]
             extra_context.update({'default_templates': templates})
         return super(BaseConfigAdmin, self).add_view(request, form_url, extra_context)
 
@@ -136,6 +353,39 @@ class BaseConfigAdmin(BaseAdmin):
         return instance
 
     preview_error_msg = _('Preview for {0} with name {1} failed')
+    preview_ignored_params = ['csrfmiddlewaretoken']
+
+    def _get_preview_cache_key(self, request, templates, context):
+        """
+        hash of the posted data, of the ordered templates and of their
+        VPNs, whose last modification time invalidates the cache, and
+        of the context (which contains the global context variables
+        and the certificates of VPN clients)
+        """
+        data = sorted((key, value) for key, value in request.POST.items()
+                      if key not in self.preview_ignored_params)
+        templates = templates or []
+        vpn_ids = [t.vpn_id for t in templates if getattr(t, 'vpn_id', None)]
+        vpns = []
+        if vpn_ids:
+            vpn_model = templates[0]._meta.get_field('vpn').related_model
+            vpns = vpn_model.objects.filter(pk__in=vpn_ids).values_list('pk', 'modified')
+        value = json.dumps([self._get_config_model()._meta.label,
+                            data,
+                            [(str(t.pk), str(t.modified)) for t in templates],
+                            sorted((str(pk), str(modified)) for pk, modified in vpns),
+                            context],
+                           sort_keys=True, default=str)
+        return 'netjsonconfig-preview-{0}'.format(hashlib.sha1(value.encode()).hexdigest())
+
+    def _render_preview(self, instance, templates, context):
+        """
+        validates and renders the configuration within the time
+        and memory budget defined in the settings
+        """
+        return call_with_budget(render_preview, args=(instance, templates, context),
+                                timeout=app_settings.PREVIEW_TIMEOUT,
+                                memory_limit=app_settings.PREVIEW_MEMORY_LIMIT)
 
     def preview_view(self, request):
         if request.method != 'POST':
@@ -143,17 +393,8 @@ class BaseConfigAdmin(BaseAdmin):
             logger.warning(msg, extra={'request': request, 'stack': True})
             return HttpResponse(status=405)
         config_model = self._get_config_model()
-        error = None
-        output = None
         # error message for eventual exceptions
         error_msg = self.preview_error_msg.format(config_model.__name__, request.POST.get('name'))
-        try:
-            instance = self._get_preview_instance(request)
-        except Exception as e:
-            logger.exception(error_msg, extra={'request': request})
-            # return 400 for validation errors, otherwise 500
-            status = 400 if e.__class__ is ValidationError else 500
-            return HttpResponse(str(e), status=status)
         template_ids = request.POST.get('templates')
         if template_ids:
             template_model = config_model.get_template_model()
@@ -165,13 +406,35 @@ class BaseConfigAdmin(BaseAdmin):
                 return HttpResponse(str(e), status=400)
         else:
             templates = None
-        if not error:
-            backend = instance.get_backend_instance(template_instances=templates)
+        try:
+            instance = self._get_preview_instance(request)
+        except Exception as e:
+            logger.exception(error_msg, extra={'request': request})
+            # return 400 for validation errors, otherwise 500
+            status = 400 if e.__class__ is ValidationError else 500
+            return HttpResponse(str(e), status=status)
+        # the queries are performed here, not by the rendering process
+        if templates is None and hasattr(instance, 'templates'):
+            templates = list(instance.templates.all())
+        context = instance.get_context() if hasattr(instance, 'get_context') else None
+        cache_key = self._get_preview_cache_key(request, templates, context)
+        cached = cache.get(cache_key)
+        if cached:
+            output, error = cached
+        else:
+            output, error = None, None
             try:
-                instance.clean_netjsonconfig_backend(backend)
-                output = backend.render()
+                output = self._render_preview(instance, templates, context)
             except ValidationError as e:
                 error = str(e)
+            except TimeoutError:
+                logger.warning(error_msg, extra={'request': request})
+                message = _('Preview timed out after {0} seconds')
+                return HttpResponse(message.format(app_settings.PREVIEW_TIMEOUT), status=504)
+            except MemoryError:
+                logger.warning(error_msg, extra={'request': request})
+                return HttpResponse(_('Preview exceeded the memory limit'), status=500)
+            cache.set(cache_key, (output, error), app_settings.PREVIEW_CACHE_TIMEOUT)
         context = self.admin_site.each_context(request)
         opts = self.model._meta
         context.update({
@@ -259,6 +522,22 @@ class AbstractConfigInline(TimeReadonlyAdminMixin, admin.StackedInline):
         qs = super(AbstractConfigInline, self).get_queryset(request)
         return qs.select_related(*self.change_select_related)
 
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        """
+        renders only selected and default templates,
+        the others are loaded with AJAX while searching
+        """
+        if db_field.name == 'templates':
+            opts = db_field.related_model._meta
+            url = reverse_lazy('admin:{0}_{1}_options'.format(opts.app_label, opts.model_name))
+            kwargs['widget'] = SortedAutocompleteWidget(url=url, initial_filter=Q(default=True))
+        return super(AbstractConfigInline, self).formfield_for_manytomany(db_field, request, **kwargs)
+
+
+class ConfigActionForm(ActionForm):
+    template = forms.CharField(label=_('Template'), required=False)
+    new_template = forms.CharField(label=_('New template'), required=False)
+
 
 class AbstractDeviceAdmin(BaseConfigAdmin):
     list_display = ['name', 'backend', 'config_status',
@@ -321,6 +600,23 @@ class AbstractDeviceAdmin(BaseConfigAdmin):
     def get_readonly_fields(self, request, obj=None):
         return self._get_fields(self.readonly_fields, request, obj)
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        uses indexed equality lookups for mac addresses, UUIDs
+        and keys and the FTS5 table on SQLite if available
+        (on PostgreSQL icontains lookups use trigram indexes)
+        """
+        search_term = search_term.strip()
+        if search_term:
+            exact_lookup = get_exact_lookup(search_term)
+            if exact_lookup:
+                results = queryset.filter(exact_lookup)
+                if results.exists():
+                    return results, False
+            if has_fts_table(queryset.model, using=queryset.db):
+                return fts_search(queryset, search_term), False
+        return super(AbstractDeviceAdmin, self).get_search_results(request, queryset, search_term)
+
     def _get_preview_instance(self, request):
         c = super(AbstractDeviceAdmin, self)._get_preview_instance(request)
         c.device = self.model(id=request.POST.get('id'),
@@ -329,6 +625,147 @@ class AbstractDeviceAdmin(BaseConfigAdmin):
                               key=request.POST.get('key'))
         return c
 
+    actions = ['export_configs',
+               'set_configs_modified',
+               'add_template',
+               'remove_template',
+               'replace_template']
+    action_form = ConfigActionForm
+    export_format = 'zip'
+
+    def export_configs(self, request, queryset):
+        """
+        streams an archive containing the configuration
+        archive of each selected device
+        """
+        configs = self.model.get_config_model().objects.filter(device__in=queryset)
+        chunks = stream_archive(iter_config_archives(configs), self.export_format)
+        response = StreamingHttpResponse(chunks, content_type=FORMATS[self.export_format])
+        filename = 'configurations.{0}'.format(self.export_format)
+        response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+        return response
+
+    export_configs.short_description = _('Export configurations of selected devices')
+    # archives contain secrets, such as the private keys of VPN clients
+    export_configs.allowed_permissions = ('change',)
+
+    def _get_configs(self, queryset):
+        return self.model.get_config_model().objects.filter(device__in=queryset)
+
+    def _get_action_template(self, request, field):
+        template_model = self.model.get_config_model().get_template_model()
+        name = request.POST.get(field)
+        try:
+            return template_model.objects.get(name=name)
+        except ObjectDoesNotExist:
+            message = _('Template "{0}" does not exist').format(name or '')
+            self.message_user(request, message, messages.ERROR)
+
+    def _run_config_action(self, request, operation, *args):
+        try:
+            count = operation(*args)
+        except ValidationError as e:
+            self.message_user(request, '; '.join(e.messages), messages.ERROR)
+        else:
+            message = _('{0} configurations have been modified').format(count)
+            self.message_user(request, message, messages.SUCCESS)
+
+    def set_configs_modified(self, request, queryset):
+        self._run_config_action(request, self._get_configs(queryset).set_status_modified)
+
+    set_configs_modified.short_description = _('Flag configurations as modified')
+    set_configs_modified.allowed_permissions = ('change',)
+
+    def add_template(self, request, queryset):
+        template = self._get_action_template(request, 'template')
+        if template:
+            self._run_config_action(request, self._get_configs(queryset).add_template, template)
+
+    add_template.short_description = _('Add template to configurations')
+    add_template.allowed_permissions = ('change',)
+
+    def remove_template(self, request, queryset):
+        template = self._get_action_template(request, 'template')
+        if template:
+            self._run_config_action(request, self._get_configs(queryset).remove_template, template)
+
+    remove_template.short_description = _('Remove template from configurations')
+    remove_template.allowed_permissions = ('change',)
+
+    def replace_template(self, request, queryset):
+        template = self._get_action_template(request, 'template')
+        new_template = template and self._get_action_template(request, 'new_template')
+        if new_template:
+            self._run_config_action(request, self._get_configs(queryset).replace_template,
+                                    template, new_template)
+
+    replace_template.short_description = _('Replace template with new template in configurations')
+    replace_template.allowed_permissions = ('change',)
+
+    scalable_list_filters = {
+        'config__backend': BackendFilter,
+        'config__templates': TemplateFilter,
+    }
+    template_autocomplete_limit = 10
+
+    @property
+    def media(self):
+        media = super(AbstractDeviceAdmin, self).media
+        if app_settings.SCALABLE_DEVICE_LIST:
+            media += forms.Media(js=[static('{0}js/input-filter.js'.format(prefix))])
+        return media
+
+    def get_changelist(self, request, **kwargs):
+        if app_settings.SCALABLE_DEVICE_LIST:
+            return KeysetChangeList
+        return super(AbstractDeviceAdmin, self).get_changelist(request, **kwargs)
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        if app_settings.SCALABLE_DEVICE_LIST:
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super(AbstractDeviceAdmin, self).get_paginator(request, queryset, per_page,
+                                                              orphans, allow_empty_first_page)
+
+    def get_list_filter(self, request):
+        list_filter = super(AbstractDeviceAdmin, self).get_list_filter(request)
+        if not app_settings.SCALABLE_DEVICE_LIST:
+            return list_filter
+        return [self.scalable_list_filters.get(f, f) for f in list_filter]
+
+    def changelist_view(self, request, extra_context=None):
+        response = super(AbstractDeviceAdmin, self).changelist_view(request, extra_context)
+        context = getattr(response, 'context_data', None) or {}
+        if isinstance(context.get('cl'), KeysetChangeList):
+            # replace the pagination block of whatever
+            # changelist template would have been used
+            template_name = response.template_name
+            if isinstance(template_name, str):
+                template_name = [template_name]
+            context['base_change_list_template'] = select_template(template_name)
+            response.template_name = 'admin/django_netjsonconfig/keyset_change_list.html'
+        return response
+
+    def get_urls(self):
+        options = self.model._meta
+        url_prefix = '{0}_{1}'.format(options.app_label, options.model_name)
+        return [
+            url(r'^template-autocomplete/$',
+                self.admin_site.admin_view(self.template_autocomplete_view),
+                name='{0}_template_autocomplete'.format(url_prefix))
+        ] + super(AbstractDeviceAdmin, self).get_urls()
+
+    def template_autocomplete_view(self, request):
+        template_model = self.model.get_config_model().get_template_model()
+        if not can_view(request.user, template_model):
+            raise PermissionDenied
+        queryset = template_model.objects.order_by('name')
+        query = request.GET.get('q')
+        if query:
+            queryset = queryset.filter(name__icontains=query)
+        names = queryset.values_list('name', flat=True)[:self.template_autocomplete_limit]
+        return JsonResponse({'results': list(names)})
+
 
 if not app_settings.BACKEND_DEVICE_LIST:  # pragma: nocover
     AbstractDeviceAdmin.list_display.remove('backend')
@@ -339,7 +776,33 @@ class AbstractTemplateAdmin(BaseConfigAdmin):
     list_display = ['name', 'type', 'backend', 'flag', 'default', 'created', 'modified']
     list_filter = ['backend', 'type', 'default', 'created']
     search_fields = ['name']
+    # ignored on django < 2.0
+    autocomplete_fields = ['vpn']
+    options_page_size = 20
+    actions = ['add_to_existing_configs']
+
+    def add_to_existing_configs(self, request, queryset):
+        """
+        adds the selected templates to the existing
+        configurations which use the same backend
+        """
+        config_model = self.model._meta.get_field('config_relations').related_model
+        count = 0
+        for template in queryset:
+            configs = config_model.objects.filter(backend=template.backend)
+            try:
+                count += configs.add_template(template)
+            except ValidationError as e:
+                message = '{0}: {1}'.format(template, '; '.join(e.messages))
+                self.message_user(request, message, messages.ERROR)
+        message = _('{0} configurations have been modified').format(count)
+        self.message_user(request, message, messages.SUCCESS)
+
+    add_to_existing_configs.short_description = _('Add to existing configurations '
+                                                  'with the same backend')
+    add_to_existing_configs.allowed_permissions = ('change',)
     fields = ['flag',
+              'url',
               'name',
               'key',
               'type',
@@ -355,6 +818,44 @@ class AbstractTemplateAdmin(BaseConfigAdmin):
               'created',
               'modified']
 
+    def get_urls(self):
+        options = self.model._meta
+        url_prefix = '{0}_{1}'.format(options.app_label, options.model_name)
+        return [
+            url(r'^options/$',
+                self.admin_site.admin_view(self.options_view),
+                name='{0}_options'.format(url_prefix))
+        ] + super(AbstractTemplateAdmin, self).get_urls()
+
+    def options_view(self, request):
+        """
+        returns a page of templates matching the ``q``
+        and ``backend`` parameters, used by the
+        autocomplete widget of config forms; pages
+        follow the template name passed as ``after``
+        """
+        if not can_view(request.user, self.model):
+            raise PermissionDenied
+        queryset = self.model.objects.order_by('name')
+        query = request.GET.get('q')
+        backend = request.GET.get('backend')
+        after = request.GET.get('after')
+        if query:
+            queryset = queryset.filter(name__icontains=query)
+        if backend:
+            queryset = queryset.filter(backend=backend)
+        if after:
+            queryset = queryset.filter(name__gt=after)
+        # fetch one more row to know whether there's a next page
+        options = list(queryset.values_list('pk', 'name')[:self.options_page_size + 1])
+        more = len(options) > self.options_page_size
+        options = options[:self.options_page_size]
+        return JsonResponse({
+            'results': [{'id': str(pk), 'text': name} for pk, name in options],
+            'more': more,
+            'after': options[-1][1] if more else None
+        })
+
 
 class AbstractVpnForm(forms.ModelForm):
     """
@@ -382,8 +883,10 @@ class AbstractVpnAdmin(BaseConfigAdmin):
               'host',
               'ca',
               'cert',
+              'key_type',
               'backend',
               'notes',
+              'dh_length',
               'dh',
               'config',
               'created',
@@ -4,17 +4,38 @@ import json
 from copy import deepcopy
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.functional import cached_property
-from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
-from jsonfield import JSONField
 
 from netjsonconfig.exceptions import ValidationError as SchemaError
 from openwisp_utils.base import TimeStampedEditableModel
 
 from .. import settings as app_settings
+from ..backends import get_backend, validate
+from ..fields import LazyJSONField, RawJSON
+from ..variables import compile_config, evaluate, get_compiled_template, get_template_defaults, json_hash
+
+
+class BaseQuerySet(models.QuerySet):
+    def defer_json(self, *related):
+        """
+        defers the JSON columns of the model and of the
+        ``related`` models (specified as in ``select_related``),
+        useful when the objects are loaded only to be listed
+        """
+        fields = self._get_json_fields(self.model)
+        for lookup in related:
+            model = self.model
+            for name in lookup.split('__'):
+                model = model._meta.get_field(name).related_model
+            fields += ['{0}__{1}'.format(lookup, f) for f in self._get_json_fields(model)]
+        return self.defer(*fields)
+
+    @staticmethod
+    def _get_json_fields(model):
+        return [f.name for f in model._meta.concrete_fields if isinstance(f, LazyJSONField)]
 
 
 @python_2_unicode_compatible
@@ -23,6 +44,11 @@ class BaseModel(TimeStampedEditableModel):
     Shared logic
     """
     name = models.CharField(max_length=64, unique=True, db_index=True)
+    # fields whose value loaded from the database is
+    # remembered in order to detect changes without queries
+    _tracked_fields = []
+
+    objects = BaseQuerySet.as_manager()
 
     class Meta:
         abstract = True
@@ -30,6 +56,104 @@ class BaseModel(TimeStampedEditableModel):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(BaseModel, cls).from_db(db, field_names, values)
+        instance._store_tracked_values()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(BaseModel, self).refresh_from_db(*args, **kwargs)
+        self._store_tracked_values(kwargs.get('fields'))
+
+    def save(self, *args, **kwargs):
+        super(BaseModel, self).save(*args, **kwargs)
+        self._store_tracked_values()
+
+    def _get_tracked_value(self, attr):
+        """
+        JSON fields are tracked with a hash, which is cheaper to
+        store and compare than a deep copy of their contents,
+        JSON which has not been decoded yet is stored as is
+        and hashed only if it's compared with a decoded value
+        """
+        value = self.__dict__.get(attr)
+        if isinstance(value, RawJSON):
+            return value
+        value = getattr(self, attr)
+        if isinstance(self._meta.get_field(attr), LazyJSONField):
+            return json_hash(value)
+        return value
+
+    def _store_tracked_values(self, fields=None):
+        if not hasattr(self, '_tracked_values'):
+            self._tracked_values = {}
+        deferred = self.get_deferred_fields()
+        for attr in fields or self._tracked_fields:
+            if attr in self._tracked_fields and attr not in deferred:
+                self._tracked_values[attr] = self._get_tracked_value(attr)
+
+    def has_changed(self, *attrs):
+        """
+        returns ``True`` if any of the tracked fields in ``attrs``
+        differs from the value loaded from the database
+        (fields which have not been loaded are considered changed)
+        """
+        tracked = getattr(self, '_tracked_values', {})
+        for attr in attrs:
+            if attr not in tracked:
+                return True
+            old, new = tracked[attr], self._get_tracked_value(attr)
+            if old is new:
+                continue
+            if isinstance(old, RawJSON) or isinstance(new, RawJSON):
+                old, new = self._hash_raw_json(attr, old), self._hash_raw_json(attr, new)
+            if old != new:
+                return True
+        return False
+
+    def _hash_raw_json(self, attr, value):
+        if isinstance(value, RawJSON):
+            return json_hash(self._meta.get_field(attr).loads(value))
+        return value
+
+
+class VariablesMixin(models.Model):
+    """
+    stores the names of the variables used by ``config`` in
+    the related ``used_variables`` model, which allows to find
+    the objects affected by a change to the value of a variable
+    """
+    class Meta:
+        abstract = True
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        names = None
+        if self._state.adding or self.has_changed('config'):
+            names = compile_config(self.config or {}).variables
+        adding = self._state.adding
+        result = super(VariablesMixin, self).save(*args, **kwargs)
+        if names is not None:
+            if not adding:
+                self.used_variables.all().delete()
+            self.used_variables.model.objects.bulk_create([
+                self.used_variables.model(name=name, **{self.used_variables.field.name: self})
+                for name in sorted(names)
+            ])
+        return result
+
+    @classmethod
+    def get_variables_lookup(cls, names):
+        """
+        returns a ``Q`` object which matches the
+        objects which use any of the variables in ``names``
+        """
+        relation = cls._meta.get_field('used_variables')
+        pks = relation.related_model.objects.filter(name__in=list(names)) \
+                                            .values(relation.field.attname)
+        return models.Q(pk__in=pks)
+
 
 class BaseConfig(BaseModel):
     """
@@ -40,11 +164,10 @@ class BaseConfig(BaseModel):
                                max_length=128,
                                help_text=_('Select <a href="http://netjsonconfig.openwisp.org/en/'
                                            'stable/" target="_blank">netjsonconfig</a> backend'))
-    config = JSONField(_('configuration'),
-                       default=dict,
-                       help_text=_('configuration in NetJSON DeviceConfiguration format'),
-                       load_kwargs={'object_pairs_hook': collections.OrderedDict},
-                       dump_kwargs={'indent': 4})
+    config = LazyJSONField(_('configuration'),
+                           default=dict,
+                           help_text=_('configuration in NetJSON DeviceConfiguration format'),
+                           load_kwargs={'object_pairs_hook': collections.OrderedDict})
 
     __template__ = False
     __vpn__ = False
@@ -96,7 +219,7 @@ class BaseConfig(BaseModel):
         # an eventual ``ValidationError`` message with ``OrderedDict``
         # which would make the error message hard to read
         backend.config = json.loads(json.dumps(backend.config))
-        backend.validate()
+        validate(backend)
 
     @classmethod
     def clean_netjsonconfig_backend(self, backend):
@@ -119,7 +242,7 @@ class BaseConfig(BaseModel):
         """
         returns netjsonconfig backend class
         """
-        return import_string(self.backend)
+        return get_backend(self.backend).backend_class
 
     @cached_property
     def backend_instance(self):
@@ -128,22 +251,29 @@ class BaseConfig(BaseModel):
         """
         return self.get_backend_instance()
 
-    def get_backend_instance(self, template_instances=None):
+    def get_backend_instance(self, template_instances=None, context=None):
         """
-        allows overriding config and templates
-        needed for pre validation of m2m
+        allows overriding config, templates and context
+        needed for pre validation of m2m and previews
         """
         backend = self.backend_class
-        kwargs = {'config': self.get_config()}
+        config = self.get_config()
+        kwargs = {}
+        # evaluate variables if get_context method is defined,
+        # the default values of variables are defined by templates
+        if context is None and hasattr(self, 'get_context'):
+            context = self.get_context()
         # determine if we can pass templates
         # expecting a many2many relationship
         if hasattr(self, 'templates'):
             if template_instances is None:
                 template_instances = self.templates.all()
-            kwargs['templates'] = [t.config for t in template_instances]
-        # pass context to backend if get_context method is defined
-        if hasattr(self, 'get_context'):
-            kwargs['context'] = self.get_context()
+            template_instances = list(template_instances)
+            if context is not None:
+                context = dict(get_template_defaults(template_instances), **context)
+            kwargs['templates'] = [evaluate(t.config, get_compiled_template(t), context)
+                                   for t in template_instances]
+        kwargs['config'] = evaluate(config, compile_config(config), context)
         return backend(**kwargs)
 
     def generate(self):
@@ -160,6 +290,26 @@ class BaseConfig(BaseModel):
         config = self.generate().getvalue()
         return hashlib.md5(config).hexdigest()
 
+    def get_rendered_checksum(self):
+        """
+        returns a checksum of the rendered configuration, which unlike
+        the JSON representation is not affected by the order of keys
+        """
+        output = self.get_backend_instance().render()
+        return hashlib.md5(output.encode()).hexdigest()
+
+    def has_output_changed(self):
+        """
+        returns ``True`` if the rendered configuration differs from the
+        one of the version stored in the database (queries the database);
+        versions which cannot be rendered are considered changed
+        """
+        try:
+            current = self.__class__.objects.get(pk=self.pk)
+            return current.get_rendered_checksum() != self.get_rendered_checksum()
+        except (ImportError, SchemaError, self.DoesNotExist):
+            return True
+
     def json(self, dict=False, **kwargs):
         """
         returns JSON representation of object
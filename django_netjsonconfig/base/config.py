@@ -1,17 +1,189 @@
+from collections import defaultdict
+
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Max, Q
 from django.utils.translation import ugettext_lazy as _
-from jsonfield import JSONField
 from model_utils import Choices
 from model_utils.fields import StatusField
 from sortedm2m.fields import SortedManyToManyField
 
 from .. import settings as app_settings
-from ..signals import config_modified
-from .base import BaseConfig
+from ..fields import LazyJSONField
+from ..signals import config_modified, configs_modified
+from ..tasks import iter_pk_chunks, run_task
+from ..template_lookups import get_template_ids, invalidate
+from .base import BaseConfig, BaseQuerySet, VariablesMixin
+
+
+class ConfigQuerySet(BaseQuerySet):
+    """
+    Operations on many configurations at once, which are performed
+    in chunks of ``tasks.CHUNK_SIZE`` configurations with few queries
+    per chunk and send the ``configs_modified`` signal once per chunk
+    (``config_modified`` is sent for each configuration by a
+    background task, see ``NETJSONCONFIG_TASK_RUNNER``)
+
+    The template operations bypass the ``m2m_changed`` signals,
+    the resulting templates are validated once for each
+    distinct combination of backend and templates
+    """
+    def set_status_modified(self, template=None):
+        """
+        flags configurations as modified,
+        returns the number of configurations
+        """
+        count = 0
+        for pks in iter_pk_chunks(self):
+            configs = self.model.objects.filter(pk__in=pks)
+            configs.update(status='modified')
+            configs_modified.send(sender=self.model,
+                                  queryset=configs,
+                                  template=template)
+            run_task('django_netjsonconfig.tasks.send_config_modified',
+                     self.model._meta.label, [str(pk) for pk in pks])
+            count += len(pks)
+        return count
+
+    def using_variables(self, names):
+        """
+        returns the configurations whose own configuration
+        or templates use any of the variables in ``names``
+        """
+        template_model = self.model.get_template_model()
+        templates = template_model.objects.filter(template_model.get_variables_lookup(names))
+        through = self.model.templates.through.objects.filter(template__in=templates.values('pk'))
+        return self.filter(self.model.get_variables_lookup(names) |
+                           Q(pk__in=through.values('config_id')))
+
+    def _get_template_ids(self):
+        """
+        returns a dict with the ordered
+        template ids of each configuration
+        """
+        through = self.model.templates.through
+        rows = through.objects.filter(config__in=self.values('pk')) \
+                              .order_by('sort_value') \
+                              .values_list('config_id', 'template_id')
+        template_ids = defaultdict(list)
+        for config_id, template_id in rows:
+            template_ids[config_id].append(template_id)
+        return template_ids
+
+    def validate_templates(self, change):
+        """
+        validates the templates resulting from ``change``, a function which
+        receives the template ids of a configuration and returns the new ones
+        """
+        template_ids = self._get_template_ids()
+        combinations = set()
+        for pk, backend in self.values_list('pk', 'backend'):
+            combinations.add((backend, tuple(change(template_ids[pk]))))
+        all_ids = set(pk for _, ids in combinations for pk in ids)
+        templates = self.model.get_template_model().objects.in_bulk(list(all_ids))
+        for backend, ids in combinations:
+            if not ids:
+                continue
+            self.model.clean_templates(action='pre_add',
+                                       instance=self.model(backend=backend),
+                                       pk_set=[templates[pk] for pk in ids])
+
+    @transaction.atomic
+    def add_template(self, template):
+        """
+        appends ``template`` to the configurations not using it yet
+        """
+        configs = self.exclude(templates=template)
+        configs.validate_templates(lambda ids: ids + [template.pk])
+        through = self.model.templates.through
+        count = 0
+        for pks in iter_pk_chunks(configs):
+            sort_values = dict(through.objects.filter(config__in=pks)
+                                              .values('config_id')
+                                              .annotate(max=Max('sort_value'))
+                                              .values_list('config_id', 'max'))
+            through.objects.bulk_create([through(config_id=pk,
+                                                 template=template,
+                                                 sort_value=sort_values.get(pk, 0) + 1)
+                                         for pk in pks])
+            chunk = self.model.objects.filter(pk__in=pks)
+            if template.type == 'vpn':
+                vpn_client_model = self.model.vpn.through
+                vpn_client_model.bulk_create_clients(template.vpn,
+                                                     chunk.select_related('device'),
+                                                     template.auto_cert)
+            count += chunk.set_status_modified(template=template)
+        # bulk operations do not send the signals
+        # which invalidate the cached template lookups
+        invalidate()
+        return count
+
+    @transaction.atomic
+    def remove_template(self, template):
+        """
+        removes ``template`` from the configurations using it
+        """
+        through = self.model.templates.through
+        count = 0
+        for pks in iter_pk_chunks(self.filter(templates=template)):
+            through.objects.filter(config__in=pks, template=template).delete()
+            chunk = self.model.objects.filter(pk__in=pks)
+            if template.type == 'vpn':
+                chunk._remove_vpn_clients(template.vpn)
+            count += chunk.set_status_modified(template=template)
+        # bulk operations do not send the signals
+        # which invalidate the cached template lookups
+        invalidate()
+        return count
+
+    @transaction.atomic
+    def replace_template(self, template, new_template):
+        """
+        replaces ``template`` with ``new_template`` keeping its position,
+        configurations already using ``new_template`` lose ``template``
+        """
+        through = self.model.templates.through
+        configs = self.filter(templates=template)
+        configs.validate_templates(lambda ids: [
+            new_template.pk if pk == template.pk else pk
+            for pk in ids if pk != new_template.pk
+        ])
+        count = 0
+        for pks in iter_pk_chunks(configs):
+            using_new = through.objects.filter(config__in=pks, template=new_template) \
+                                       .values_list('config_id', flat=True)
+            through.objects.filter(config__in=pks, template=template) \
+                           .exclude(config__in=list(using_new)) \
+                           .update(template=new_template)
+            through.objects.filter(config__in=pks, template=template).delete()
+            chunk = self.model.objects.filter(pk__in=pks)
+            if template.type == 'vpn' and template.vpn != new_template.vpn:
+                chunk._remove_vpn_clients(template.vpn)
+            if new_template.type == 'vpn':
+                vpn_client_model = self.model.vpn.through
+                vpn_client_model.bulk_create_clients(new_template.vpn,
+                                                     chunk.select_related('device'),
+                                                     new_template.auto_cert)
+            count += chunk.set_status_modified(template=new_template)
+        # bulk operations do not send the signals
+        # which invalidate the cached template lookups
+        invalidate()
+        return count
+
+    def _remove_vpn_clients(self, vpn):
+        """
+        deletes the clients of ``vpn`` which are not
+        needed anymore by any template of the configs
+        """
+        vpn_client_model = self.model.vpn.through
+        clients = vpn_client_model.objects.filter(vpn=vpn, config__in=self.values('pk')) \
+                                          .exclude(config__templates__vpn=vpn)
+        # deleted one by one to remove their certificates
+        for client in clients.select_related('cert'):
+            client.delete()
 
 
-class AbstractConfig(BaseConfig):
+class AbstractConfig(VariablesMixin, BaseConfig):
     """
     Abstract model implementing the
     NetJSON DeviceConfiguration object
@@ -23,12 +195,16 @@ class AbstractConfig(BaseConfig):
         '"applied" means the configuration is applied successfully; \n'
         '"error" means the configuration caused issues and it was rolled back;'
     ))
-    context = JSONField(null=True,
-                        blank=True,
-                        help_text=_('Additional '
-                                    '<a href="http://netjsonconfig.openwisp.org/'
-                                    'en/stable/general/basics.html#context" target="_blank">'
-                                    'context (configuration variables)</a> in JSON format'))
+    context = LazyJSONField(null=True,
+                            blank=True,
+                            help_text=_('Additional '
+                                        '<a href="http://netjsonconfig.openwisp.org/'
+                                        'en/stable/general/basics.html#context" target="_blank">'
+                                        'context (configuration variables)</a> in JSON format'))
+
+    _tracked_fields = ['backend', 'config', 'context']
+
+    objects = ConfigQuerySet.as_manager()
 
     class Meta:
         abstract = True
@@ -43,16 +219,14 @@ class AbstractConfig(BaseConfig):
     def clean(self):
         """
         modifies status if key attributes of the configuration
-        have changed (queries the database)
+        have changed since the object was loaded from the database
+        and the rendered configuration has changed as a result
         """
         super(AbstractConfig, self).clean()
         if self._state.adding:
             return
-        current = self.__class__.objects.get(pk=self.pk)
-        for attr in ['backend', 'config', 'context']:
-            if getattr(self, attr) != getattr(current, attr):
-                self.set_status_modified(save=False)
-                break
+        if self.has_changed(*self._tracked_fields) and self.has_output_changed():
+            self.set_status_modified(save=False)
 
     def save(self, *args, **kwargs):
         result = super(AbstractConfig, self).save(*args, **kwargs)
@@ -170,7 +344,7 @@ class TemplatesVpnMixin(models.Model):
         created = self._state.adding
         super(TemplatesVpnMixin, self).save(*args, **kwargs)
         if created:
-            default_templates = self.get_default_templates()
+            default_templates = get_template_ids(self.get_default_templates())
             if default_templates:
                 self.templates.add(*default_templates)
 
@@ -182,8 +356,9 @@ class TemplatesVpnMixin(models.Model):
         """
         retrieves default templates of a Config object
         may be redefined with a custom logic if needed
+        (the result is cached, see ``template_lookups``)
         """
-        qs = self.templates.model.objects.filter(default=True)
+        qs = self.templates.model.objects.filter(default=True).defer_json()
         if self.backend:
             qs = qs.filter(backend=self.backend)
         return qs
@@ -226,13 +401,18 @@ class TemplatesVpnMixin(models.Model):
             raise ValidationError(message)
 
     @classmethod
-    def templates_changed(cls, action, instance, **kwargs):
+    def templates_changed(cls, action, instance, pk_set=None, **kwargs):
         """
         this method is called from a django signal (m2m_changed)
         see django_netjsonconfig.apps.DjangoNetjsonconfigApp.connect_signals
         """
         if action not in ['post_add', 'post_remove', 'post_clear']:
             return
+        # configs added to or removed from a template
+        if kwargs.get('reverse'):
+            if pk_set:
+                cls.objects.filter(pk__in=list(pk_set)).set_status_modified(template=instance)
+            return
         if instance.status != 'modified':
             instance.set_status_modified()
         else:
@@ -249,6 +429,9 @@ class TemplatesVpnMixin(models.Model):
         """
         if action not in ['post_add', 'post_remove', 'post_clear']:
             return
+        # configs added to or removed from a template
+        if kwargs.get('reverse'):
+            return cls._manage_template_vpn_clients(action, instance, pk_set)
         vpn_client_model = cls.vpn.through
         # coming from signal
         if isinstance(pk_set, set):
@@ -262,17 +445,62 @@ class TemplatesVpnMixin(models.Model):
             for client in instance.vpnclient_set.all():
                 client.delete()
             return
-        # when adding or removing specific templates
-        for template in templates.filter(type='vpn'):
-            if action == 'post_add':
-                client = vpn_client_model(config=instance,
-                                          vpn=template.vpn,
-                                          auto_cert=template.auto_cert)
-                client.full_clean()
-                client.save()
-            elif action == 'post_remove':
-                for client in instance.vpnclient_set.filter(vpn=template.vpn):
-                    client.delete()
+        templates = templates.filter(type='vpn').select_related('vpn')
+        if action == 'post_add':
+            vpn_client_model.bulk_create_config_clients(instance, templates)
+            return
+        # when removing specific templates
+        for template in templates:
+            for client in instance.vpnclient_set.filter(vpn=template.vpn):
+                client.delete()
+
+    @classmethod
+    def _manage_template_vpn_clients(cls, action, template, pk_set):
+        """
+        called by ``manage_vpn_clients`` when configs are added to (or
+        removed from) a VPN template, possibly many at once, in which
+        case the VPN clients are created with ``bulk_create_clients``
+        """
+        if template.type != 'vpn':
+            return
+        vpn_client_model = cls.vpn.through
+        if action == 'post_add':
+            configs = cls.objects.filter(pk__in=list(pk_set)).select_related('device')
+            vpn_client_model.bulk_create_clients(template.vpn, configs, template.auto_cert)
+            return
+        # keeps the clients which still use the VPN through other templates
+        clients = vpn_client_model.objects.filter(vpn=template.vpn) \
+                                          .exclude(config__templates__vpn=template.vpn)
+        if action == 'post_remove':
+            clients = clients.filter(config__in=list(pk_set))
+        for client in clients:
+            client.delete()
+
+    def issue_pending_vpn_certs(self):
+        """
+        issues the VPN client certificates whose creation
+        has been deferred by ``NETJSONCONFIG_LAZY_AUTO_CERT``,
+        returns ``True`` if any certificate has been issued
+        """
+        pending = self.vpnclient_set.filter(auto_cert=True, cert__isnull=True) \
+                                    .select_related('vpn__ca', 'config__device')
+        issued = False
+        for vpnclient in pending:
+            vpnclient.issue_cert()
+            issued = True
+        return issued
+
+    def generate(self):
+        """
+        issues pending VPN client certificates before
+        rendering (when ``NETJSONCONFIG_LAZY_AUTO_CERT`` is enabled)
+        """
+        if app_settings.LAZY_AUTO_CERT and not self._state.adding and \
+           self.issue_pending_vpn_certs():
+            # the cached backend instance does not
+            # include the certificates issued above
+            self.__dict__.pop('backend_instance', None)
+        return super(TemplatesVpnMixin, self).generate()
 
     def get_context(self):
         """
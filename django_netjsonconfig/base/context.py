@@ -0,0 +1,46 @@
+from django.db import models, transaction
+from django.utils.translation import ugettext_lazy as _
+
+from .. import settings as app_settings
+from ..variables import get_changed_variables, get_checksums
+
+
+class AbstractContextVariable(models.Model):
+    """
+    Checksum of the value of a variable of ``NETJSONCONFIG_CONTEXT``
+    when it was last checked, used to detect which variables of the
+    global context changed between restarts (see ``check_context``)
+    """
+    name = models.CharField(max_length=128, unique=True)
+    checksum = models.CharField(max_length=32)
+
+    class Meta:
+        abstract = True
+        verbose_name = _('context variable')
+        verbose_name_plural = _('context variables')
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    @transaction.atomic
+    def check_context(cls, config_model, context=None):
+        """
+        compares the checksums of the variables of the global context
+        with the stored ones and flags as modified only the configurations
+        whose templates (or own configuration) use the variables which
+        changed; returns the names of the variables which changed
+        """
+        if context is None:
+            context = app_settings.CONTEXT
+        stored = dict(cls.objects.select_for_update().values_list('name', 'checksum'))
+        checksums = get_checksums(context)
+        changed = get_changed_variables(stored, checksums)
+        if not changed:
+            return changed
+        cls.objects.filter(name__in=[name for name in changed if name not in checksums]).delete()
+        for name in changed:
+            if name in checksums:
+                cls.objects.update_or_create(name=name, defaults={'checksum': checksums[name]})
+        config_model.objects.using_variables(changed).set_status_modified()
+        return changed
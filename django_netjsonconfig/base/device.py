@@ -51,19 +51,21 @@ class AbstractDevice(BaseModel):
                                                              'if available'))
     hardware_id = models.CharField(**(app_settings.HARDWARE_ID_OPTIONS))
 
+    _tracked_fields = ['name']
+
     class Meta:
         abstract = True
+        # used by the keyset pagination of the admin device list
+        indexes = [models.Index(fields=['created', 'id'])]
 
-    def clean(self):
+    def save(self, *args, **kwargs):
         """
-        modifies related config status if name
-        attribute is changed (queries the database)
+        modifies related config status if name attribute
+        has changed since the object was loaded from the database
         """
-        super(AbstractDevice, self).clean()
-        if self._state.adding:
-            return
-        current = self.__class__.objects.get(pk=self.pk)
-        if self.name != current.name and self._has_config():
+        name_changed = not self._state.adding and self.has_changed('name')
+        super(AbstractDevice, self).save(*args, **kwargs)
+        if name_changed and self._has_config():
             self.config.set_status_modified()
 
     def _has_config(self):
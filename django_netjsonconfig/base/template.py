@@ -1,17 +1,20 @@
 from collections import OrderedDict
-import json, urllib.request
-from jsonfield import JSONField
 
-from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from taggit.managers import TaggableManager
 
+from ..fields import LazyJSONField
+from ..importer import ImportFailed, apply_template_data, fetch_template
 from ..settings import DEFAULT_AUTO_CERT
-from .base import BaseConfig
+from ..signals import configs_modified
+from ..tasks import run_task
+from ..template_lookups import invalidate
 from ..utils import get_random_key
 from ..validators import key_validator
+from ..variables import get_changed_variables
+from .base import BaseConfig, BaseQuerySet, VariablesMixin
 
 TYPE_CHOICES = (
     ('generic', _('Generic')),
@@ -22,7 +25,7 @@ FLAG_CHOICES = (
     ('private', _('Private')),
     ('public', _('Public')),
     ('shared_secret', _('Shared Secret')),
-     ('import', _('Import'))
+    ('import', _('Import'))
 )
 
 
@@ -34,7 +37,18 @@ def default_auto_cert():
     return DEFAULT_AUTO_CERT
 
 
-class AbstractTemplate(BaseConfig):
+class TemplateQuerySet(BaseQuerySet):
+    def update(self, **kwargs):
+        """
+        invalidates the cached template lookups, bulk updates
+        do not send the signals connected by ``template_lookups``
+        """
+        rows = super(TemplateQuerySet, self).update(**kwargs)
+        invalidate()
+        return rows
+
+
+class AbstractTemplate(VariablesMixin, BaseConfig):
     """
     Abstract model implementing a
     netjsonconfig template
@@ -88,14 +102,24 @@ class AbstractTemplate(BaseConfig):
                              blank=True,
                              null=True,
                              help_text=_('Enter internal notes for the administrators'))
-    variable = JSONField(_('Variable'),
-                         default=dict,
-                         blank=True,
-                         help_text=_('Enter Values for the variables used by this template'),
-                         load_kwargs={'object_pairs_hook': OrderedDict},
-                         dump_kwargs={'indent': 4})
+    variable = LazyJSONField(_('Variable'),
+                             default=dict,
+                             blank=True,
+                             help_text=_('Enter Values for the variables used by this template'),
+                             load_kwargs={'object_pairs_hook': OrderedDict})
+    url = models.URLField(_('URL'),
+                          max_length=255,
+                          blank=True,
+                          null=True,
+                          db_index=True,
+                          help_text=_('URL of the shared template to import'))
+    # hash of the imported contents, used to detect changes
+    import_hash = models.CharField(max_length=40, blank=True, editable=False)
 
     __template__ = True
+    _tracked_fields = ['backend', 'config', 'flag', 'url', 'variable']
+
+    objects = TemplateQuerySet.as_manager()
 
     class Meta:
         abstract = True
@@ -104,26 +128,49 @@ class AbstractTemplate(BaseConfig):
 
     def save(self, *args, **kwargs):
         """
-        modifies status of related configs
-        if key attributes have changed (queries the database)
+        modifies status of related configs if key attributes
+        have changed since the object was loaded from the database
+        and the rendered configuration has changed as a result;
+        if only the default values of variables have changed, only
+        the configs which use the changed variables are modified
         """
-        update_related_config_status = False
-        if not self._state.adding:
-            current = self.__class__.objects.get(pk=self.pk)
-            for attr in ['backend', 'config']:
-                if getattr(self, attr) != getattr(current, attr):
-                    update_related_config_status = True
-                    break
+        update_related_config_status = (not self._state.adding and
+                                        self.has_changed('backend', 'config') and
+                                        self.has_output_changed())
+        changed_variables = None
+        if not self._state.adding and not update_related_config_status and \
+           self.has_changed('variable'):
+            changed_variables = self._get_changed_variables()
         # save current changes
         super(AbstractTemplate, self).save(*args, **kwargs)
         # update relations
         if update_related_config_status:
             self._update_related_config_status()
+        elif changed_variables:
+            self.config_relations.using_variables(changed_variables) \
+                                 .set_status_modified(template=self)
+
+    def _get_changed_variables(self):
+        """
+        returns the names of the variables whose
+        default value differs from the stored one
+        """
+        old = type(self).objects.only('variable').get(pk=self.pk).variable
+        return get_changed_variables(old or {}, self.variable or {})
 
     def _update_related_config_status(self):
-        self.config_relations.update(status='modified')
-        for config in self.config_relations.all():
-            config._send_config_modified_signal()
+        """
+        flags related configs as modified with a single query and
+        sends ``configs_modified`` once, while the ``config_modified``
+        signal of each config is sent by a background task after commit
+        """
+        queryset = self.config_relations.all()
+        queryset.update(status='modified')
+        configs_modified.send(sender=queryset.model,
+                              queryset=queryset,
+                              template=self)
+        run_task('django_netjsonconfig.tasks.send_template_config_modified',
+                 self._meta.label, str(self.pk))
 
     def clean(self, *args, **kwargs):
         """
@@ -151,26 +198,23 @@ class AbstractTemplate(BaseConfig):
             if self.variable == {}:
                 raise ValidationError({'variable': _('Please enter default values for variables ')})
         if self.flag == 'import':
-            if self.url is None:
+            if not self.url:
                 raise ValidationError({'url': _('Please enter the Url to import template from')})
-            else:
-                try:
-                    with urllib.request.urlopen(self.url) as response:
-                        try:
-                            data = json.loads(response.read().decode())
-                            self.id = data['id']
-                            self.type = data['type']
-                            self.config = json.dumps(eval(data['config']))
-                            self.url = data['url']
-                            self.variable = json.dumps(eval(data['variable']))
-                            self.vpn = data['vpn']
-                            self.auto_cert = data['auto_cert']
-                            self.backend = data['backend']
-                            #self.key = data['key']
-                        except ValueError:
-                            raise ValidationError({'url', _('Url is not valid')})
-                except urllib.request.HTTPError:
-                    raise ValidationError({'url': _('Url is not valid. Please check it')})
+            # the template is downloaded only when the URL is entered,
+            # it's kept up to date by the ``sync_templates`` command
+            if getattr(self, '_imported_url', None) != self.url and \
+               (self._state.adding or self.has_changed('flag', 'url')):
+                self.import_template()
+
+    def import_template(self):
+        """
+        downloads the shared template at ``url``
+        and copies its configuration and variables
+        """
+        try:
+            apply_template_data(self, fetch_template(self.url))
+        except ImportFailed as e:
+            raise ValidationError({'url': str(e)})
 
 
 AbstractTemplate._meta.get_field('config').blank = True
@@ -0,0 +1,44 @@
+from django.db import models
+
+
+class AbstractUsedVariable(models.Model):
+    """
+    Name of a variable used by the configuration of an object,
+    indexed to find the objects affected by a change to the
+    value of a variable (see ``VariablesMixin``)
+    """
+    name = models.CharField(max_length=128)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.name
+
+
+class AbstractConfigVariable(AbstractUsedVariable):
+    """
+    Variable used by the configuration of a ``Config``
+    """
+    config = models.ForeignKey('django_netjsonconfig.Config',
+                               related_name='used_variables',
+                               on_delete=models.CASCADE)
+
+    class Meta(AbstractUsedVariable.Meta):
+        abstract = True
+        # the index starts with the name of the variable
+        unique_together = ('name', 'config')
+
+
+class AbstractTemplateVariable(AbstractUsedVariable):
+    """
+    Variable used by the configuration of a ``Template``
+    """
+    template = models.ForeignKey('django_netjsonconfig.Template',
+                                 related_name='used_variables',
+                                 on_delete=models.CASCADE)
+
+    class Meta(AbstractUsedVariable.Meta):
+        abstract = True
+        # the index starts with the name of the variable
+        unique_together = ('name', 'template')
@@ -1,13 +1,172 @@
+import logging
+import os
 import subprocess
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
+from django.apps import apps
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.utils.encoding import force_bytes, force_text
 from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
+from django_x509 import settings as x509_settings
+from django_x509.base.models import generalized_time
+from OpenSSL import crypto
+
+from openwisp_utils.base import TimeStampedEditableModel
 
 from .. import settings as app_settings
+from ..tasks import run_task
 from .base import BaseConfig
 
+logger = logging.getLogger(__name__)
+
+DH_LENGTH_CHOICES = (
+    (1024, '1024'),
+    (2048, '2048'),
+    (3072, '3072'),
+    (4096, '4096'),
+)
+
+BULK_BATCH_SIZE = 500
+
+EC_CURVES = {
+    'ec-p256': ec.SECP256R1,
+    'ec-p384': ec.SECP384R1,
+}
+KEY_TYPES = (
+    ('rsa', _('RSA (same length as the CA)')),
+    ('ec-p256', _('ECDSA P-256')),
+    ('ec-p384', _('ECDSA P-384')),
+    ('ed25519', _('Ed25519')),
+)
+SUBJECT_ATTRIBUTES = (
+    ('country_code', 'countryName'),
+    ('state', 'stateOrProvinceName'),
+    ('city', 'localityName'),
+    ('organization_name', 'organizationName'),
+    ('organizational_unit_name', 'organizationalUnitName'),
+    ('email', 'emailAddress'),
+    ('common_name', 'commonName'),
+)
+
+
+def is_key_type_supported(key_type):
+    """
+    returns ``True`` if keys of type ``key_type`` can
+    be generated by the installed cryptography libraries
+    """
+    backend = default_backend()
+    if key_type == 'rsa':
+        return True
+    if key_type == 'ed25519':
+        # requires cryptography >= 2.6 built with OpenSSL >= 1.1.1
+        return getattr(backend, 'ed25519_supported', lambda: False)()
+    return backend.elliptic_curve_supported(EC_CURVES[key_type]())
+
+
+# only the key types supported by the installed libraries are offered
+KEY_TYPE_CHOICES = tuple(choice for choice in KEY_TYPES if is_key_type_supported(choice[0]))
+
+
+def default_dh_length():
+    """
+    returns the default value for dh_length field
+    (this avoids to set the exact default value in the database migration)
+    """
+    return app_settings.DEFAULT_DH_LENGTH
+
+
+def generate_private_key(key_type):
+    """
+    returns a new ``OpenSSL.crypto.PKey`` of the specified
+    non RSA ``key_type`` (see ``KEY_TYPE_CHOICES``)
+    """
+    if key_type not in dict(KEY_TYPE_CHOICES):
+        raise ValueError('Key type "{0}" is not supported by the '
+                         'installed cryptography libraries'.format(key_type))
+    if key_type == 'ed25519':
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+        key = Ed25519PrivateKey.generate()
+    else:
+        key = ec.generate_private_key(EC_CURVES[key_type](), default_backend())
+    # passing through PEM works also with pyOpenSSL
+    # versions which do not support EC keys natively
+    pem = key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption())
+    return crypto.load_privatekey(crypto.FILETYPE_PEM, pem)
+
+
+def generate_cert(cert, key_type):
+    """
+    generates the private key and the x509 certificate of
+    a new ``Cert`` instance using a key of type ``key_type``,
+    signed by its CA with the same subject and extensions
+    which django-x509 uses for end-entity certificates
+    (it does not generate them again on save)
+    """
+    key = generate_private_key(key_type)
+    if not cert.serial_number:
+        cert.serial_number = uuid.uuid4().int
+    x509 = crypto.X509()
+    x509.set_version(0x2)  # version 3 (0 indexed counting)
+    subject = x509.get_subject()
+    for attr, name in SUBJECT_ATTRIBUTES:
+        value = getattr(cert, attr, None)
+        if value:
+            setattr(subject, name, str(value))
+    x509.set_subject(subject)
+    x509.set_serial_number(int(cert.serial_number))
+    x509.set_notBefore(force_bytes(cert.validity_start.strftime(generalized_time)))
+    x509.set_notAfter(force_bytes(cert.validity_end.strftime(generalized_time)))
+    x509.set_issuer(cert.ca.x509.get_subject())
+    x509.set_pubkey(key)
+    x509.add_extensions([
+        crypto.X509Extension(b'basicConstraints', False, b'CA:FALSE'),
+        crypto.X509Extension(b'keyUsage',
+                             x509_settings.CERT_KEYUSAGE_CRITICAL,
+                             force_bytes(x509_settings.CERT_KEYUSAGE_VALUE)),
+        crypto.X509Extension(b'subjectKeyIdentifier', False, b'hash', subject=x509),
+    ])
+    # authorityKeyIdentifier must be added after the other extensions
+    x509.add_extensions([
+        crypto.X509Extension(b'authorityKeyIdentifier',
+                             False,
+                             b'keyid:always,issuer:always',
+                             issuer=cert.ca.x509)
+    ])
+    x509.add_extensions([crypto.X509Extension(force_bytes(ext['name']),
+                                              bool(ext['critical']),
+                                              force_bytes(ext['value']))
+                         for ext in cert.extensions or []])
+    x509.sign(cert.ca.pkey, str(cert.digest))
+    # the choices of key_length may not include the size of the curve,
+    # in that case the current (valid) value is kept
+    key_length = str(key.bits())
+    if key_length in dict(cert._meta.get_field('key_length').choices):
+        cert.key_length = key_length
+    cert.certificate = force_text(crypto.dump_certificate(crypto.FILETYPE_PEM, x509))
+    cert.private_key = force_text(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+    return cert
+
+
+def sign_cert(cert, key_type):
+    """
+    generates key and certificate of a new ``Cert`` instance
+    (executed in worker threads by ``bulk_create_clients``),
+    returns certificate, private key and key length
+    """
+    if key_type == 'rsa':
+        cert._generate()
+    else:
+        generate_cert(cert, key_type)
+    return cert.certificate, cert.private_key, cert.key_length
+
 
 class AbstractVpn(BaseConfig):
     """
@@ -29,8 +188,21 @@ class AbstractVpn(BaseConfig):
     # diffie hellman parameters are required
     # in some VPN solutions (eg: OpenVPN)
     dh = models.TextField(blank=True)
+    dh_length = models.PositiveSmallIntegerField(_('DH parameters length'),
+                                                 choices=DH_LENGTH_CHOICES,
+                                                 default=default_dh_length,
+                                                 help_text=_('length in bits of the Diffie-Hellman '
+                                                             'parameters, which are taken from the '
+                                                             'precomputed pool when available'))
+    key_type = models.CharField(_('key type'),
+                                max_length=16,
+                                choices=KEY_TYPE_CHOICES,
+                                default='rsa',
+                                help_text=_('type of the keys of the automatically generated '
+                                            'server and client certificates'))
 
     __vpn__ = True
+    _tracked_fields = ['dh', 'dh_length']
 
     class Meta:
         verbose_name = _('VPN server')
@@ -49,21 +221,41 @@ class AbstractVpn(BaseConfig):
 
     def save(self, *args, **kwargs):
         """
-        Calls _auto_create_cert() if cert is not set
+        * calls _auto_create_cert() if cert is not set
+        * takes DH parameters from the pool if not set
         """
         if not self.cert:
             self.cert = self._auto_create_cert()
-        if not self.dh:
-            self.dh = self.dhparam(1024)
+        # existing DH parameters are replaced only when the length is changed
+        # (without entering new parameters), those entered by hand are kept
+        if not self.dh or (not self._state.adding and
+                           self.has_changed('dh_length') and not self.has_changed('dh')):
+            dh = self.dhparam(self.dh_length)
+            if dh is None:
+                self.dh = self.dh or ''
+                run_task('django_netjsonconfig.tasks.generate_vpn_dh',
+                         self._meta.label, str(self.pk), self.dh_length, self.dh)
+            else:
+                self.dh = dh
         super(AbstractVpn, self).save(*args, **kwargs)
 
+    @classmethod
+    def get_dh_model(cls):
+        return apps.get_model(cls._meta.app_label, 'DhParameters')
+
     @classmethod
     def dhparam(cls, length):
         """
-        Returns an automatically generated set of DH parameters in PEM
+        Returns a set of DH parameters in PEM taken from the precomputed
+        pool; if the pool is empty returns ``None`` and schedules the
+        generation of the parameters of this VPN server and the refill
+        of the pool (see ``tasks.generate_vpn_dh``)
         """
-        return subprocess.check_output('openssl dhparam {0} 2> /dev/null'.format(length),
-                                       shell=True)
+        dh = cls.get_dh_model().pop(length)
+        if dh is None:
+            logger.warning('DH parameters pool for length {0} is empty, generating '
+                           'them in the background (see refill_dh_pool)'.format(length))
+        return dh
 
     def _auto_create_cert(self):
         """
@@ -90,6 +282,8 @@ class AbstractVpn(BaseConfig):
                           common_name=common_name,
                           extensions=server_extensions)
         cert = self._auto_create_cert_extra(cert)
+        if self.key_type != 'rsa':
+            generate_cert(cert, self.key_type)
         cert.save()
         return cert
 
@@ -190,13 +384,39 @@ class AbstractVpnClient(models.Model):
     def save(self, *args, **kwargs):
         """
         automatically creates an x509 certificate when ``auto_cert`` is True
+        (unless ``NETJSONCONFIG_LAZY_AUTO_CERT`` defers it to the first render)
         """
-        if self.auto_cert:
+        if self.auto_cert and not self.cert and not app_settings.LAZY_AUTO_CERT:
             cn = self._get_common_name()
             self._auto_create_cert(name=self.config.device.name,
                                    common_name=cn)
         super(AbstractVpnClient, self).save(*args, **kwargs)
 
+    @property
+    def cert_pending(self):
+        """
+        whether the x509 certificate of this client
+        has been deferred and has not been issued yet
+        """
+        return self.auto_cert and not self.cert_id
+
+    def issue_cert(self):
+        """
+        issues the x509 certificate of a client whose
+        creation has been deferred by ``NETJSONCONFIG_LAZY_AUTO_CERT``;
+        if another process issues it first, its certificate is kept
+        """
+        if not self.cert_pending:
+            return self.cert
+        cert = self._auto_create_cert(name=self.config.device.name,
+                                      common_name=self._get_common_name())
+        updated = self.__class__.objects.filter(pk=self.pk, cert__isnull=True) \
+                                        .update(cert=cert)
+        if not updated:
+            cert.delete()
+            self.cert = self.__class__.objects.get(pk=self.pk).cert
+        return self.cert
+
     def _get_common_name(self):
         """
         returns the common name for a new certificate
@@ -214,12 +434,99 @@ class AbstractVpnClient(models.Model):
         automatically deletes certificates when ``auto_cert`` is ``True``
         """
         instance = kwargs['instance']
-        if instance.auto_cert:
+        if instance.auto_cert and instance.cert:
             instance.cert.delete()
 
-    def _auto_create_cert(self, name, common_name):
+    @classmethod
+    def bulk_create_clients(cls, vpn, configs, auto_cert):
         """
-        Automatically creates and assigns a client x509 certificate
+        creates the clients of ``vpn`` for many ``configs`` at once
+        (configs which are already clients of ``vpn`` are skipped)
+        """
+        existing = cls.objects.filter(vpn=vpn).values_list('config_id', flat=True)
+        existing = set(existing)
+        clients = [cls(config=config, vpn=vpn, auto_cert=auto_cert)
+                   for config in configs if config.pk not in existing]
+        return cls._bulk_save_clients(clients)
+
+    @classmethod
+    def bulk_create_config_clients(cls, config, templates):
+        """
+        creates the clients of ``config`` for the VPNs of many VPN
+        ``templates`` at once (VPNs of which ``config`` is already
+        a client are skipped)
+        """
+        existing = set(config.vpnclient_set.values_list('vpn_id', flat=True))
+        clients = []
+        for template in templates:
+            if template.vpn_id in existing:
+                continue
+            existing.add(template.vpn_id)
+            clients.append(cls(config=config, vpn=template.vpn, auto_cert=template.auto_cert))
+        return cls._bulk_save_clients(clients)
+
+    @classmethod
+    def _bulk_save_clients(cls, clients):
+        """
+        saves new ``clients`` with bulk inserts; when more than
+        ``NETJSONCONFIG_BULK_CERT_THRESHOLD`` certificates must be issued,
+        they are signed in parallel by a thread pool, while fewer
+        certificates are issued by saving the clients one by one
+        """
+        issue_certs = [client for client in clients
+                       if client.auto_cert and not app_settings.LAZY_AUTO_CERT]
+        if issue_certs and len(issue_certs) <= app_settings.BULK_CERT_THRESHOLD:
+            for client in clients:
+                client.full_clean()
+                client.save()
+            return clients
+        with transaction.atomic():
+            vpn_clients = OrderedDict()
+            for client in issue_certs:
+                vpn_clients.setdefault(client.vpn_id, []).append(client)
+            for group in vpn_clients.values():
+                cls._bulk_create_certs(group[0].vpn, group)
+            cls.objects.bulk_create(clients, batch_size=BULK_BATCH_SIZE)
+        return clients
+
+    @classmethod
+    def _bulk_create_certs(cls, vpn, clients):
+        """
+        issues the certificates of ``clients`` in a thread pool
+        (OpenSSL releases the GIL while generating keys and signing)
+        and assigns them with bulk inserts
+        """
+        cert_model = cls.cert.field.related_model
+        ca = vpn.ca
+        certs = []
+        for client in clients:
+            client.vpn = vpn
+            cert = client._get_auto_cert(name=client.config.device.name,
+                                         common_name=client._get_common_name())
+            cert.ca = ca
+            cert.full_clean(validate_unique=False)
+            cert.serial_number = str(uuid.uuid4().int)
+            certs.append(cert)
+        workers = app_settings.BULK_CERT_WORKERS or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(sign_cert, certs, repeat(vpn.key_type))
+            for cert, (certificate, private_key, key_length) in zip(certs, results):
+                cert.certificate = certificate
+                cert.private_key = private_key
+                cert.key_length = key_length
+        cert_model.objects.bulk_create(certs, batch_size=BULK_BATCH_SIZE)
+        # primary keys are not returned by bulk inserts on every database
+        cert_ids = {}
+        for i in range(0, len(certs), BULK_BATCH_SIZE):
+            serials = [cert.serial_number for cert in certs[i:i + BULK_BATCH_SIZE]]
+            queryset = cert_model.objects.filter(ca=ca, serial_number__in=serials)
+            cert_ids.update(queryset.values_list('serial_number', 'pk'))
+        for client, cert in zip(clients, certs):
+            client.cert_id = cert_ids[cert.serial_number]
+
+    def _get_auto_cert(self, name, common_name):
+        """
+        returns a new (unsaved) client x509 certificate
         """
         server_extensions = [
             {
@@ -241,8 +548,16 @@ class AbstractVpnClient(models.Model):
                           email=ca.email,
                           common_name=common_name,
                           extensions=server_extensions)
-        cert = self._auto_create_cert_extra(cert)
+        return self._auto_create_cert_extra(cert)
+
+    def _auto_create_cert(self, name, common_name):
+        """
+        Automatically creates and assigns a client x509 certificate
+        """
+        cert = self._get_auto_cert(name, common_name)
         cert.full_clean()
+        if self.vpn.key_type != 'rsa':
+            generate_cert(cert, self.vpn.key_type)
         cert.save()
         self.cert = cert
         return cert
@@ -254,3 +569,64 @@ class AbstractVpnClient(models.Model):
         certificates for VPN clients
         """
         return cert
+
+
+class AbstractDhParameters(TimeStampedEditableModel):
+    """
+    Pool of precomputed Diffie-Hellman parameters,
+    consumed by ``AbstractVpn.dhparam``
+    """
+    length = models.PositiveSmallIntegerField(choices=DH_LENGTH_CHOICES, db_index=True)
+    contents = models.TextField()
+
+    class Meta:
+        abstract = True
+        verbose_name = _('DH parameters')
+        verbose_name_plural = _('DH parameters')
+
+    def __str__(self):
+        return '{0} bit'.format(self.length)
+
+    @staticmethod
+    def generate(length):
+        """
+        Returns an automatically generated set of DH parameters in PEM
+        """
+        output = subprocess.check_output(['openssl', 'dhparam', str(length)],
+                                         stderr=subprocess.DEVNULL)
+        return force_text(output)
+
+    @classmethod
+    def pop(cls, length):
+        """
+        removes a set of DH parameters of the specified
+        length from the pool and returns its contents,
+        returns ``None`` if the pool is empty
+        """
+        db = router.db_for_write(cls)
+        queryset = cls.objects.using(db).filter(length=length).order_by('created')
+        with transaction.atomic(using=db):
+            # rows locked by concurrent transactions are skipped
+            if connections[db].features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            params = queryset.first()
+            # databases which do not lock rows serialize
+            # writes, the row may have been taken meanwhile
+            if params is None or not cls.objects.using(db).filter(pk=params.pk).delete()[0]:
+                return None
+        return params.contents
+
+    @classmethod
+    def fill(cls, length, size=None, workers=1):
+        """
+        generates DH parameters of the specified length until the
+        pool contains ``size`` items, returns the number of new items
+        """
+        size = app_settings.DH_POOL_SIZE if size is None else size
+        missing = size - cls.objects.filter(length=length).count()
+        if missing <= 0:
+            return 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for contents in executor.map(cls.generate, [length] * missing):
+                cls.objects.create(length=length, contents=contents)
+        return missing
@@ -7,6 +7,7 @@ from django.views.generic.base import View
 from django.views.generic.detail import SingleObjectMixin
 
 from .. import settings
+from ..template_lookups import get_template_ids
 from ..utils import ControllerResponse, forbid_unallowed, get_object_or_404, send_config, update_last_ip
 
 
@@ -130,13 +131,11 @@ class BaseRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
         if not tags:
             return
         # retrieve tags and add them to current config
-        tags = tags.split()
+        tags = sorted(set(tags.split()))
         queryset = self.get_template_queryset(config)
-        templates = queryset.filter(tags__name__in=tags) \
-                            .only('id') \
-                            .distinct()
-        for template in templates:
-            config.templates.add(template)
+        templates = queryset.filter(tags__name__in=tags).distinct()
+        for pk in get_template_ids(templates):
+            config.templates.add(pk)
 
     def invalid(self, request):
         """
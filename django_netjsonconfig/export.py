@@ -0,0 +1,123 @@
+"""
+Streaming export of the configuration archives of many devices
+"""
+import io
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db.models import prefetch_related_objects
+
+from . import settings as app_settings
+
+FORMATS = {
+    'tar': 'application/x-tar',
+    'zip': 'application/zip',
+}
+
+
+def generate_archive(backend):
+    """
+    renders the configuration archive of a netjsonconfig
+    backend instance (executed in worker processes)
+    """
+    return backend.generate().getvalue()
+
+
+def get_backend_instances(configs, issue_certs=False):
+    """
+    returns the backend instances of ``configs``,
+    database queries are performed here so that
+    workers only perform rendering; the VPN client
+    certificates deferred by ``NETJSONCONFIG_LAZY_AUTO_CERT``
+    are issued only if ``issue_certs`` is ``True``
+    """
+    prefetch_related_objects(configs, 'templates')
+    backends = []
+    for config in configs:
+        if issue_certs and hasattr(config, 'issue_pending_vpn_certs'):
+            config.issue_pending_vpn_certs()
+        backends.append(config.get_backend_instance())
+    return backends
+
+
+def iter_config_archives(queryset, workers=None, batch_size=None, issue_certs=False):
+    """
+    yields ``(filename, contents)`` tuples with the configuration
+    archive of each config in ``queryset``; archives are rendered
+    in parallel by ``workers`` processes one batch at time,
+    which keeps memory usage constant regardless of the number
+    of configs; the export does not write to the database
+    unless ``issue_certs`` is ``True`` (see ``get_backend_instances``)
+    """
+    workers = workers or app_settings.EXPORT_WORKERS
+    batch_size = batch_size or app_settings.EXPORT_BATCH_SIZE
+    queryset = queryset.select_related('device').order_by('pk')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        for config in queryset.iterator():
+            batch.append(config)
+            if len(batch) < batch_size:
+                continue
+            for archive in _render_batch(executor, batch, issue_certs):
+                yield archive
+            batch = []
+        for archive in _render_batch(executor, batch, issue_certs):
+            yield archive
+
+
+def _render_batch(executor, configs, issue_certs):
+    if not configs:
+        return []
+    results = executor.map(generate_archive, get_backend_instances(configs, issue_certs))
+    return (('{0}.tar.gz'.format(config.name), contents)
+            for config, contents in zip(configs, results))
+
+
+class StreamBuffer(object):
+    """
+    write-only file-like object whose
+    contents are consumed with ``pop``
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_archive(archives, format='tar'):
+    """
+    yields the chunks of a tar or zip archive containing
+    the ``(filename, contents)`` tuples of ``archives``
+    """
+    buffer = StreamBuffer()
+    if format == 'zip':
+        # configuration archives are already compressed
+        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+            for filename, contents in archives:
+                info = zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+                archive.writestr(info, contents)
+                yield buffer.pop()
+    elif format == 'tar':
+        with tarfile.open(mode='w|', fileobj=buffer) as archive:
+            for filename, contents in archives:
+                info = tarfile.TarInfo(filename)
+                info.size = len(contents)
+                info.mtime = time.time()
+                info.mode = 0o644
+                archive.addfile(info, io.BytesIO(contents))
+                yield buffer.pop()
+    else:
+        raise ValueError('Unsupported archive format: {0}'.format(format))
+    yield buffer.pop()
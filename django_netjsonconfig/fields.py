@@ -0,0 +1,109 @@
+import json
+
+import six
+from django.core.exceptions import ValidationError
+from django.utils.translation import ugettext_lazy as _
+from jsonfield import JSONField
+from jsonfield.encoder import JSONEncoder
+from jsonfield.subclassing import SubfieldBase
+
+from . import settings as app_settings
+
+# column types used when ``NETJSONCONFIG_NATIVE_JSON`` is enabled,
+# sqlite has no JSON type: its JSON1 functions operate on text
+NATIVE_JSON_TYPES = {
+    'postgresql': 'jsonb',
+    'mysql': 'json',
+}
+
+
+class RawJSON(six.text_type):
+    """
+    JSON loaded from the database which has not been decoded yet
+    """
+    pass
+
+
+class LazyJSONDescriptor(object):
+    """
+    decodes the JSON loaded from the database on first access
+    and loads the column from the database if it has been deferred
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        data = instance.__dict__
+        name = self.field.attname
+        if name not in data:
+            instance.refresh_from_db(fields=[name])
+        value = data[name]
+        if isinstance(value, RawJSON):
+            value = data[name] = self.field.loads(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = self.field.pre_init(value, instance)
+
+
+class LazyJSONFieldBase(SubfieldBase):
+    """
+    unlike ``SubfieldBase`` does not replace
+    the descriptor set by ``contribute_to_class``
+    """
+    def __new__(cls, name, bases, attrs):
+        return type.__new__(cls, name, bases, attrs)
+
+
+class LazyJSONField(six.with_metaclass(LazyJSONFieldBase, JSONField)):
+    """
+    ``JSONField`` whose value is decoded when it's accessed for the first
+    time instead of when the object is loaded, which saves decoding JSON
+    that is never used (eg: list pages, lookups) and can be deferred
+
+    JSON is stored in compact form (in the native JSON type of the
+    database if ``NETJSONCONFIG_NATIVE_JSON`` is enabled) and
+    indented only when it's displayed
+    """
+    display_kwargs = {'cls': JSONEncoder, 'indent': 4, 'ensure_ascii': False}
+
+    def db_type(self, connection):
+        if app_settings.NATIVE_JSON and connection.vendor in NATIVE_JSON_TYPES:
+            return NATIVE_JSON_TYPES[connection.vendor]
+        return super(LazyJSONField, self).db_type(connection)
+
+    def dumps_for_display(self, value):
+        return json.dumps(value, **self.display_kwargs)
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(LazyJSONField, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, LazyJSONDescriptor(self))
+
+    def pre_init(self, value, obj):
+        # same condition used by ``JSONField`` to detect values
+        # loaded from the database, whose decoding is postponed
+        if isinstance(value, six.string_types) and obj._state.adding and \
+           getattr(obj, 'pk', None) is not None:
+            return RawJSON(value)
+        return value
+
+    def loads(self, value):
+        try:
+            return json.loads(value, **self.load_kwargs)
+        except ValueError:
+            raise ValidationError(_('Enter valid JSON'))
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, RawJSON):
+            return value
+        return super(LazyJSONField, self).pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        # JSON which has not been decoded
+        # cannot have been modified either
+        if isinstance(value, RawJSON):
+            return six.text_type(value)
+        return super(LazyJSONField, self).get_prep_value(value)
@@ -0,0 +1,298 @@
+"""
+Import of templates shared by other instances
+
+Documents of shared templates (see ``sharing.get_template_data``) are
+downloaded with a pool of persistent HTTP connections and kept in the
+django cache: cached documents are revalidated with conditional requests
+(``If-None-Match`` and ``If-Modified-Since``), hence they're downloaded
+again only when they have been modified.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.translation import ugettext as _
+from six.moves import http_client
+from six.moves.urllib.parse import urljoin, urlsplit
+
+from . import settings as app_settings
+
+# maximum size of downloaded documents
+MAX_DOCUMENT_SIZE = 5 * 1024 * 1024
+# fields of imported templates which are copied from documents
+IMPORTED_FIELDS = ('type', 'backend', 'config', 'variable')
+
+
+class ImportFailed(Exception):
+    """
+    raised when a template cannot be downloaded or is not valid
+    """
+    pass
+
+
+class ConnectionPool(object):
+    """
+    keeps up to ``maxsize`` idle connections to each host,
+    which are reused by the following requests (also by other
+    threads) to avoid a new TCP and TLS handshake each time
+    """
+    def __init__(self, maxsize=10, timeout=10):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _get_connection(self, scheme, netloc):
+        """
+        returns a ``(connection, reused)`` tuple
+        """
+        with self._lock:
+            idle = self._idle[(scheme, netloc)]
+            if idle:
+                return idle.pop(), True
+        if scheme == 'https':
+            return http_client.HTTPSConnection(netloc, timeout=self.timeout), False
+        return http_client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _release(self, scheme, netloc, connection):
+        with self._lock:
+            idle = self._idle[(scheme, netloc)]
+            if len(idle) < self.maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+    def request(self, url, headers=None):
+        """
+        performs a GET request and returns a ``(status, headers, body)``
+        tuple, ``body`` being decompressed if it was gzipped
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ImportFailed(_('Only HTTP and HTTPS URLs are supported'))
+        path = parts.path or '/'
+        if parts.query:
+            path = '{0}?{1}'.format(path, parts.query)
+        request_headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        request_headers.update(headers or {})
+        while True:
+            connection, reused = self._get_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+                body = response.read(MAX_DOCUMENT_SIZE + 1)
+                response_headers = dict((k.lower(), v) for k, v in response.getheaders())
+            except (http_client.HTTPException, OSError) as e:
+                connection.close()
+                # idle connections may have been closed by the server meanwhile
+                if reused:
+                    continue
+                raise ImportFailed(_('Could not download "{0}": {1}').format(url, e))
+            break
+        if response.will_close or len(body) > MAX_DOCUMENT_SIZE:
+            connection.close()
+        else:
+            self._release(parts.scheme, parts.netloc, connection)
+        if response_headers.get('content-encoding') == 'gzip':
+            try:
+                body = gzip.GzipFile(fileobj=six.BytesIO(body)).read(MAX_DOCUMENT_SIZE + 1)
+            except (IOError, EOFError):
+                raise ImportFailed(_('"{0}" returned invalid gzipped content').format(url))
+        if len(body) > MAX_DOCUMENT_SIZE:
+            raise ImportFailed(_('"{0}" is too big').format(url))
+        return response.status, response_headers, body
+
+
+pool = ConnectionPool(maxsize=app_settings.IMPORT_WORKERS,
+                      timeout=app_settings.IMPORT_TIMEOUT)
+
+
+def get_json(url):
+    """
+    returns the decoded JSON document published at ``url``,
+    the cached copy of which is revalidated with a conditional
+    request and returned if it has not been modified
+    """
+    cache_key = 'netjsonconfig-import-{0}'.format(hashlib.md5(url.encode()).hexdigest())
+    cached = cache.get(cache_key)
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    status, response_headers, body = pool.request(url, headers)
+    if status == 304 and cached:
+        return cached['data']
+    if status != 200:
+        raise ImportFailed(_('"{0}" returned HTTP status {1}').format(url, status))
+    try:
+        data = json.loads(body.decode('utf-8'), object_pairs_hook=OrderedDict)
+    except ValueError:
+        raise ImportFailed(_('"{0}" did not return valid JSON').format(url))
+    etag = response_headers.get('etag')
+    last_modified = response_headers.get('last-modified')
+    if etag or last_modified:
+        cache.set(cache_key,
+                  {'etag': etag, 'last_modified': last_modified, 'data': data},
+                  app_settings.IMPORT_CACHE_TIMEOUT)
+    return data
+
+
+def parse_template_data(data):
+    """
+    validates the structure of a template document, ``config``
+    and ``variable`` may also be JSON encoded strings (as published
+    by older versions); returns the values of ``IMPORTED_FIELDS``
+    """
+    if not isinstance(data, dict):
+        raise ImportFailed(_('The document is not a JSON object'))
+    values = {}
+    for field in IMPORTED_FIELDS:
+        value = data.get(field)
+        if field in ('config', 'variable'):
+            if value is None and field == 'variable':
+                value = {}
+            elif isinstance(value, six.string_types):
+                try:
+                    value = json.loads(value, object_pairs_hook=OrderedDict)
+                except ValueError:
+                    pass
+            if not isinstance(value, dict):
+                raise ImportFailed(_('"{0}" must be a JSON object').format(field))
+        elif not isinstance(value, six.string_types):
+            raise ImportFailed(_('"{0}" is missing').format(field))
+        values[field] = value
+    if values['type'] != 'generic':
+        raise ImportFailed(_('Only generic templates can be imported'))
+    if not data.get('description') or not isinstance(data['description'], six.string_types):
+        values['description'] = None
+    else:
+        values['description'] = data['description']
+    return values
+
+
+def fetch_template(url):
+    return parse_template_data(get_json(url))
+
+
+def get_content_hash(values):
+    """
+    returns a hash of the imported fields of
+    the values returned by ``parse_template_data``
+    """
+    content = dict((field, values[field]) for field in IMPORTED_FIELDS)
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def apply_template_data(template, values):
+    """
+    copies the values returned by ``parse_template_data`` to
+    ``template``, the description is kept if already present
+    """
+    for field in IMPORTED_FIELDS:
+        setattr(template, field, values[field])
+    if not template.description and values['description']:
+        template.description = values['description']
+    template.import_hash = get_content_hash(values)
+    # avoids downloading the template again in ``clean``
+    template._imported_url = template.url
+
+
+def fetch_templates(urls, workers=None):
+    """
+    downloads concurrently the templates published at ``urls``,
+    returns a dict which maps each URL to its values (see
+    ``parse_template_data``) or to the ``ImportFailed`` exception
+    """
+    def fetch(url):
+        try:
+            return url, fetch_template(url)
+        except ImportFailed as e:
+            return url, e
+
+    with ThreadPoolExecutor(max_workers=workers or app_settings.IMPORT_WORKERS) as executor:
+        return dict(executor.map(fetch, urls))
+
+
+def import_catalog(template_model, catalog_url, keys=None, workers=None):
+    """
+    imports the templates listed in the index of a catalog
+    (see ``sharing.update_catalog``), or only those whose key is
+    in ``keys``; templates already imported from the same URL
+    are updated; returns a ``(imported, errors)`` tuple,
+    ``errors`` being a list of ``(url, message)`` tuples
+    """
+    index = get_json(catalog_url)
+    try:
+        entries = [entry for entry in index['templates'] if not keys or entry['key'] in keys]
+        urls = OrderedDict((urljoin(catalog_url, entry['url']), entry) for entry in entries)
+    except (KeyError, TypeError):
+        raise ImportFailed(_('"{0}" is not a valid catalog').format(catalog_url))
+    documents = fetch_templates(list(urls), workers)
+    existing = dict((t.url, t) for t in template_model.objects.filter(url__in=list(urls)))
+    imported = 0
+    errors = []
+    for url, entry in urls.items():
+        template = existing.get(url) or template_model(name=entry.get('name'), flag='import', url=url)
+        if _update_template(template, documents[url], errors):
+            imported += 1
+    return imported, errors
+
+
+def sync_templates(template_model, workers=None):
+    """
+    downloads concurrently the templates imported from other instances
+    (conditional requests avoid downloading those which were not modified)
+    and saves only the templates whose contents changed, which in turn
+    flag the configurations using them as modified if their output changed;
+    returns an ``(updated, errors)`` tuple, see also ``import_catalog``
+    """
+    templates = list(template_model.objects.filter(flag='import', url__isnull=False)
+                                           .exclude(url='')
+                                           .only('id', 'url', 'import_hash'))
+    documents = fetch_templates(set(t.url for t in templates), workers)
+    updated = 0
+    errors = []
+    for template in templates:
+        if _update_template(template, documents[template.url], errors):
+            updated += 1
+    return updated, errors
+
+
+def _update_template(template, values, errors):
+    """
+    saves ``template`` with ``values`` unless its contents did not
+    change, returns ``True`` if the template has been saved
+    """
+    if isinstance(values, ImportFailed):
+        errors.append((template.url, str(values)))
+        return False
+    if not template._state.adding:
+        if template.import_hash == get_content_hash(values):
+            return False
+        # loads the fields which have been deferred
+        template = type(template).objects.get(pk=template.pk)
+    apply_template_data(template, values)
+    try:
+        template.full_clean()
+        with transaction.atomic():
+            template.save()
+    except ValidationError as e:
+        errors.append((template.url, '; '.join(e.messages)))
+        return False
+    return True
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Template
+from ...sharing import update_catalog
+
+
+class Command(BaseCommand):
+    help = 'Writes or updates the static catalog of public templates'
+    template_model = Template
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help='directory in which the catalog is written')
+        parser.add_argument('--base-url',
+                            dest='base_url',
+                            required=True,
+                            help='URL at which the directory is served')
+
+    def handle(self, *args, **options):
+        written, removed = update_catalog(self.template_model,
+                                          options['path'],
+                                          options['base_url'])
+        self.stdout.write('{0} templates written, {1} removed'.format(written, removed))
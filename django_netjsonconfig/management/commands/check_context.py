@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Config, ContextVariable
+
+
+class Command(BaseCommand):
+    help = ('Flags as modified the configurations which use the variables '
+            'of NETJSONCONFIG_CONTEXT which changed since the last check')
+    config_model = Config
+    context_model = ContextVariable
+
+    def handle(self, *args, **options):
+        changed = self.context_model.check_context(self.config_model)
+        if changed:
+            self.stdout.write('Changed context variables: {0}'.format(', '.join(sorted(changed))))
+        else:
+            self.stdout.write('No context variables changed')
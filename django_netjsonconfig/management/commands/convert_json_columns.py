@@ -0,0 +1,134 @@
+import six
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+
+from ... import settings as app_settings
+from ...fields import NATIVE_JSON_TYPES, LazyJSONField, RawJSON
+from ...models import Config, Template, Vpn
+
+ALTER_COLUMN_SQL = {
+    'postgresql': 'ALTER TABLE {table} ALTER COLUMN {column} TYPE {type} USING {column}::{type}',
+    'mysql': 'ALTER TABLE {table} MODIFY {column} {type} {null}',
+}
+
+
+def get_column_type(connection, table, column):
+    if connection.vendor == 'sqlite':
+        return 'text'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT data_type FROM information_schema.columns '
+                       'WHERE table_name = %s AND column_name = %s', [table, column])
+        row = cursor.fetchone()
+    return row[0].lower() if row else None
+
+
+def convert_json_columns(connection, model, native, batch_size=1000):
+    """
+    converts the columns of the ``LazyJSONField`` fields of ``model`` to
+    the native JSON type of the database (if ``native`` is ``True``) or to
+    text, then rewrites in compact form the JSON stored in text columns,
+    ``batch_size`` rows at time, each batch in its own transaction:
+    columns and rows which are already converted are skipped, therefore
+    the conversion can be interrupted and resumed by running it again
+
+    returns the number of altered columns and of rewritten rows
+    """
+    table = model._meta.db_table
+    quote_name = connection.ops.quote_name
+    text_fields = []
+    altered = 0
+    for field in model._meta.concrete_fields:
+        if not isinstance(field, LazyJSONField):
+            continue
+        if native and connection.vendor in NATIVE_JSON_TYPES:
+            db_type = NATIVE_JSON_TYPES[connection.vendor]
+        else:
+            db_type = models.TextField().db_type(connection)
+        if connection.vendor in ALTER_COLUMN_SQL and \
+           get_column_type(connection, table, field.column) != db_type:
+            with connection.cursor() as cursor:
+                cursor.execute(ALTER_COLUMN_SQL[connection.vendor].format(
+                    table=quote_name(table),
+                    column=quote_name(field.column),
+                    type=db_type,
+                    null='NULL' if field.null else 'NOT NULL'
+                ))
+            altered += 1
+        if db_type not in NATIVE_JSON_TYPES.values():
+            text_fields.append(field)
+    if not text_fields:
+        return altered, 0
+    names = [field.attname for field in text_fields]
+    queryset = model._base_manager.using(connection.alias).order_by('pk')
+    last_pk = None
+    rewritten = 0
+    while True:
+        batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(batch.values_list('pk', *names)[:batch_size])
+        if not rows:
+            break
+        with transaction.atomic(using=connection.alias):
+            for row in rows:
+                rewritten += _compact_row(queryset, text_fields, row)
+        last_pk = rows[-1][0]
+    return altered, rewritten
+
+
+def _compact_row(queryset, fields, row):
+    changes = {}
+    for field, value in zip(fields, row[1:]):
+        if not isinstance(value, six.string_types):
+            continue
+        try:
+            compact = field.get_prep_value(field.loads(value))
+        except ValidationError:
+            continue
+        if compact != value:
+            changes[field.attname] = RawJSON(compact)
+    if changes:
+        queryset.filter(pk=row[0]).update(**changes)
+    return int(bool(changes))
+
+
+class Command(BaseCommand):
+    help = ('Converts the JSON columns to the native JSON type of the database or to text '
+            'and stores the JSON in compact form, can be interrupted and run again')
+    models = [Config, Template, Vpn]
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--native',
+                           action='store_true',
+                           help='convert the columns to the native JSON type of the database')
+        group.add_argument('--text',
+                           action='store_true',
+                           help='convert the columns to text')
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=1000,
+                            dest='batch_size',
+                            help='number of rows rewritten in each transaction')
+        parser.add_argument('--force',
+                            action='store_true',
+                            help='convert the columns even if the requested type does '
+                                 'not match NETJSONCONFIG_NATIVE_JSON')
+        parser.add_argument('--database',
+                            default=DEFAULT_DB_ALIAS,
+                            help='database to convert')
+
+    def handle(self, *args, **options):
+        native = app_settings.NATIVE_JSON
+        if options['native'] or options['text']:
+            native = options['native']
+        if native != app_settings.NATIVE_JSON and not options['force']:
+            raise CommandError('NETJSONCONFIG_NATIVE_JSON must be set to {0} before converting '
+                               'the columns, otherwise they do not match the type expected by '
+                               'the fields (use --force to convert them anyway)'.format(native))
+        connection = connections[options['database']]
+        for model in self.models:
+            altered, rewritten = convert_json_columns(connection, model, native,
+                                                      batch_size=options['batch_size'])
+            self.stdout.write('{0}: {1} columns converted, {2} rows '
+                              'compacted'.format(model._meta.verbose_name_plural,
+                                                 altered, rewritten))
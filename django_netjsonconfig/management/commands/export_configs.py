@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ... import settings as app_settings
+from ...export import FORMATS, iter_config_archives, stream_archive
+from ...models import Config
+
+
+class Command(BaseCommand):
+    help = 'Exports the configuration archive of each device in a single tar or zip archive'
+    config_model = Config
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output',
+                            help='path of the archive to write (defaults to standard output)')
+        parser.add_argument('--format',
+                            choices=sorted(FORMATS.keys()),
+                            default='tar',
+                            help='format of the archive')
+        parser.add_argument('--backend',
+                            help='export only the configurations using this backend')
+        parser.add_argument('--template',
+                            help='export only the configurations using the template with this name')
+        parser.add_argument('--workers',
+                            type=int,
+                            default=app_settings.EXPORT_WORKERS,
+                            help='number of processes rendering configurations in parallel')
+        parser.add_argument('--issue-certs',
+                            action='store_true',
+                            dest='issue_certs',
+                            help='issue the pending VPN client certificates deferred by '
+                                 'NETJSONCONFIG_LAZY_AUTO_CERT before exporting')
+
+    def get_queryset(self, options):
+        queryset = self.config_model.objects.all()
+        if options['backend']:
+            queryset = queryset.filter(backend=options['backend'])
+        if options['template']:
+            queryset = queryset.filter(templates__name=options['template'])
+        return queryset
+
+    def handle(self, *args, **options):
+        archives = iter_config_archives(self.get_queryset(options),
+                                        workers=options['workers'],
+                                        issue_certs=options['issue_certs'])
+        chunks = stream_archive(archives, options['format'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                self._write(chunks, output)
+        else:
+            self._write(chunks, sys.stdout.buffer)
+
+    def _write(self, chunks, output):
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
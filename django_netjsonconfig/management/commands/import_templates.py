@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import settings as app_settings
+from ...importer import ImportFailed, import_catalog
+from ...models import Template
+
+
+class Command(BaseCommand):
+    help = 'Imports the templates of a catalog published by another instance'
+    template_model = Template
+
+    def add_arguments(self, parser):
+        parser.add_argument('url',
+                            help='URL of the index of the catalog')
+        parser.add_argument('--key',
+                            action='append',
+                            dest='keys',
+                            help='key of a template to import, may be repeated '
+                                 '(defaults to all the templates of the catalog)')
+        parser.add_argument('--workers',
+                            type=int,
+                            default=app_settings.IMPORT_WORKERS,
+                            help='number of templates downloaded concurrently')
+
+    def handle(self, *args, **options):
+        try:
+            imported, errors = import_catalog(self.template_model,
+                                              options['url'],
+                                              keys=options['keys'],
+                                              workers=options['workers'])
+        except ImportFailed as e:
+            raise CommandError(str(e))
+        for url, message in errors:
+            self.stderr.write('{0}: {1}'.format(url, message))
+        self.stdout.write('{0} templates imported'.format(imported))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from ... import settings as app_settings
+from ...models import DhParameters, Vpn
+
+
+class Command(BaseCommand):
+    help = 'Refills the pool of precomputed Diffie-Hellman parameters used by VPN servers'
+    dh_model = DhParameters
+    vpn_model = Vpn
+
+    def add_arguments(self, parser):
+        parser.add_argument('--length',
+                            action='append',
+                            type=int,
+                            dest='lengths',
+                            help='DH parameters length to refill, may be repeated '
+                                 '(defaults to the lengths used by existing VPN servers)')
+        parser.add_argument('--size',
+                            type=int,
+                            default=app_settings.DH_POOL_SIZE,
+                            help='number of DH parameters to keep in the pool for each length')
+        parser.add_argument('--workers',
+                            type=int,
+                            default=1,
+                            help='number of openssl processes to run in parallel')
+
+    def get_lengths(self):
+        lengths = set(self.vpn_model.objects.values_list('dh_length', flat=True))
+        lengths.add(app_settings.DEFAULT_DH_LENGTH)
+        return sorted(lengths)
+
+    def handle(self, *args, **options):
+        for length in options['lengths'] or self.get_lengths():
+            added = self.dh_model.fill(length,
+                                       size=options['size'],
+                                       workers=options['workers'])
+            self.stdout.write('{0} bit: {1} DH parameters added'.format(length, added))
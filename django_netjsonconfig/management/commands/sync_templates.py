@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ... import settings as app_settings
+from ...importer import sync_templates
+from ...models import Template
+
+
+class Command(BaseCommand):
+    help = 'Updates the templates imported from other instances'
+    template_model = Template
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers',
+                            type=int,
+                            default=app_settings.IMPORT_WORKERS,
+                            help='number of templates downloaded concurrently')
+
+    def handle(self, *args, **options):
+        updated, errors = sync_templates(self.template_model, workers=options['workers'])
+        for url, message in errors:
+            self.stderr.write('{0}: {1}'.format(url, message))
+        self.stdout.write('{0} templates updated'.format(updated))
@@ -0,0 +1,59 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Config, Template
+
+
+class Command(BaseCommand):
+    help = 'Flags configurations as modified or adds, removes and replaces their templates'
+    config_model = Config
+    template_model = Template
+    operations = ['set-modified', 'add-template', 'remove-template', 'replace-template']
+
+    def add_arguments(self, parser):
+        parser.add_argument('operation', choices=self.operations)
+        parser.add_argument('--template',
+                            help='name of the template to add, remove or replace')
+        parser.add_argument('--new-template',
+                            dest='new_template',
+                            help='name of the template which replaces --template')
+        parser.add_argument('--backend',
+                            help='update only the configurations using this backend')
+        parser.add_argument('--device',
+                            action='append',
+                            dest='devices',
+                            help='name of a device to update, may be repeated '
+                                 '(defaults to all the devices)')
+
+    def get_template(self, name):
+        if not name:
+            raise CommandError('a template name is required for this operation')
+        try:
+            return self.template_model.objects.get(name=name)
+        except self.template_model.DoesNotExist:
+            raise CommandError('template "{0}" does not exist'.format(name))
+
+    def get_queryset(self, options):
+        queryset = self.config_model.objects.all()
+        if options['backend']:
+            queryset = queryset.filter(backend=options['backend'])
+        if options['devices']:
+            queryset = queryset.filter(device__name__in=options['devices'])
+        return queryset
+
+    def handle(self, *args, **options):
+        queryset = self.get_queryset(options)
+        operation = options['operation']
+        try:
+            if operation == 'set-modified':
+                count = queryset.set_status_modified()
+            elif operation == 'add-template':
+                count = queryset.add_template(self.get_template(options['template']))
+            elif operation == 'remove-template':
+                count = queryset.remove_template(self.get_template(options['template']))
+            else:
+                count = queryset.replace_template(self.get_template(options['template']),
+                                                  self.get_template(options['new_template']))
+        except ValidationError as e:
+            raise CommandError('; '.join(e.messages))
+        self.stdout.write('{0} configurations have been modified'.format(count))
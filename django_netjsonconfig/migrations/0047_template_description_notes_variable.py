@@ -0,0 +1,29 @@
+# Generated by Django 2.1.15 on 2026-10-19 16:40
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0046_auto_20190411_0049'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='template',
+            name='description',
+            field=models.TextField(blank=True, help_text='Enter public description of this template', null=True, verbose_name='Description'),
+        ),
+        migrations.AddField(
+            model_name='template',
+            name='notes',
+            field=models.TextField(blank=True, help_text='Enter internal notes for the administrators', null=True, verbose_name='Notes'),
+        ),
+        migrations.AddField(
+            model_name='template',
+            name='variable',
+            field=jsonfield.fields.JSONField(blank=True, default=dict, help_text='Enter Values for the variables used by this template', verbose_name='Variable'),
+        ),
+    ]
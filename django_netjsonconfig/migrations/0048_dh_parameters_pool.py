@@ -0,0 +1,57 @@
+# Generated by Django 2.1.15 on 2026-10-19 16:44
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import load_pem_parameters
+from django.db import migrations, models
+from django.utils.encoding import force_bytes
+import django.utils.timezone
+import django_netjsonconfig.base.vpn
+import model_utils.fields
+import uuid
+
+
+def fill_dh_length(apps, schema_editor):
+    """
+    sets the length of the DH parameters of existing VPN servers,
+    which otherwise would be replaced when changing the length
+    """
+    vpn_model = apps.get_model('django_netjsonconfig', 'Vpn')
+    for pk, dh in vpn_model.objects.exclude(dh='').values_list('pk', 'dh'):
+        try:
+            params = load_pem_parameters(force_bytes(dh), default_backend())
+        except ValueError:
+            continue
+        length = params.parameter_numbers().p.bit_length()
+        if length in (1024, 2048, 3072, 4096):
+            vpn_model.objects.filter(pk=pk).update(dh_length=length)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0047_template_description_notes_variable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DhParameters',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('length', models.PositiveSmallIntegerField(choices=[(1024, '1024'), (2048, '2048'), (3072, '3072'), (4096, '4096')], db_index=True)),
+                ('contents', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'DH parameters',
+                'verbose_name_plural': 'DH parameters',
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='vpn',
+            name='dh_length',
+            field=models.PositiveSmallIntegerField(choices=[(1024, '1024'), (2048, '2048'), (3072, '3072'), (4096, '4096')], default=django_netjsonconfig.base.vpn.default_dh_length, help_text='length in bits of the Diffie-Hellman parameters, which are taken from the precomputed pool when available', verbose_name='DH parameters length'),
+        ),
+        migrations.RunPython(fill_dh_length, migrations.RunPython.noop),
+    ]
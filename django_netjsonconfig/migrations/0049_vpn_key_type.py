@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0048_dh_parameters_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vpn',
+            name='key_type',
+            field=models.CharField(choices=[('rsa', 'RSA (same length as the CA)'), ('ec-p256', 'ECDSA P-256'), ('ec-p384', 'ECDSA P-384')], default='rsa', help_text='type of the keys of the automatically generated server and client certificates', max_length=16, verbose_name='key type'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.15 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0049_vpn_key_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['created', 'id'], name='django_netj_created_39df0e_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.1.15 on 2026-10-19 17:25
+
+from django.db import migrations
+import django_netjsonconfig.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0051_device_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='config',
+            name='config',
+            field=django_netjsonconfig.fields.LazyJSONField(blank=True, default=dict, help_text='configuration in NetJSON DeviceConfiguration format', verbose_name='configuration'),
+        ),
+        migrations.AlterField(
+            model_name='config',
+            name='context',
+            field=django_netjsonconfig.fields.LazyJSONField(blank=True, help_text='Additional <a href="http://netjsonconfig.openwisp.org/en/stable/general/basics.html#context" target="_blank">context (configuration variables)</a> in JSON format', null=True),
+        ),
+        migrations.AlterField(
+            model_name='template',
+            name='config',
+            field=django_netjsonconfig.fields.LazyJSONField(blank=True, default=dict, help_text='configuration in NetJSON DeviceConfiguration format', verbose_name='configuration'),
+        ),
+        migrations.AlterField(
+            model_name='template',
+            name='variable',
+            field=django_netjsonconfig.fields.LazyJSONField(blank=True, default=dict, help_text='Enter Values for the variables used by this template', verbose_name='Variable'),
+        ),
+        migrations.AlterField(
+            model_name='vpn',
+            name='config',
+            field=django_netjsonconfig.fields.LazyJSONField(default=dict, help_text='configuration in NetJSON DeviceConfiguration format', verbose_name='configuration'),
+        ),
+    ]
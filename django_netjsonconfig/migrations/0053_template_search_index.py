@@ -0,0 +1,70 @@
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'django_netjsonconfig_template'
+FTS_TABLE = 'django_netjsonconfig_template_fts'
+FTS_FIELDS = ['name', 'description']
+INSERT = 'INSERT INTO {0}(rowid, {1}) VALUES (new.rowid, {2});'.format(
+    FTS_TABLE, ', '.join(FTS_FIELDS), ', '.join('new.{0}'.format(f) for f in FTS_FIELDS)
+)
+DELETE = "INSERT INTO {0}({0}, rowid, {1}) VALUES ('delete', old.rowid, {2});".format(
+    FTS_TABLE, ', '.join(FTS_FIELDS), ', '.join('old.{0}'.format(f) for f in FTS_FIELDS)
+)
+SQL = {
+    # same expression used by the queries of search.template_search
+    'postgresql': [
+        "CREATE INDEX IF NOT EXISTS {0}_fts ON {0} USING gin ("
+        "(setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')))".format(TABLE)
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE {0} USING fts5({1}, content='{2}')".format(
+            FTS_TABLE, ', '.join(FTS_FIELDS), TABLE
+        ),
+        'CREATE TRIGGER {0}_ai AFTER INSERT ON {1} BEGIN {2} END'.format(FTS_TABLE, TABLE, INSERT),
+        'CREATE TRIGGER {0}_ad AFTER DELETE ON {1} BEGIN {2} END'.format(FTS_TABLE, TABLE, DELETE),
+        'CREATE TRIGGER {0}_au AFTER UPDATE ON {1} BEGIN {2} {3} END'.format(
+            FTS_TABLE, TABLE, DELETE, INSERT
+        ),
+        "INSERT INTO {0}({0}) VALUES ('rebuild')".format(FTS_TABLE),
+    ],
+}
+DROP_SQL = {
+    'postgresql': ['DROP INDEX IF EXISTS {0}_fts'.format(TABLE)],
+    'sqlite': ['DROP TRIGGER IF EXISTS {0}_{1}'.format(FTS_TABLE, suffix) for suffix in ('ai', 'ad', 'au')] +
+              ['DROP TABLE IF EXISTS {0}'.format(FTS_TABLE)],
+}
+
+
+def forward(apps, schema_editor):
+    """
+    creates the full text search index (PostgreSQL) or the FTS5
+    table (SQLite) used to search templates by relevance
+    """
+    statements = SQL.get(schema_editor.connection.vendor, [])
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for statement in statements:
+                schema_editor.execute(statement)
+    except DatabaseError as e:
+        # sqlite may have been compiled without FTS5: search still works
+        logger.warning('Could not create search index for Template: {0}'.format(e))
+
+
+def backward(apps, schema_editor):
+    for statement in DROP_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0052_lazy_json_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0053_template_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='template',
+            name='url',
+            field=models.URLField(blank=True, db_index=True, help_text='URL of the shared template to import', max_length=255, null=True, verbose_name='URL'),
+        ),
+    ]
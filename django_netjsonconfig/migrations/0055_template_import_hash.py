@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0054_template_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='template',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
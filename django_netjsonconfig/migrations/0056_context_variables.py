@@ -0,0 +1,94 @@
+# Generated by Django 2.1.15 on 2026-10-19 17:59
+
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+from jsonfield.encoder import JSONEncoder
+
+BATCH_SIZE = 1000
+# placeholders of the variables (as in netjsonconfig)
+VARIABLE_REGEX = re.compile(r'\{\{\s*(\w*)\s*\}\}')
+
+
+def find_variables(data, names):
+    """
+    adds to ``names`` the variables used in ``data``
+    """
+    if isinstance(data, dict):
+        data = data.values()
+    elif not isinstance(data, list):
+        if isinstance(data, str) and '{{' in data:
+            names.update(name.strip() for name in VARIABLE_REGEX.findall(data))
+        return
+    for value in data:
+        find_variables(value, names)
+
+
+def forward(apps, schema_editor):
+    """
+    indexes the variables used by existing configurations and
+    templates and stores the checksums of the current global context
+    """
+    for model_name in ('Config', 'Template'):
+        model = apps.get_model('django_netjsonconfig', model_name)
+        rows = model.objects.order_by('pk').values_list('pk', 'config')
+        last_pk = None
+        while True:
+            batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            batch = list(batch[:BATCH_SIZE])
+            for pk, config in batch:
+                # native JSON columns are decoded by the database driver
+                if not isinstance(config, dict):
+                    config = json.loads(config or '{}')
+                names = set()
+                find_variables(config, names)
+                if names:
+                    variables = ',{0},'.format(','.join(sorted(names)))
+                    model.objects.filter(pk=pk).update(variables=variables)
+            if len(batch) < BATCH_SIZE:
+                break
+            last_pk = batch[-1][0]
+    context = getattr(settings, 'NETJSONCONFIG_CONTEXT', {})
+    context_model = apps.get_model('django_netjsonconfig', 'ContextVariable')
+    context_model.objects.bulk_create([
+        context_model(name=name,
+                      checksum=hashlib.md5(json.dumps(value, cls=JSONEncoder).encode()).hexdigest())
+        for name, value in context.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0055_template_import_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContextVariable',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('checksum', models.CharField(max_length=32)),
+            ],
+            options={
+                'verbose_name': 'context variable',
+                'verbose_name_plural': 'context variables',
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='config',
+            name='variables',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='template',
+            name='variables',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(forward, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def flag_configs(apps, schema_editor):
+    """
+    the default values of the variables of templates are used in the
+    rendered configurations since this version, hence the configurations
+    using templates which define variables are flagged as modified
+    """
+    template_model = apps.get_model('django_netjsonconfig', 'Template')
+    config_model = apps.get_model('django_netjsonconfig', 'Config')
+    template_pks = []
+    for pk, variable in template_model.objects.values_list('pk', 'variable'):
+        # native JSON columns are decoded by the database driver
+        if not isinstance(variable, dict):
+            variable = json.loads(variable or '{}')
+        if variable:
+            template_pks.append(pk)
+    for i in range(0, len(template_pks), BATCH_SIZE):
+        config_model.objects.filter(templates__in=template_pks[i:i + BATCH_SIZE]) \
+                            .exclude(status='modified') \
+                            .update(status='modified')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0056_context_variables'),
+    ]
+
+    operations = [
+        migrations.RunPython(flag_configs, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 2.1.15 on 2026-10-19 18:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def forward(apps, schema_editor):
+    """
+    moves the names of the variables used by configurations and
+    templates from the ``variables`` text field to the related tables
+    """
+    for model_name, field in (('Config', 'config'), ('Template', 'template')):
+        model = apps.get_model('django_netjsonconfig', model_name)
+        variable_model = apps.get_model('django_netjsonconfig', '{0}Variable'.format(model_name))
+        rows = model.objects.exclude(variables='').order_by('pk').values_list('pk', 'variables')
+        last_pk = None
+        while True:
+            batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            batch = list(batch[:BATCH_SIZE])
+            variable_model.objects.bulk_create([
+                variable_model(name=name, **{'{0}_id'.format(field): pk})
+                for pk, variables in batch
+                for name in variables.strip(',').split(',') if name
+            ])
+            if len(batch) < BATCH_SIZE:
+                break
+            last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_netjsonconfig', '0057_flag_template_variable_configs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfigVariable',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TemplateVariable',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='templatevariable',
+            name='template',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_variables', to='django_netjsonconfig.Template'),
+        ),
+        migrations.AddField(
+            model_name='configvariable',
+            name='config',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_variables', to='django_netjsonconfig.Config'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='templatevariable',
+            unique_together={('name', 'template')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='configvariable',
+            unique_together={('name', 'config')},
+        ),
+        migrations.RunPython(forward, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='config',
+            name='variables',
+        ),
+        migrations.RemoveField(
+            model_name='template',
+            name='variables',
+        ),
+    ]
@@ -1,8 +1,10 @@
 from .base.config import AbstractConfig, TemplatesVpnMixin
+from .base.context import AbstractContextVariable
 from .base.device import AbstractDevice
 from .base.tag import AbstractTaggedTemplate, AbstractTemplateTag
 from .base.template import AbstractTemplate
-from .base.vpn import AbstractVpn, AbstractVpnClient
+from .base.variable import AbstractConfigVariable, AbstractTemplateVariable
+from .base.vpn import AbstractDhParameters, AbstractVpn, AbstractVpnClient
 
 
 class Config(TemplatesVpnMixin, AbstractConfig):
@@ -59,3 +61,35 @@ class Vpn(AbstractVpn):
     """
     class Meta(AbstractVpn.Meta):
         abstract = False
+
+
+class DhParameters(AbstractDhParameters):
+    """
+    Concrete DH parameters pool model
+    """
+    class Meta(AbstractDhParameters.Meta):
+        abstract = False
+
+
+class ContextVariable(AbstractContextVariable):
+    """
+    Concrete global context variable checksum model
+    """
+    class Meta(AbstractContextVariable.Meta):
+        abstract = False
+
+
+class ConfigVariable(AbstractConfigVariable):
+    """
+    Concrete model of the variables used by configs
+    """
+    class Meta(AbstractConfigVariable.Meta):
+        abstract = False
+
+
+class TemplateVariable(AbstractTemplateVariable):
+    """
+    Concrete model of the variables used by templates
+    """
+    class Meta(AbstractTemplateVariable.Meta):
+        abstract = False
@@ -0,0 +1,201 @@
+"""
+Indexed device and template search
+
+On PostgreSQL the ``icontains`` lookups performed by the admin
+are served by trigram indexes, on SQLite by an FTS5 table kept
+in sync with triggers; inputs which look like a mac address,
+an UUID or a device key are routed to indexed equality lookups.
+
+Templates are searched by relevance with the full text search of
+PostgreSQL (served by a GIN index) or with an FTS5 table on SQLite.
+
+The indexes and FTS5 tables are created by migrations, the triggers
+of the FTS5 tables are recreated after migrations which drop them.
+"""
+import re
+import uuid
+
+from django.db import connections, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce
+from django.utils.text import slugify
+
+SEARCH_FIELDS = ['id', 'name', 'mac_address', 'key', 'model', 'os', 'system', 'hardware_id']
+FTS_FIELDS = SEARCH_FIELDS[1:]
+MAC_ADDRESS_REGEX = re.compile(r'^[0-9a-f]{2}([:.-]?)([0-9a-f]{2}\1){4}[0-9a-f]{2}$|'
+                               r'^([0-9a-f]{4}\.){2}[0-9a-f]{4}$', re.IGNORECASE)
+KEY_REGEX = re.compile(r'^[^\s/\.]{32,64}$')
+TEMPLATE_FTS_FIELDS = ['name', 'description']
+# relevance of matches in the name and description of templates
+# (FTS5 bm25 weights) and of matches on template tags, which is
+# added to the relevance of text matches
+TEMPLATE_FTS_WEIGHTS = [10.0, 1.0]
+TAG_MATCH_RANK = 0.1
+# the relevance is stored in the pagination cursor as an integer
+# (floats may not survive the round trip) with this resolution
+RANK_PRECISION = 1000000
+# suffixes of the triggers which keep the FTS5 tables in sync
+FTS_TRIGGERS = ('ai', 'ad', 'au')
+# same expression in queries and index (see migration 0053),
+# otherwise the index is not used
+TEMPLATE_TSVECTOR = ("(setweight(to_tsvector('simple', coalesce({0}name, '')), 'A') || "
+                     "setweight(to_tsvector('simple', coalesce({0}description, '')), 'B'))")
+
+
+def normalize_mac_address(value):
+    """
+    returns the possible stored notations of a
+    mac address written in any notation, or
+    ``None`` if value is not a mac address
+    """
+    if not MAC_ADDRESS_REGEX.match(value):
+        return None
+    digits = re.sub(r'[^0-9a-fA-F]', '', value)
+    pairs = [digits[i:i + 2] for i in range(0, 12, 2)]
+    notations = []
+    for separator in (':', '-'):
+        mac = separator.join(pairs)
+        notations += [mac.upper(), mac.lower()]
+    return notations
+
+
+def get_exact_lookup(value):
+    """
+    returns a ``Q`` object which looks up devices by equality on
+    indexed columns if value looks like a mac address, an UUID
+    or a device key, otherwise returns ``None``
+    """
+    mac_addresses = normalize_mac_address(value)
+    if mac_addresses:
+        return Q(mac_address__in=mac_addresses)
+    lookup = None
+    try:
+        lookup = Q(pk=uuid.UUID(value))
+    except ValueError:
+        pass
+    if KEY_REGEX.match(value):
+        key_lookup = Q(key=value)
+        lookup = lookup | key_lookup if lookup else key_lookup
+    return lookup
+
+
+def get_fts_table(model):
+    return '{0}_fts'.format(model._meta.db_table)
+
+
+def has_fts_table(model, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        return get_fts_table(model) in connection.introspection.table_names(cursor)
+
+
+def get_fts_match(search_term):
+    """
+    converts search_term into an FTS5 query in which
+    each word is a phrase matching the beginning of tokens
+    """
+    words = [word for word in search_term.split() if re.search(r'\w', word)]
+    return ' '.join('"{0}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def fts_search(queryset, search_term):
+    """
+    filters queryset with the FTS5 table of its model
+    """
+    match = get_fts_match(search_term)
+    if not match:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    fts_table = get_fts_table(queryset.model)
+    sql = ('SELECT id FROM {0} WHERE rowid IN '
+           '(SELECT rowid FROM {1} WHERE {1} MATCH %s)').format(table, fts_table)
+    return queryset.filter(pk__in=RawSQL(sql, [match]))
+
+
+def template_search(queryset, search_term):
+    """
+    filters a template queryset with the terms of ``search_term``
+    found in the name, description or tags of each template and
+    annotates the relevance of each result as ``rank``
+    """
+    words = [word for word in search_term.split() if re.search(r'\w', word)]
+    if not words:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+    if vendor == 'postgresql':
+        vector = TEMPLATE_TSVECTOR.format('{0}.'.format(table))
+        text_rank = RawSQL("CASE WHEN {0} @@ plainto_tsquery('simple', %s) "
+                           "THEN ts_rank({0}, plainto_tsquery('simple', %s))::float8 "
+                           "END".format(vector), [search_term, search_term], output_field=FloatField())
+    elif vendor == 'sqlite' and has_fts_table(queryset.model, queryset.db):
+        fts_table = get_fts_table(queryset.model)
+        weights = ', '.join(str(weight) for weight in TEMPLATE_FTS_WEIGHTS)
+        text_rank = RawSQL('SELECT -bm25({0}, {1}) FROM {0} WHERE {0} MATCH %s '
+                           'AND rowid = {2}.rowid'.format(fts_table, weights, table),
+                           [get_fts_match(search_term)], output_field=FloatField())
+    else:
+        lookup = Q()
+        for word in words:
+            lookup &= Q(name__icontains=word) | Q(description__icontains=word)
+        text_rank = Case(When(lookup, then=Value(1.0)), output_field=FloatField())
+    tags = queryset.model.objects.filter(tags__slug__in=[slugify(word) for word in words])
+    tag_rank = Case(When(pk__in=tags.values('pk'), then=Value(TAG_MATCH_RANK)),
+                    default=Value(0.0),
+                    output_field=FloatField())
+    score = Coalesce(F('text_rank'), Value(0.0), output_field=FloatField()) + tag_rank
+    rank = Cast(F('score') * Value(RANK_PRECISION), IntegerField())
+    return queryset.annotate(text_rank=text_rank) \
+                   .annotate(score=score) \
+                   .filter(score__gt=0) \
+                   .annotate(rank=rank)
+
+
+def repair_fts_table(model, using='default'):
+    """
+    recreates the triggers which keep the FTS5 table of ``model``
+    in sync and rebuilds its contents if any trigger is missing:
+    SQLite drops them (and may renumber the rows) when a migration
+    rebuilds the table, eg: to add a column; executed after each
+    ``migrate`` (see ``apps.py``), returns ``True`` if repaired
+    """
+    if not has_fts_table(model, using):
+        return False
+    connection = connections[using]
+    table = model._meta.db_table
+    fts_table = get_fts_table(model)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                       "AND tbl_name = %s", [table])
+        triggers = set(row[0] for row in cursor.fetchall())
+        if triggers.issuperset('{0}_{1}'.format(fts_table, suffix) for suffix in FTS_TRIGGERS):
+            return False
+        cursor.execute('PRAGMA table_info({0})'.format(fts_table))
+        fields = [row[1] for row in cursor.fetchall()]
+        with transaction.atomic(using=using):
+            for statement in _get_fts_triggers_sql(table, fts_table, fields):
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(fts_table))
+    return True
+
+
+def _get_fts_triggers_sql(table, fts_table, fields):
+    columns = ', '.join(fields)
+    new_values = ', '.join('new.{0}'.format(field) for field in fields)
+    old_values = ', '.join('old.{0}'.format(field) for field in fields)
+    insert = "INSERT INTO {0}(rowid, {1}) VALUES (new.rowid, {2});".format(fts_table, columns, new_values)
+    delete = ("INSERT INTO {0}({0}, rowid, {1}) "
+              "VALUES ('delete', old.rowid, {2});").format(fts_table, columns, old_values)
+    return [
+        'DROP TRIGGER IF EXISTS {0}_ai'.format(fts_table),
+        'DROP TRIGGER IF EXISTS {0}_ad'.format(fts_table),
+        'DROP TRIGGER IF EXISTS {0}_au'.format(fts_table),
+        'CREATE TRIGGER {0}_ai AFTER INSERT ON {1} BEGIN {2} END'.format(fts_table, table, insert),
+        'CREATE TRIGGER {0}_ad AFTER DELETE ON {1} BEGIN {2} END'.format(fts_table, table, delete),
+        'CREATE TRIGGER {0}_au AFTER UPDATE ON {1} BEGIN {2} {3} END'.format(
+            fts_table, table, delete, insert
+        ),
+    ]
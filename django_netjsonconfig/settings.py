@@ -15,10 +15,29 @@ CONSISTENT_REGISTRATION = getattr(settings, 'NETJSONCONFIG_CONSISTENT_REGISTRATI
 SHARED_SECRET = getattr(settings, 'NETJSONCONFIG_SHARED_SECRET', '')
 CONTEXT = getattr(settings, 'NETJSONCONFIG_CONTEXT', {})
 DEFAULT_AUTO_CERT = getattr(settings, 'NETJSONCONFIG_DEFAULT_AUTO_CERT', True)
+LAZY_AUTO_CERT = getattr(settings, 'NETJSONCONFIG_LAZY_AUTO_CERT', False)
+BULK_CERT_THRESHOLD = getattr(settings, 'NETJSONCONFIG_BULK_CERT_THRESHOLD', 20)
+BULK_CERT_WORKERS = getattr(settings, 'NETJSONCONFIG_BULK_CERT_WORKERS', None)
+DEFAULT_DH_LENGTH = getattr(settings, 'NETJSONCONFIG_DEFAULT_DH_LENGTH', 1024)
+DH_POOL_SIZE = getattr(settings, 'NETJSONCONFIG_DH_POOL_SIZE', 5)
 CERT_PATH = getattr(settings, 'NETJSONCONFIG_CERT_PATH', '/etc/x509')
 COMMON_NAME_FORMAT = getattr(settings, 'NETJSONCONFIG_COMMON_NAME_FORMAT', '{mac_address}-{name}')
 MANAGEMENT_IP_DEVICE_LIST = getattr(settings, 'NETJSONCONFIG_MANAGEMENT_IP_DEVICE_LIST', True)
 BACKEND_DEVICE_LIST = getattr(settings, 'NETJSONCONFIG_BACKEND_DEVICE_LIST', True)
+SCALABLE_DEVICE_LIST = getattr(settings, 'NETJSONCONFIG_SCALABLE_DEVICE_LIST', False)
+PREVIEW_CACHE_TIMEOUT = getattr(settings, 'NETJSONCONFIG_PREVIEW_CACHE_TIMEOUT', 60 * 60)
+PREVIEW_TIMEOUT = getattr(settings, 'NETJSONCONFIG_PREVIEW_TIMEOUT', 10)
+PREVIEW_MEMORY_LIMIT = getattr(settings, 'NETJSONCONFIG_PREVIEW_MEMORY_LIMIT', 256 * 1024 * 1024)
+EXPORT_WORKERS = getattr(settings, 'NETJSONCONFIG_EXPORT_WORKERS', None)
+EXPORT_BATCH_SIZE = getattr(settings, 'NETJSONCONFIG_EXPORT_BATCH_SIZE', 100)
+DEFERRED_EDITOR = getattr(settings, 'NETJSONCONFIG_DEFERRED_EDITOR', False)
+NATIVE_JSON = getattr(settings, 'NETJSONCONFIG_NATIVE_JSON', False)
+SEARCH_CACHE_TIMEOUT = getattr(settings, 'NETJSONCONFIG_SEARCH_CACHE_TIMEOUT', 60)
+IMPORT_TIMEOUT = getattr(settings, 'NETJSONCONFIG_IMPORT_TIMEOUT', 10)
+IMPORT_WORKERS = getattr(settings, 'NETJSONCONFIG_IMPORT_WORKERS', 8)
+IMPORT_CACHE_TIMEOUT = getattr(settings, 'NETJSONCONFIG_IMPORT_CACHE_TIMEOUT', 60 * 60 * 24)
+BACKENDS_WARMUP = getattr(settings, 'NETJSONCONFIG_BACKENDS_WARMUP', False)
+TASK_RUNNER = getattr(settings, 'NETJSONCONFIG_TASK_RUNNER', 'django_netjsonconfig.tasks.sync_runner')
 
 HARDWARE_ID_ENABLED = getattr(settings, 'NETJSONCONFIG_HARDWARE_ID_ENABLED', False)
 HARDWARE_ID_OPTIONS = {
@@ -0,0 +1,149 @@
+"""
+Distribution of public and shared templates
+
+Templates are distributed as JSON documents (see ``get_template_data``)
+served by the API (by key) or written to a static catalog which can be
+hosted by any static file server (see ``update_catalog``).
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import cache
+from django.utils.text import compress_string
+from jsonfield.encoder import JSONEncoder
+
+from .views import build_asset
+
+SHARED_FLAGS = ('public', 'shared_secret')
+CATALOG_INDEX = 'index.json'
+CATALOG_TEMPLATES_DIR = 'templates'
+# fields of the catalog index entries, along with
+# tags, modification date, URL and ETag of the document
+INDEX_FIELDS = ('key', 'name', 'description', 'backend', 'type')
+
+
+def get_tag_names(template_model, templates):
+    """
+    returns the sorted tag names of each template of
+    ``templates`` (indexed by primary key) with a single query
+    """
+    tag_names = defaultdict(list)
+    through = template_model.tags.through
+    rows = through.objects.filter(object_id__in=[t.pk for t in templates]) \
+                          .order_by('tag__name') \
+                          .values_list('object_id', 'tag__name')
+    for object_id, name in rows:
+        tag_names[object_id].append(name)
+    return tag_names
+
+
+def get_template_data(template, url, tags):
+    """
+    returns the document of a template, ``url`` being the URL at
+    which it's published (used by importers to check for updates)
+    """
+    return OrderedDict((
+        ('id', str(template.pk)),
+        ('key', template.key),
+        ('name', template.name),
+        ('description', template.description),
+        ('type', template.type),
+        ('backend', template.backend),
+        ('vpn', str(template.vpn_id) if template.vpn_id else None),
+        ('auto_cert', template.auto_cert),
+        ('tags', tags),
+        ('config', template.config),
+        ('variable', template.variable),
+        ('modified', template.modified.isoformat()),
+        ('url', url),
+    ))
+
+
+def dumps(data):
+    return json.dumps(data, cls=JSONEncoder, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def get_template_asset(template, url):
+    """
+    returns the asset (see ``build_asset``) of the document of a
+    template, cached until the template or its tags are modified;
+    ``template`` may have been loaded with deferred fields
+    """
+    tags = get_tag_names(type(template), [template])[template.pk]
+    version = '{0}{1}{2}'.format(template.modified.isoformat(), tags, url)
+    cache_key = 'netjsonconfig-template-{0}-{1}'.format(template.pk,
+                                                        hashlib.md5(version.encode()).hexdigest())
+    asset = cache.get(cache_key)
+    if asset is None:
+        if template.get_deferred_fields():
+            template = type(template).objects.get(pk=template.pk)
+        asset = build_asset(dumps(get_template_data(template, url, tags)))
+        cache.set(cache_key, asset, None)
+    return asset
+
+
+def update_catalog(template_model, path, base_url):
+    """
+    writes the document of each public template to ``path`` (in
+    ``templates/<key>.json``, along with a gzipped copy for static
+    file servers which can serve precompressed files) and an index
+    of them (``index.json``); documents of templates which did not
+    change since the previous update are not rewritten and documents
+    of templates which are no longer public are removed
+
+    returns a ``(written, removed)`` tuple
+    """
+    templates_path = os.path.join(path, CATALOG_TEMPLATES_DIR)
+    if not os.path.isdir(templates_path):
+        os.makedirs(templates_path)
+    previous = {}
+    index_path = os.path.join(path, CATALOG_INDEX)
+    if os.path.exists(index_path):
+        with open(index_path, 'rb') as f:
+            index = json.loads(f.read().decode())
+        previous = dict((entry['key'], entry) for entry in index['templates'])
+    templates = list(template_model.objects.filter(flag='public').defer_json().order_by('name'))
+    tag_names = get_tag_names(template_model, templates)
+    entries = []
+    written = 0
+    for template in templates:
+        filename = os.path.join(templates_path, '{0}.json'.format(template.key))
+        entry = OrderedDict((name, getattr(template, name)) for name in INDEX_FIELDS)
+        entry['tags'] = tag_names[template.pk]
+        entry['modified'] = template.modified.isoformat()
+        entry['url'] = '{0}/{1}/{2}.json'.format(base_url.rstrip('/'),
+                                                 CATALOG_TEMPLATES_DIR,
+                                                 template.key)
+        old_entry = previous.get(template.key)
+        if old_entry and os.path.exists(filename) and \
+           dict(old_entry, etag=None) == dict(entry, etag=None):
+            entries.append(old_entry)
+            continue
+        content = dumps(get_template_data(template, entry['url'], entry['tags']))
+        entry['etag'] = hashlib.sha1(content).hexdigest()[:16]
+        _write_file(filename, content)
+        _write_file('{0}.gz'.format(filename), compress_string(content))
+        entries.append(entry)
+        written += 1
+    keys = set(entry['key'] for entry in entries)
+    removed = 0
+    for key in set(previous) - keys:
+        for extension in ('json', 'json.gz'):
+            filename = os.path.join(templates_path, '{0}.{1}'.format(key, extension))
+            if os.path.exists(filename):
+                os.remove(filename)
+        removed += 1
+    if written or removed or not previous:
+        _write_file(index_path, dumps(OrderedDict(templates=entries)))
+    return written, removed
+
+
+def _write_file(filename, content):
+    # files are replaced atomically, clients
+    # never download partially written files
+    tmp = '{0}.tmp'.format(filename)
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, filename)
@@ -1,3 +1,4 @@
 from django.dispatch import Signal
 
 config_modified = Signal(providing_args=['device', 'config'])
+configs_modified = Signal(providing_args=['queryset', 'template'])
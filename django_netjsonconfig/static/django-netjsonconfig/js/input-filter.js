@@ -0,0 +1,21 @@
+django.jQuery(function ($) {
+    'use strict';
+    // fills the datalist of input filters with the
+    // options returned by their autocompletion URL
+    $('.input-filter input[data-autocomplete-url]').each(function () {
+        var input = $(this),
+            datalist = $('#' + input.attr('list')),
+            timeout;
+        input.on('input', function () {
+            clearTimeout(timeout);
+            timeout = setTimeout(function () {
+                $.getJSON(input.data('autocomplete-url'), {q: input.val()}, function (data) {
+                    datalist.empty();
+                    $.each(data.results, function (i, value) {
+                        datalist.append($('<option>').attr('value', value));
+                    });
+                });
+            }, 250);
+        });
+    });
+});
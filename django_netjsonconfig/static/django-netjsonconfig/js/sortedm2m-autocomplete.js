@@ -0,0 +1,58 @@
+django.jQuery(function ($) {
+    'use strict';
+    var gettext = window.gettext || function (v) { return v; };
+    // loads the options of sorted m2m widgets from the server
+    // page by page (each page follows the last name of the previous one),
+    // filtered by the text typed in the filter input
+    // and by the backend currently selected in the same form
+    $('.sortedm2m-autocomplete').each(function () {
+        var container = $(this),
+            url = container.data('url'),
+            ul = container.find('.sortedm2m-items'),
+            input = container.find('.selector-filter input'),
+            hidden = container.find('input[type=hidden]'),
+            id = hidden.attr('id'),
+            backend = $('#' + id.replace(/templates$/, 'backend')),
+            more = $('<a href="#" class="sortedm2m-more"></a>').text(gettext('Load more')),
+            after = null,
+            timeout,
+            load = function (reset) {
+                var params = {q: input.val()};
+                if (after) { params.after = after; }
+                if (backend.length) { params.backend = backend.val(); }
+                $.getJSON(url, params, function (data) {
+                    if (reset) {
+                        ul.find('input:not(:checked)').closest('li').remove();
+                    }
+                    $.each(data.results, function (i, item) {
+                        if (ul.find('input[value="' + item.id + '"]').length) { return; }
+                        var checkbox = $('<input type="checkbox" class="sortedm2m">')
+                                .attr('value', item.id)
+                                .attr('id', id + '_' + ul.find('li').length),
+                            label = $('<label>').attr('for', checkbox.attr('id'))
+                                .append(checkbox, ' ', document.createTextNode(item.text));
+                        ul.append($('<li class="sortedm2m-item">').append(label));
+                    });
+                    after = data.after;
+                    more.toggle(data.more);
+                });
+            };
+        ul.after(more.hide());
+        more.on('click', function (e) {
+            e.preventDefault();
+            load(false);
+        });
+        input.on('input', function () {
+            clearTimeout(timeout);
+            timeout = setTimeout(function () {
+                after = null;
+                load(true);
+            }, 250);
+        });
+        backend.on('change', function () {
+            after = null;
+            load(true);
+        });
+        load(false);
+    });
+});
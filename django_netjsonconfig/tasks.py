@@ -0,0 +1,158 @@
+"""
+background tasks
+tasks are plain functions which only receive serializable
+arguments, so that they can be executed by any task runner
+(see ``NETJSONCONFIG_TASK_RUNNER``)
+"""
+import logging
+import threading
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from . import settings as app_settings
+from .importer import sync_templates
+
+logger = logging.getLogger(__name__)
+
+# below the default limit of variables of SQLite queries (999)
+CHUNK_SIZE = 500
+
+
+def sync_runner(task_path, *args):
+    """
+    executes the task in the current process
+    """
+    import_string(task_path)(*args)
+
+
+def thread_runner(task_path, *args):
+    """
+    executes the task in a background thread
+    """
+    def run():
+        try:
+            sync_runner(task_path, *args)
+        except Exception:
+            logger.exception('Task {0} failed'.format(task_path))
+        finally:
+            connection.close()
+
+    # not a daemon thread: the interpreter waits for the tasks
+    # of management commands to complete before exiting
+    thread = threading.Thread(target=run, name=task_path)
+    thread.start()
+
+
+def run_task(task_path, *args):
+    """
+    schedules the execution of a task by the configured
+    runner once the current transaction is committed
+    """
+    runner = import_string(app_settings.TASK_RUNNER)
+    transaction.on_commit(lambda: runner(task_path, *args))
+
+
+def iter_chunks(queryset, size=CHUNK_SIZE):
+    """
+    iterates over the objects of ``queryset`` loading
+    ``size`` objects per query (ordered by primary key)
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        objects = list(chunk[:size])
+        for obj in objects:
+            yield obj
+        if len(objects) < size:
+            return
+        last_pk = objects[-1].pk
+
+
+def iter_pk_chunks(queryset, size=CHUNK_SIZE):
+    """
+    iterates over the primary keys of ``queryset`` in lists of
+    at most ``size`` elements (ordered by primary key); each list
+    is looked up when needed, hence the objects can be changed
+    (even so that they don't match the queryset anymore) meanwhile
+    """
+    queryset = queryset.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(chunk[:size])
+        if pks:
+            yield pks
+        if len(pks) < size:
+            return
+        last_pk = pks[-1]
+
+
+def send_template_config_modified(template_label, template_pk):
+    """
+    sends ``config_modified`` for each config using a template
+    """
+    template_model = apps.get_model(template_label)
+    try:
+        template = template_model.objects.get(pk=template_pk)
+    except template_model.DoesNotExist:
+        return
+    configs = template.config_relations.select_related('device')
+    for config in iter_chunks(configs):
+        config._send_config_modified_signal()
+
+
+def send_config_modified(config_label, config_pks):
+    """
+    sends ``config_modified`` for each of the specified configs
+    """
+    config_model = apps.get_model(config_label)
+    for i in range(0, len(config_pks), CHUNK_SIZE):
+        configs = config_model.objects.filter(pk__in=config_pks[i:i + CHUNK_SIZE])
+        for config in configs.select_related('device'):
+            config._send_config_modified_signal()
+
+
+def sync_imported_templates(template_label):
+    """
+    updates the templates imported from other instances,
+    meant to be scheduled periodically (see ``sync_templates``)
+    """
+    updated, errors = sync_templates(apps.get_model(template_label))
+    for url, message in errors:
+        logger.warning('Could not update template imported from {0}: {1}'.format(url, message))
+    logger.info('{0} imported templates updated'.format(updated))
+
+
+def check_global_context(config_label):
+    """
+    flags as modified the configurations which use the variables
+    of ``NETJSONCONFIG_CONTEXT`` which changed since the last check
+    (executed after migrations, see ``apps.py``)
+    """
+    config_model = apps.get_model(config_label)
+    context_model = apps.get_model(config_model._meta.app_label, 'ContextVariable')
+    changed = context_model.check_context(config_model)
+    if changed:
+        logger.info('Global context variables changed: {0}'.format(', '.join(sorted(changed))))
+
+
+def generate_vpn_dh(vpn_label, pk, length, dh):
+    """
+    generates the DH parameters of a VPN server which could not be
+    taken from the pool, unless its DH parameters (``dh``) or their
+    length changed in the meantime, then refills the pool
+    """
+    vpn_model = apps.get_model(vpn_label)
+    dh_model = vpn_model.get_dh_model()
+    contents = dh_model.pop(length) or dh_model.generate(length)
+    try:
+        vpn = vpn_model.objects.get(pk=pk, dh_length=length, dh=dh)
+    except vpn_model.DoesNotExist:
+        dh_model.objects.create(length=length, contents=contents)
+    else:
+        vpn.dh = contents
+        vpn.save()
+    dh_model.fill(length)
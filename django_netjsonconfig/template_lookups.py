@@ -0,0 +1,90 @@
+"""
+Cached template lookups
+
+The default templates (looked up whenever a configuration is created)
+and the templates of the tags sent by devices (looked up at each
+registration) are kept in a process-local cache, indexed by the SQL of
+the lookup, which is invalidated when templates or tags change (see
+``connect_signals``) and by the bulk operations which do not send signals
+(``TemplateQuerySet.update`` and the template operations of ``ConfigQuerySet``);
+the version of the cache is stored in the django cache, hence changes
+made by any process invalidate the cache of all the processes which
+share the same django cache.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+VERSION_CACHE_KEY = 'netjsonconfig-template-lookups-version'
+# maximum number of lookups kept in memory
+CACHE_SIZE = 1000
+
+_lookups = OrderedDict()
+_lock = threading.Lock()
+
+
+def _get_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        # the version may have been evicted from the cache
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def get_template_ids(queryset):
+    """
+    returns the primary keys of the templates of
+    ``queryset``, which is executed only if the result
+    is not cached yet or templates have changed since
+    """
+    try:
+        key = (queryset.model._meta.label, str(queryset.query))
+    except EmptyResultSet:
+        return []
+    version = _get_version()
+    with _lock:
+        cached = _lookups.get(key)
+        if cached is not None and cached[0] == version:
+            _lookups.move_to_end(key)
+            return list(cached[1])
+    ids = tuple(queryset.values_list('pk', flat=True))
+    with _lock:
+        _lookups[key] = (version, ids)
+        while len(_lookups) > CACHE_SIZE:
+            _lookups.popitem(last=False)
+    return list(ids)
+
+
+def invalidate(**kwargs):
+    """
+    invalidates the cached lookups of all processes, again
+    after commit (other processes may have cached the lookups
+    before the changes of the current transaction were visible)
+    """
+    _set_version()
+    transaction.on_commit(_set_version)
+
+
+def _set_version():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    with _lock:
+        _lookups.clear()
+
+
+def connect_signals(template_model):
+    """
+    invalidates the cached lookups when templates,
+    tags or their assignments are changed
+    """
+    through = template_model.tags.through
+    tag_model = through._meta.get_field('tag').related_model
+    for model in (template_model, through, tag_model):
+        uid = 'netjsonconfig_template_lookups_{0}'.format(model._meta.label_lower)
+        post_save.connect(invalidate, sender=model, dispatch_uid=uid)
+        post_delete.connect(invalidate, sender=model, dispatch_uid=uid)
@@ -1,12 +1,20 @@
+import io
 import json
+import time
+import zipfile
+from unittest import mock
 
-from django.contrib.auth.models import User
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
 from django.test import TestCase
 from django.urls import reverse
 from django_x509.models import Ca
 
 from . import CreateConfigMixin, TestVpnX509Mixin
+from .. import settings as app_settings
 from ..models import Config, Device, Template, Vpn
+from ..search import has_fts_table
+from ..views import get_editor_url, get_schema_url
 
 
 class TestAdmin(TestVpnX509Mixin, CreateConfigMixin, TestCase):
@@ -213,6 +221,83 @@ class TestAdmin(TestVpnX509Mixin, CreateConfigMixin, TestCase):
         # expect duplicate error
         self.assertContains(response, '<pre class="djnjc-preformatted error')
 
+    def _get_preview_data(self, name):
+        return {
+            'name': name,
+            'mac_address': self.TEST_MAC_ADDRESS,
+            'backend': 'netjsonconfig.OpenWrt',
+            'config': '{}',
+            'csrfmiddlewaretoken': 'test'
+        }
+
+    def test_preview_device_cache(self):
+        path = reverse('admin:django_netjsonconfig_device_preview')
+        data = self._get_preview_data('preview-cache-test')
+        response = self.client.post(path, data)
+        self.assertContains(response, 'preview-cache-test')
+        with mock.patch('netjsonconfig.OpenWrt.render', return_value='mocked-output'):
+            data['csrfmiddlewaretoken'] = 'different'
+            response = self.client.post(path, data)
+            self.assertNotContains(response, 'mocked-output')
+            # different posted data is not cached
+            data['name'] = 'preview-cache-test-2'
+            response = self.client.post(path, data)
+            self.assertContains(response, 'mocked-output')
+
+    def test_preview_device_cache_context(self):
+        path = reverse('admin:django_netjsonconfig_device_preview')
+        data = self._get_preview_data('preview-context-test')
+        response = self.client.post(path, data)
+        self.assertContains(response, 'preview-context-test')
+        with mock.patch('netjsonconfig.OpenWrt.render', return_value='mocked-output'):
+            response = self.client.post(path, data)
+            self.assertNotContains(response, 'mocked-output')
+            # a change of the global context invalidates the cache
+            with mock.patch.dict(app_settings.CONTEXT, {'preview_var': 'changed'}):
+                response = self.client.post(path, data)
+            self.assertContains(response, 'mocked-output')
+
+    def test_preview_device_cache_vpn(self):
+        vpn = self._create_vpn()
+        t = Template(name='vpn-preview-test', type='vpn', vpn=vpn,
+                     backend='netjsonconfig.OpenWrt')
+        t.full_clean()
+        t.save()
+        path = reverse('admin:django_netjsonconfig_device_preview')
+        data = self._get_preview_data('preview-vpn-test')
+        data['templates'] = str(t.pk)
+        response = self.client.post(path, data)
+        self.assertContains(response, 'preview-vpn-test')
+        with mock.patch('netjsonconfig.OpenWrt.render', return_value='mocked-output'):
+            response = self.client.post(path, data)
+            self.assertNotContains(response, 'mocked-output')
+            # a change of the VPN of a template invalidates the cache
+            vpn.name = 'changed'
+            vpn.save()
+            response = self.client.post(path, data)
+            self.assertContains(response, 'mocked-output')
+
+    def test_preview_device_timeout(self):
+        path = reverse('admin:django_netjsonconfig_device_preview')
+        app_settings.PREVIEW_TIMEOUT = 0.5
+        try:
+            with mock.patch('netjsonconfig.OpenWrt.render', side_effect=lambda: time.sleep(5)):
+                response = self.client.post(path, self._get_preview_data('preview-timeout-test'))
+        finally:
+            app_settings.PREVIEW_TIMEOUT = 10
+        self.assertContains(response, 'Preview timed out after 0.5 seconds', status_code=504)
+
+    def test_preview_device_memory_limit(self):
+        path = reverse('admin:django_netjsonconfig_device_preview')
+        app_settings.PREVIEW_MEMORY_LIMIT = 64 * 1024 * 1024
+        try:
+            with mock.patch('netjsonconfig.OpenWrt.render',
+                            side_effect=lambda: ' ' * 1024 * 1024 * 1024):
+                response = self.client.post(path, self._get_preview_data('preview-memory-test'))
+        finally:
+            app_settings.PREVIEW_MEMORY_LIMIT = 256 * 1024 * 1024
+        self.assertContains(response, 'Preview exceeded the memory limit', status_code=500)
+
     def test_preview_device_405(self):
         path = reverse('admin:django_netjsonconfig_device_preview')
         response = self.client.get(path, {})
@@ -284,6 +369,308 @@ class TestAdmin(TestVpnX509Mixin, CreateConfigMixin, TestCase):
         response = self.client.get(path, {'q': 'ZERO-RESULTS-PLEASE'})
         self.assertNotContains(response, 'admin-search-test')
 
+    def test_device_search_exact_lookups(self):
+        d = self._create_device(name='exact-search-test', mac_address='00:11:22:AA:BB:CC')
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        for value in ['00-11-22-aa-bb-cc', '001122aabbcc', '0011.22aa.bbcc', str(d.pk), d.key]:
+            response = self.client.get(path, {'q': value})
+            self.assertEqual(list(response.context['cl'].result_list), [d])
+
+    def test_device_search_index(self):
+        self.assertTrue(has_fts_table(Device))
+        d = self._create_device(name='indexed-search-test', os='OpenWrt 18.06')
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        response = self.client.get(path, {'q': 'indexed-sea'})
+        self.assertEqual(list(response.context['cl'].result_list), [d])
+        response = self.client.get(path, {'q': 'openwrt 18'})
+        self.assertEqual(list(response.context['cl'].result_list), [d])
+        # index is kept in sync
+        d.name = 'renamed-device'
+        d.save()
+        response = self.client.get(path, {'q': 'indexed'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+        response = self.client.get(path, {'q': 'renamed'})
+        self.assertEqual(list(response.context['cl'].result_list), [d])
+        d.delete()
+        response = self.client.get(path, {'q': 'renamed'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def _create_devices(self, number):
+        devices = []
+        for i in range(number):
+            devices.append(self._create_device(name='scalable-{0}'.format(i),
+                                               mac_address='00:11:22:33:44:{0:02x}'.format(i)))
+        return devices
+
+    def test_scalable_device_list_pagination(self):
+        self._create_devices(3)
+        devices = list(Device.objects.order_by('-created', '-pk'))
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        device_admin = admin.site._registry[Device]
+        app_settings.SCALABLE_DEVICE_LIST = True
+        device_admin.list_per_page = 2
+        try:
+            response = self.client.get(path)
+            cl = response.context['cl']
+            self.assertEqual(cl.result_list, devices[:2])
+            self.assertEqual(cl.result_count, 3)
+            self.assertContains(response, 'class="next"')
+            self.assertNotContains(response, 'class="first"')
+            # follow the cursor of the last row
+            response = self.client.get(path + cl.next_page_url)
+            self.assertEqual(response.context['cl'].result_list, devices[2:])
+            self.assertContains(response, 'class="first"')
+            self.assertNotContains(response, 'class="next"')
+        finally:
+            app_settings.SCALABLE_DEVICE_LIST = False
+            del device_admin.list_per_page
+
+    def test_scalable_device_list_invalid_cursor(self):
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        app_settings.SCALABLE_DEVICE_LIST = True
+        try:
+            response = self.client.get(path, {'cursor': 'invalid'})
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('e=1', response.url)
+        finally:
+            app_settings.SCALABLE_DEVICE_LIST = False
+
+    def test_scalable_device_list_filters(self):
+        t = Template.objects.first()
+        d1 = self._create_device(name='filter-1', mac_address='00:11:22:33:44:01')
+        c = self._create_config(device=d1)
+        c.templates.add(t)
+        d2 = self._create_device(name='filter-2', mac_address='00:11:22:33:44:02')
+        self._create_config(device=d2, backend='netjsonconfig.OpenWisp')
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        app_settings.SCALABLE_DEVICE_LIST = True
+        try:
+            response = self.client.get(path)
+            self.assertContains(response, 'data-autocomplete-url')
+            self.assertContains(response, 'input-filter.js')
+            self.assertNotContains(response, '?config__templates__id__exact')
+            response = self.client.get(path, {'template': t.name})
+            self.assertEqual(response.context['cl'].result_list, [d1])
+            response = self.client.get(path, {'backend': 'netjsonconfig.OpenWisp'})
+            self.assertEqual(response.context['cl'].result_list, [d2])
+        finally:
+            app_settings.SCALABLE_DEVICE_LIST = False
+
+    def test_template_autocomplete(self):
+        t = Template.objects.first()
+        path = reverse('admin:django_netjsonconfig_device_template_autocomplete')
+        response = self.client.get(path, {'q': t.name[1:4].upper()})
+        self.assertIn(t.name, response.json()['results'])
+        response = self.client.get(path, {'q': 'ZERO-RESULTS-PLEASE'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_device_templates_autocomplete_widget(self):
+        t1, t2 = Template.objects.order_by('name')
+        default = Template.objects.create(name='default-template', default=True,
+                                          backend='netjsonconfig.OpenWrt',
+                                          config={'general': {}})
+        d = self._create_device()
+        c = self._create_config(device=d)
+        c.templates.add(t2)
+        path = reverse('admin:django_netjsonconfig_device_change', args=[d.pk])
+        response = self.client.get(path)
+        self.assertContains(response, 'sortedm2m-autocomplete.js')
+        options_path = reverse('admin:django_netjsonconfig_template_options')
+        self.assertContains(response, 'data-url="{0}"'.format(options_path))
+        self.assertContains(response, 'value="{0}"'.format(t2.pk))
+        self.assertNotContains(response, 'value="{0}"'.format(t1.pk))
+        # default templates are rendered in the add form
+        response = self.client.get(reverse('admin:django_netjsonconfig_device_add'))
+        self.assertContains(response, 'value="{0}"'.format(default.pk))
+        self.assertNotContains(response, 'value="{0}"'.format(t1.pk))
+
+    def test_template_options(self):
+        t1, t2 = Template.objects.order_by('name')
+        path = reverse('admin:django_netjsonconfig_template_options')
+        response = self.client.get(path, {'q': t1.name.upper()})
+        self.assertEqual(response.json(), {
+            'results': [{'id': str(t1.pk), 'text': t1.name}],
+            'more': False,
+            'after': None
+        })
+        response = self.client.get(path, {'backend': 'netjsonconfig.OpenWisp'})
+        self.assertEqual(response.json()['results'], [])
+        template_admin = admin.site._registry[Template]
+        template_admin.options_page_size = 1
+        try:
+            response = self.client.get(path, {'backend': 'netjsonconfig.OpenWrt'})
+            self.assertEqual(response.json()['results'], [{'id': str(t1.pk), 'text': t1.name}])
+            self.assertTrue(response.json()['more'])
+            self.assertEqual(response.json()['after'], t1.name)
+            response = self.client.get(path, {'after': t1.name})
+            self.assertEqual(response.json()['results'], [{'id': str(t2.pk), 'text': t2.name}])
+            self.assertFalse(response.json()['more'])
+        finally:
+            del template_admin.options_page_size
+
+    def _login_operator(self):
+        user = User.objects.create_user(username='operator',
+                                        password='tester',
+                                        email='operator@admin.com',
+                                        is_staff=True)
+        self.client.login(username='operator', password='tester')
+        return user
+
+    def test_template_autocomplete_permissions(self):
+        t1, t2 = Template.objects.order_by('name')
+        path = reverse('admin:django_netjsonconfig_device_template_autocomplete')
+        user = self._login_operator()
+        self.assertEqual(self.client.get(path).status_code, 403)
+        user.user_permissions.add(Permission.objects.get(codename='view_template'))
+        response = self.client.get(path)
+        self.assertEqual(response.json()['results'], [t1.name, t2.name])
+
+    def test_template_options_permissions(self):
+        path = reverse('admin:django_netjsonconfig_template_options')
+        user = self._login_operator()
+        self.assertEqual(self.client.get(path).status_code, 403)
+        user.user_permissions.add(Permission.objects.get(codename='view_template'))
+        response = self.client.get(path)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_template_vpn_autocomplete(self):
+        path = reverse('admin:django_netjsonconfig_template_add')
+        response = self.client.get(path)
+        self.assertContains(response, 'admin-autocomplete')
+
+    def test_export_configs_action(self):
+        t = Template.objects.get(name='dhcp')
+        d1 = self._create_device(name='export-1', mac_address='00:11:22:33:44:01')
+        c1 = self._create_config(device=d1)
+        c1.templates.add(t)
+        d2 = self._create_device(name='export-2', mac_address='00:11:22:33:44:02')
+        self._create_config(device=d2)
+        # devices without configuration are skipped
+        d3 = self._create_device(name='export-3', mac_address='00:11:22:33:44:03')
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        response = self.client.post(path, {
+            'action': 'export_configs',
+            '_selected_action': [str(d1.pk), str(d2.pk), str(d3.pk)]
+        })
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('configurations.zip', response['Content-Disposition'])
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(sorted(archive.namelist()), ['export-1.tar.gz', 'export-2.tar.gz'])
+        c1 = Config.objects.get(pk=c1.pk)
+        self.assertEqual(archive.read('export-1.tar.gz'), c1.generate().getvalue())
+
+    def test_schema_urls(self):
+        response = self.client.get(reverse('admin:django_netjsonconfig_template_add'))
+        self.assertContains(response, get_schema_url('netjsonconfig.OpenWrt'))
+
+    def test_deferred_editor(self):
+        path = reverse('admin:django_netjsonconfig_template_add')
+        response = self.client.get(path)
+        self.assertContains(response, 'lib/advanced-mode.js')
+        self.assertNotContains(response, 'json-editor-btn-load')
+        app_settings.DEFERRED_EDITOR = True
+        try:
+            response = self.client.get(path)
+        finally:
+            app_settings.DEFERRED_EDITOR = False
+        self.assertNotContains(response, 'lib/advanced-mode.js')
+        self.assertContains(response, 'js/widget.js')
+        self.assertContains(response, 'json-editor-btn-load')
+        self.assertContains(response, get_editor_url())
+
+    def test_changelist_defer_json(self):
+        self._create_config(device=self._create_device())
+        response = self.client.get(reverse('admin:django_netjsonconfig_device_changelist'))
+        config = response.context['cl'].result_list[0].config
+        self.assertEqual(config.get_deferred_fields(), {'config', 'context'})
+        response = self.client.get(reverse('admin:django_netjsonconfig_template_changelist'))
+        template = response.context['cl'].result_list[0]
+        self.assertTrue({'config', 'variable'}.issubset(template.get_deferred_fields()))
+
+    def test_config_template_actions(self):
+        t = Template.objects.get(name='dhcp')
+        d1 = self._create_device(name='action-1', mac_address='00:11:22:33:44:01')
+        c1 = self._create_config(device=d1)
+        d2 = self._create_device(name='action-2', mac_address='00:11:22:33:44:02')
+        c2 = self._create_config(device=d2)
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        data = {
+            'action': 'add_template',
+            'template': t.name,
+            '_selected_action': [str(d1.pk), str(d2.pk)]
+        }
+        response = self.client.post(path, data, follow=True)
+        self.assertContains(response, '2 configurations have been modified')
+        self.assertEqual(list(c1.templates.all()), [t])
+        self.assertEqual(list(c2.templates.all()), [t])
+        data['action'] = 'remove_template'
+        data['_selected_action'] = [str(d1.pk)]
+        self.client.post(path, data)
+        self.assertEqual(list(c1.templates.all()), [])
+        self.assertEqual(list(c2.templates.all()), [t])
+        data['template'] = 'wrong'
+        response = self.client.post(path, data, follow=True)
+        self.assertContains(response, 'Template &quot;wrong&quot; does not exist')
+
+    def test_template_add_to_existing_configs_action(self):
+        t = Template.objects.get(name='dhcp')
+        c = self._create_config(device=self._create_device())
+        self._create_config(device=self._create_device(name='openwisp',
+                                                       mac_address='00:11:22:33:44:01'),
+                            backend='netjsonconfig.OpenWisp')
+        path = reverse('admin:django_netjsonconfig_template_changelist')
+        response = self.client.post(path, {
+            'action': 'add_to_existing_configs',
+            '_selected_action': [str(t.pk)]
+        }, follow=True)
+        self.assertContains(response, '1 configurations have been modified')
+        self.assertEqual(list(t.config_relations.all()), [c])
+
+    def _login_view_only(self):
+        user = User.objects.create_user(username='viewer',
+                                        password='tester',
+                                        email='viewer@admin.com',
+                                        is_staff=True)
+        user.user_permissions.add(*Permission.objects.filter(codename__in=['view_device',
+                                                                           'view_template']))
+        self.client.login(username='viewer', password='tester')
+
+    def test_config_actions_view_only(self):
+        t = Template.objects.get(name='dhcp')
+        d = self._create_device()
+        c = self._create_config(device=d)
+        self._login_view_only()
+        path = reverse('admin:django_netjsonconfig_device_changelist')
+        response = self.client.get(path)
+        # no action is available
+        self.assertIsNone(response.context['action_form'])
+        response = self.client.post(path, {
+            'action': 'export_configs',
+            '_selected_action': [str(d.pk)]
+        })
+        # the action is not run, no archive is returned
+        self.assertFalse(response.has_header('Content-Disposition'))
+        self.assertNotEqual(response['Content-Type'], 'application/zip')
+        response = self.client.post(path, {
+            'action': 'add_template',
+            'template': t.name,
+            '_selected_action': [str(d.pk)]
+        }, follow=True)
+        self.assertNotContains(response, 'configurations have been modified')
+        self.assertEqual(list(c.templates.all()), [])
+
+    def test_template_actions_view_only(self):
+        t = Template.objects.get(name='dhcp')
+        self._create_config(device=self._create_device())
+        self._login_view_only()
+        path = reverse('admin:django_netjsonconfig_template_changelist')
+        response = self.client.post(path, {
+            'action': 'add_to_existing_configs',
+            '_selected_action': [str(t.pk)]
+        }, follow=True)
+        self.assertNotContains(response, 'configurations have been modified')
+        self.assertEqual(t.config_relations.count(), 0)
+
     def test_default_template_backend(self):
         path = reverse('admin:django_netjsonconfig_template_add')
         response = self.client.get(path)
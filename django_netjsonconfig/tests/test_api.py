@@ -0,0 +1,215 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import CreateTemplateMixin
+from .. import settings as app_settings
+from ..models import Template
+from ..search import FTS_TRIGGERS, get_fts_table, has_fts_table, repair_fts_table
+from ..sharing import update_catalog
+
+SEARCH_URL = reverse('api:search_template')
+
+
+class TestApi(CreateTemplateMixin, TestCase):
+    """
+    tests for django_netjsonconfig.api
+    """
+    template_model = Template
+
+    def setUp(self):
+        cache.clear()
+
+    def _create_public_template(self, **kwargs):
+        options = {
+            'flag': 'public',
+            'description': 'public template',
+            'notes': 'notes',
+            'variable': {'ssid': 'test'}
+        }
+        options.update(kwargs)
+        return self._create_template(**options)
+
+    def _search(self, **params):
+        response = self.client.get(SEARCH_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_search_public_only(self):
+        self._create_template(name='private')
+        self._create_public_template(name='public')
+        results = self._search()['results']
+        self.assertEqual([t['name'] for t in results], ['public'])
+
+    def test_search_default_fields(self):
+        t = self._create_public_template(name='mesh')
+        t.tags.add('wifi')
+        result = self._search()['results'][0]
+        self.assertNotIn('config', result)
+        self.assertNotIn('variable', result)
+        self.assertNotIn('notes', result)
+        self.assertEqual(result['tags'], ['wifi'])
+        self.assertEqual(result['description'], 'public template')
+
+    def test_search_fields(self):
+        self._create_public_template(name='mesh')
+        result = self._search(fields='name,config,notes')['results'][0]
+        self.assertEqual(set(result.keys()), {'name', 'config'})
+        self.assertEqual(result['config']['interfaces'][0]['name'], 'eth0')
+
+    def test_search_ranked(self):
+        self.assertTrue(has_fts_table(Template))
+        for name in ('ap', 'router', 'vpn', 'firewall'):
+            self._create_public_template(name=name)
+        self._create_public_template(name='generic', description='mesh network setup')
+        self._create_public_template(name='mesh-node', description='node setup')
+        self._create_public_template(name='wds', description='wireless distribution')
+        t = self._create_public_template(name='tagged', description='unrelated')
+        t.tags.add('mesh')
+        results = self._search(q='mesh')['results']
+        self.assertEqual([t['name'] for t in results], ['mesh-node', 'generic', 'tagged'])
+        self.assertEqual(self._search(q='wireless distrib')['results'][0]['name'], 'wds')
+        self.assertEqual(self._search(q='nothing')['results'], [])
+        self.assertEqual(self._search(q='"*')['results'], [])
+
+    def test_search_ranked_pagination(self):
+        for i in range(4):
+            self._create_public_template(name='mesh-{0}'.format(i),
+                                         description='mesh ' * i + 'network')
+        t = self._create_public_template(name='tagged', description='unrelated')
+        t.tags.add('mesh')
+        expected = [t['name'] for t in self._search(q='mesh')['results']]
+        self.assertEqual(len(expected), 5)
+        data = self._search(q='mesh', page_size=2)
+        names = [t['name'] for t in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            names += [t['name'] for t in data['results']]
+        self.assertEqual(names, expected)
+
+    def test_search_repair_fts_table(self):
+        self._create_public_template(name='mesh')
+        with connection.cursor() as cursor:
+            for suffix in FTS_TRIGGERS:
+                cursor.execute('DROP TRIGGER {0}_{1}'.format(get_fts_table(Template), suffix))
+        self._create_public_template(name='mesh-node')
+        self.assertEqual(len(self._search(q='mesh')['results']), 1)
+        cache.clear()
+        self.assertTrue(repair_fts_table(Template))
+        self.assertFalse(repair_fts_table(Template))
+        self.assertEqual(len(self._search(q='mesh')['results']), 2)
+        Template.objects.filter(name='mesh').update(name='wds')
+        cache.clear()
+        self.assertEqual(len(self._search(q='mesh')['results']), 1)
+
+    def test_search_legacy_filters(self):
+        self._create_public_template(name='mesh', description='mesh network')
+        self._create_public_template(name='wds', description='wireless distribution')
+        self.assertEqual(len(self._search(name='mes')['results']), 1)
+        self.assertEqual(len(self._search(des='wireless')['results']), 1)
+
+    def test_search_pagination(self):
+        for i in range(5):
+            self._create_public_template(name='template-{0}'.format(i))
+        data = self._search(page_size=2)
+        names = [t['name'] for t in data['results']]
+        while data['next']:
+            response = self.client.get(data['next'])
+            data = response.json()
+            names += [t['name'] for t in data['results']]
+        self.assertEqual(names, ['template-{0}'.format(i) for i in range(5)])
+
+    def test_search_cache(self):
+        self._create_public_template(name='cached')
+        self._search()
+        with self.assertNumQueries(0):
+            self._search()
+        Template.objects.filter(name='cached').delete()
+        self.assertEqual(len(self._search()['results']), 1)
+        timeout = app_settings.SEARCH_CACHE_TIMEOUT
+        app_settings.SEARCH_CACHE_TIMEOUT = 0
+        try:
+            self.assertEqual(self._search()['results'], [])
+        finally:
+            app_settings.SEARCH_CACHE_TIMEOUT = timeout
+
+    @override_settings(ALLOWED_HOSTS=['a.example.com', 'b.example.com'])
+    def test_search_cache_host(self):
+        for name in ('mesh', 'wds'):
+            self._create_public_template(name=name)
+        for host in ('a.example.com', 'b.example.com'):
+            response = self.client.get(SEARCH_URL, {'page_size': 1}, HTTP_HOST=host)
+            self.assertTrue(response.json()['next'].startswith('http://{0}/'.format(host)))
+
+    def _get_document(self, template, **headers):
+        url = reverse('api:template_distribution', args=[template.key])
+        return self.client.get(url, **headers)
+
+    def test_template_distribution(self):
+        t = self._create_public_template(name='shared')
+        t.tags.add('wifi')
+        response = self._get_document(t)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['name'], 'shared')
+        self.assertEqual(data['tags'], ['wifi'])
+        self.assertEqual(data['config']['interfaces'][0]['name'], 'eth0')
+        self.assertEqual(data['variable'], {'ssid': 'test'})
+        self.assertTrue(data['url'].endswith('{0}.json'.format(t.key)))
+        self.assertNotIn('notes', data)
+        etag = response['ETag']
+        with self.assertNumQueries(2):
+            response = self._get_document(t, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self._get_document(t, HTTP_IF_NONE_MATCH='W/{0}'.format(etag))
+        self.assertEqual(response.status_code, 304)
+        response = self._get_document(t, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content).decode()), data)
+        t.tags.add('mesh')
+        self.assertNotEqual(self._get_document(t)['ETag'], etag)
+
+    def test_template_distribution_flags(self):
+        t = self._create_public_template(name='secret', flag='shared_secret')
+        response = self._get_document(t)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        t = self._create_template(name='private')
+        self.assertEqual(self._get_document(t).status_code, 404)
+
+    def test_build_template_catalog(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        t1 = self._create_public_template(name='mesh')
+        t2 = self._create_public_template(name='wds')
+        self._create_template(name='private')
+        out = StringIO()
+        call_command('build_template_catalog', path, base_url='http://example.com/catalog/', stdout=out)
+        self.assertIn('2 templates written', out.getvalue())
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)['templates']
+        self.assertEqual([e['name'] for e in index], ['mesh', 'wds'])
+        self.assertEqual(index[0]['url'], 'http://example.com/catalog/templates/{0}.json'.format(t1.key))
+        filename = os.path.join(path, 'templates', '{0}.json'.format(t1.key))
+        with open(filename) as f:
+            self.assertEqual(json.load(f)['config']['interfaces'][0]['name'], 'eth0')
+        with gzip.open('{0}.gz'.format(filename)) as f:
+            self.assertEqual(json.loads(f.read().decode())['name'], 'mesh')
+        t2.flag = 'private'
+        t2.save()
+        t1.tags.add('mesh')
+        with self.assertNumQueries(4):
+            written, removed = update_catalog(Template, path, 'http://example.com/catalog/')
+        self.assertEqual((written, removed), (1, 1))
+        self.assertFalse(os.path.exists(os.path.join(path, 'templates', '{0}.json'.format(t2.key))))
+        self.assertEqual(update_catalog(Template, path, 'http://example.com/catalog/'), (0, 0))
@@ -1,16 +1,32 @@
+import os
+import tarfile
+import tempfile
+from collections import OrderedDict
 from copy import deepcopy
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
+from django.apps import apps
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.db.transaction import atomic
 from django.test import TestCase
-from django_x509.models import Ca
+from django.test.utils import CaptureQueriesContext
+from django_x509.models import Ca, Cert
 
 from netjsonconfig import OpenWrt
 
 from . import CreateConfigMixin, CreateTemplateMixin, TestVpnX509Mixin
 from .. import settings as app_settings
-from ..models import Config, Device, Template, Vpn
+from ..fields import RawJSON
+from ..models import Config, ContextVariable, Device, Template, Vpn, VpnClient
+from ..signals import config_modified, configs_modified
+from ..tasks import check_global_context, iter_chunks, iter_pk_chunks, send_config_modified
+from ..template_lookups import get_template_ids
+from ..variables import evaluate, get_compiled_template
 
 
 class TestConfig(CreateConfigMixin, CreateTemplateMixin,
@@ -165,6 +181,26 @@ class TestConfig(CreateConfigMixin, CreateTemplateMixin,
         c.save()
         self.assertEqual(c.status, 'modified')
 
+    def test_status_modified_after_in_place_change(self):
+        c = self._create_config(status='applied')
+        c = Config.objects.get(pk=c.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(c.has_changed('backend', 'config', 'context'))
+            c.config['general']['description'] = 'test'
+            self.assertTrue(c.has_changed('config'))
+        c.full_clean()
+        c.save()
+        self.assertEqual(c.status, 'modified')
+        self.assertFalse(c.has_changed('config'))
+
+    def test_status_unchanged_after_save(self):
+        c = self._create_config(status='applied')
+        c = Config.objects.get(pk=c.pk)
+        c.full_clean()
+        c.save()
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'applied')
+
     def test_status_modified_after_templates_changed(self):
         c = self._create_config(status='applied')
         self.assertEqual(c.status, 'applied')
@@ -181,7 +217,8 @@ class TestConfig(CreateConfigMixin, CreateTemplateMixin,
         self.assertEqual(c.status, 'modified')
 
     def test_status_modified_after_context_changed(self):
-        c = self._create_config(status='applied')
+        c = self._create_config(status='applied',
+                                config={'general': {'description': '{{ lan_ipv4 }}'}})
         self.assertEqual(c.status, 'applied')
         c.refresh_from_db()
         c.context = {'lan_ipv4': '192.168.40.1'}
@@ -189,6 +226,28 @@ class TestConfig(CreateConfigMixin, CreateTemplateMixin,
         c.save()
         self.assertEqual(c.status, 'modified')
 
+    def test_status_unchanged_after_unused_context_changed(self):
+        c = self._create_config(status='applied')
+        c.refresh_from_db()
+        c.context = {'lan_ipv4': '192.168.40.1'}
+        c.full_clean()
+        c.save()
+        self.assertEqual(c.status, 'applied')
+
+    def test_status_unchanged_after_keys_reordered(self):
+        config = OrderedDict([('general', {}),
+                              ('interfaces', [OrderedDict([('name', 'eth0'),
+                                                           ('type', 'ethernet')])])])
+        c = self._create_config(status='applied', config=config)
+        c.refresh_from_db()
+        c.config = OrderedDict([('interfaces', [OrderedDict([('type', 'ethernet'),
+                                                             ('name', 'eth0')])]),
+                                ('general', {})])
+        self.assertTrue(c.has_changed('config'))
+        c.full_clean()
+        c.save()
+        self.assertEqual(c.status, 'applied')
+
     def test_auto_hostname(self):
         c = self._create_config(device=self._create_device(name='automate-me'))
         expected = {'general': {'hostname': 'automate-me'}}
@@ -227,6 +286,139 @@ class TestConfig(CreateConfigMixin, CreateTemplateMixin,
         vpnserver1 = settings.NETJSONCONFIG_CONTEXT['vpnserver1']
         self.assertIn(vpnserver1, output)
 
+    def test_template_variables(self):
+        t = self._create_template(name='variables',
+                                  config={'general': {'description': '{{ name }} {{ ssid }} {{ missing }}'},
+                                          'files': [{'path': '/etc/{{ ssid }}',
+                                                     'mode': '0644',
+                                                     'contents': 'static'}]},
+                                  variable={'ssid': 'default-ssid'})
+        c = self._create_config(device=self._create_device(name='variables-test'))
+        c.templates.add(t)
+        config = c.get_backend_instance().config
+        self.assertEqual(config['general']['description'], 'variables-test default-ssid {{ missing }}')
+        self.assertEqual(config['files'][0]['path'], '/etc/default-ssid')
+        # the context overrides the default values
+        c.context = {'ssid': 'device-ssid'}
+        self.assertIn('/etc/device-ssid', c.get_backend_instance().render())
+        # templates are not modified
+        self.assertEqual(t.config['files'][0]['path'], '/etc/{{ ssid }}')
+
+    def test_compiled_template_config(self):
+        config = OrderedDict([('general', {'description': 'static'}),
+                              ('files', [{'path': '/etc/static', 'mode': '0644', 'contents': 'static'},
+                                         {'path': '/etc/dynamic', 'mode': '0644',
+                                          'contents': 'iface={{ iface }}'}])])
+        t = self._create_template(name='compiled', config=config)
+        compiled = get_compiled_template(t)
+        self.assertIs(get_compiled_template(Template.objects.get(pk=t.pk)), compiled)
+        self.assertEqual(compiled.variables, {'iface'})
+        self.assertEqual(compiled.locations, ((('files', 1, 'contents'), {'iface'}),))
+        result = evaluate(t.config, compiled, {'iface': 'eth1'})
+        self.assertEqual(result['files'][1]['contents'], 'iface=eth1')
+        # only the containers of placeholders are copied
+        self.assertIs(result['general'], t.config['general'])
+        self.assertIs(result['files'][0], t.config['files'][0])
+        self.assertEqual(t.config['files'][1]['contents'], 'iface={{ iface }}')
+        self.assertIs(evaluate(t.config, compiled, {'other': 'value'}), t.config)
+        t.config['general']['description'] = '{{ other }}'
+        t.full_clean()
+        t.save()
+        self.assertEqual(get_compiled_template(t).variables, {'iface', 'other'})
+
+    def test_compiled_template_changed_without_save(self):
+        config = {'general': {'description': '{{ a }}'}}
+        t = self._create_template(name='compiled', config=config)
+        self.assertEqual(get_compiled_template(t).variables, {'a'})
+        Template.objects.filter(pk=t.pk).update(config={'general': {}})
+        t.refresh_from_db(fields=['config'])
+        compiled = get_compiled_template(t)
+        self.assertEqual(compiled.variables, set())
+        self.assertEqual(evaluate(t.config, compiled, {'a': 'value'}), {'general': {}})
+        # changes in memory
+        t.config = {'files': [{'path': '/a', 'mode': '0644', 'contents': '{{ b }}'}]}
+        compiled = get_compiled_template(t)
+        result = evaluate(t.config, compiled, {'b': 'value'})
+        self.assertEqual(result['files'][0]['contents'], 'value')
+
+    def test_template_variable_migration(self):
+        migration = import_module('django_netjsonconfig.migrations.0057_flag_template_variable_configs')
+        t = self._create_template(name='defaults',
+                                  config={'general': {'description': '{{ a }}'}},
+                                  variable={'a': 'default'})
+        c = self._create_config(device=self._create_device(name='defaults'))
+        c.templates.add(t)
+        c2 = self._create_config(device=self._create_device(name='other',
+                                                            mac_address='00:11:22:33:44:99'))
+        c2.templates.add(Template.objects.get(name='dhcp'))
+        Config.objects.update(status='applied')
+        migration.flag_configs(apps, None)
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'modified')
+        c2.refresh_from_db()
+        self.assertEqual(c2.status, 'applied')
+
+    def _get_used_variables(self, obj):
+        return set(obj.used_variables.values_list('name', flat=True))
+
+    def test_variables_index(self):
+        t = self._create_template(name='variables',
+                                  config={'general': {'description': '{{ b }} {{a}}'}})
+        self.assertEqual(self._get_used_variables(t), {'a', 'b'})
+        c = self._create_config(device=self._create_device(name='variables-test'))
+        self.assertEqual(self._get_used_variables(c), set())
+        c.config = {'general': {'description': '{{ c }}'}}
+        c.save(update_fields=['config'])
+        self.assertEqual(self._get_used_variables(c), {'c'})
+        c.config = {'general': {'description': '{{ d }} {{ c }}'}}
+        c.save()
+        self.assertEqual(self._get_used_variables(c), {'c', 'd'})
+        c.templates.add(t)
+        self.assertEqual(list(Config.objects.using_variables(['a'])), [c])
+        self.assertEqual(list(Config.objects.using_variables(['c', 'b'])), [c])
+        self.assertEqual(Config.objects.using_variables(['other', 'ab']).count(), 0)
+        # unchanged configurations are not indexed again
+        c.status = 'applied'
+        with CaptureQueriesContext(connection) as queries:
+            c.save(update_fields=['status'])
+        table = c.used_variables.model._meta.db_table
+        self.assertFalse([q for q in queries.captured_queries if table in q['sql']])
+
+    def test_check_global_context(self):
+        t = self._create_template(name='variables',
+                                  config={'general': {'description': '{{ ssid }}'}})
+        c1 = self._create_config(device=self._create_device(name='context1'))
+        c1.templates.add(t)
+        c1.set_status_applied()
+        c2 = self._create_config(device=self._create_device(name='context2',
+                                                            mac_address='00:11:22:33:44:56'))
+        c2.set_status_applied()
+        # the checksums of the current context are stored after migrations
+        self.assertEqual(ContextVariable.check_context(Config), set())
+        self.assertEqual(ContextVariable.check_context(Config, {'ssid': 'test', 'vpnserver1': 'x'}),
+                         {'ssid', 'vpnserver1'})
+        c1.refresh_from_db()
+        self.assertEqual(c1.status, 'modified')
+        c2.refresh_from_db()
+        self.assertEqual(c2.status, 'applied')
+        c1.set_status_applied()
+        self.assertEqual(ContextVariable.check_context(Config, {'ssid': 'test', 'vpnserver1': 'x'}),
+                         set())
+        self.assertEqual(ContextVariable.check_context(Config, {'vpnserver1': 'x'}), {'ssid'})
+        self.assertEqual(ContextVariable.objects.count(), 1)
+        c1.refresh_from_db()
+        self.assertEqual(c1.status, 'modified')
+        check_global_context(Config._meta.label)
+        self.assertEqual(ContextVariable.check_context(Config), set())
+
+    def test_check_context_command(self):
+        stdout = StringIO()
+        call_command('check_context', stdout=stdout)
+        self.assertIn('No context variables changed', stdout.getvalue())
+        with mock.patch.dict(app_settings.CONTEXT, {'new_var': 'value'}):
+            call_command('check_context', stdout=stdout)
+        self.assertIn('Changed context variables: new_var', stdout.getvalue())
+
     def test_mac_address_as_hostname(self):
         c = self._create_config(device=self._create_device(name='00:11:22:33:44:55'))
         self.assertIn('00-11-22-33-44-55', c.backend_instance.render())
@@ -318,6 +510,160 @@ class TestConfig(CreateConfigMixin, CreateTemplateMixin,
         self.assertIsNone(vpnclient.cert)
         self.assertEqual(c.vpnclient_set.count(), 1)
 
+    def test_create_cert_lazy(self):
+        app_settings.LAZY_AUTO_CERT = True
+        try:
+            vpn = self._create_vpn()
+            t = self._create_template(type='vpn', auto_cert=True, vpn=vpn, config={})
+            c = self._create_config(device=self._create_device(name='test-create-cert'))
+            c.templates.add(t)
+            vpnclient = c.vpnclient_set.first()
+            self.assertTrue(vpnclient.cert_pending)
+            self.assertIsNone(vpnclient.cert)
+            cert_contents_key = 'cert_contents_{0}'.format(vpn.pk.hex)
+            self.assertNotIn(cert_contents_key, c.get_context())
+            c.generate()
+        finally:
+            app_settings.LAZY_AUTO_CERT = False
+        vpnclient.refresh_from_db()
+        self.assertFalse(vpnclient.cert_pending)
+        self.assertIsNotNone(vpnclient.cert)
+        self.assertIn(cert_contents_key, c.get_context())
+        self.assertIn(vpnclient.cert.certificate, c.backend_instance.render())
+
+    def test_create_cert_lazy_disabled(self):
+        app_settings.LAZY_AUTO_CERT = True
+        try:
+            vpn = self._create_vpn()
+            t = self._create_template(type='vpn', auto_cert=True, vpn=vpn, config={})
+            c = self._create_config(device=self._create_device(name='test-create-cert'))
+            c.templates.add(t)
+        finally:
+            app_settings.LAZY_AUTO_CERT = False
+        c = Config.objects.get(pk=c.pk)
+        with mock.patch.object(Config, 'issue_pending_vpn_certs') as issue_pending_vpn_certs:
+            c.generate()
+        issue_pending_vpn_certs.assert_not_called()
+        self.assertTrue(c.vpnclient_set.first().cert_pending)
+
+    def test_add_vpn_templates_bulk(self):
+        vpn1 = self._create_vpn(name='vpn1')
+        vpn2 = self._create_vpn(name='vpn2', ca=vpn1.ca)
+        t1 = self._create_template(name='vpn1', type='vpn', auto_cert=False, vpn=vpn1)
+        t2 = self._create_template(name='vpn2', type='vpn', auto_cert=False, vpn=vpn2)
+        c = self._create_config(device=self._create_device(name='test-bulk-clients'))
+        c.templates.add(t1)
+        with mock.patch.object(VpnClient, 'save') as save:
+            c.templates.add(t2)
+        save.assert_not_called()
+        self.assertEqual(set(c.vpnclient_set.values_list('vpn_id', flat=True)), {vpn1.pk, vpn2.pk})
+        with mock.patch.object(VpnClient, 'save') as save:
+            c.templates.add(t1, t2)
+        save.assert_not_called()
+        self.assertEqual(c.vpnclient_set.count(), 2)
+
+    def test_create_cert_lazy_already_issued(self):
+        app_settings.LAZY_AUTO_CERT = True
+        try:
+            vpn = self._create_vpn()
+            t = self._create_template(type='vpn', auto_cert=True, vpn=vpn)
+            c = self._create_config(device=self._create_device(name='test-create-cert'))
+            c.templates.add(t)
+        finally:
+            app_settings.LAZY_AUTO_CERT = False
+        stale = c.vpnclient_set.first()
+        vpnclient = c.vpnclient_set.first()
+        cert = vpnclient.issue_cert()
+        cert_model = cert.__class__
+        # another process issued the certificate first
+        self.assertEqual(stale.issue_cert(), cert)
+        self.assertEqual(cert_model.objects.filter(name=c.device.name).count(), 1)
+        c.templates.clear()
+        self.assertEqual(cert_model.objects.filter(pk=cert.pk).count(), 0)
+
+    def test_delete_lazy_pending_cert(self):
+        app_settings.LAZY_AUTO_CERT = True
+        try:
+            vpn = self._create_vpn()
+            t = self._create_template(type='vpn', auto_cert=True, vpn=vpn)
+            c = self._create_config(device=self._create_device(name='test-create-cert'))
+            c.templates.add(t)
+            c.templates.remove(t)
+        finally:
+            app_settings.LAZY_AUTO_CERT = False
+        self.assertEqual(c.vpnclient_set.count(), 0)
+
+    def _create_vpn_template_configs(self, n):
+        vpn = self._create_vpn()
+        t = self._create_template(type='vpn', auto_cert=True, vpn=vpn)
+        configs = []
+        for i in range(n):
+            d = self._create_device(name='bulk-{0}'.format(i),
+                                    mac_address='00:11:22:33:44:{0:02d}'.format(i))
+            configs.append(self._create_config(device=d))
+        return t, configs
+
+    def test_bulk_create_cert(self):
+        t, configs = self._create_vpn_template_configs(3)
+        app_settings.BULK_CERT_THRESHOLD = 1
+        try:
+            t.config_relations.add(*configs)
+        finally:
+            app_settings.BULK_CERT_THRESHOLD = 20
+        clients = VpnClient.objects.filter(vpn=t.vpn).select_related('cert', 'config__device')
+        self.assertEqual(clients.count(), 3)
+        serials = set()
+        for client in clients:
+            cert = client.cert
+            self.assertEqual(cert.ca, t.vpn.ca)
+            self.assertEqual(cert.name, client.config.device.name)
+            self.assertEqual(cert.common_name, client._get_common_name())
+            self.assertEqual(cert.x509.get_issuer(), t.vpn.ca.x509.get_subject())
+            self.assertEqual(cert.pkey.bits(), int(t.vpn.ca.key_length))
+            serials.add(cert.serial_number)
+        self.assertEqual(len(serials), 3)
+        for config in configs:
+            config.refresh_from_db()
+            self.assertEqual(config.status, 'modified')
+        t.config_relations.remove(configs[0])
+        self.assertEqual(VpnClient.objects.filter(vpn=t.vpn).count(), 2)
+        t.config_relations.clear()
+        self.assertEqual(VpnClient.objects.filter(vpn=t.vpn).count(), 0)
+        self.assertEqual(Cert.objects.filter(serial_number__in=serials).count(), 0)
+
+    def test_bulk_create_below_threshold(self):
+        t, configs = self._create_vpn_template_configs(2)
+        t.config_relations.add(*configs)
+        clients = VpnClient.objects.filter(vpn=t.vpn)
+        self.assertEqual(clients.filter(cert__isnull=False).count(), 2)
+        # existing clients are skipped
+        VpnClient.bulk_create_clients(t.vpn, configs, auto_cert=True)
+        self.assertEqual(clients.count(), 2)
+
+    def test_remove_template_vpn_shared(self):
+        t, configs = self._create_vpn_template_configs(2)
+        t2 = self._create_template(name='shared-vpn', type='vpn', auto_cert=True, vpn=t.vpn)
+        t.config_relations.add(*configs)
+        t2.config_relations.add(configs[0])
+        Config.objects.update(status='applied')
+        t.config_relations.remove(*configs)
+        # configs[0] still uses the VPN through the other template
+        clients = VpnClient.objects.filter(vpn=t.vpn)
+        self.assertEqual(list(clients.values_list('config', flat=True)), [configs[0].pk])
+        self.assertEqual(Config.objects.filter(status='modified').count(), 2)
+        t2.config_relations.clear()
+        self.assertEqual(clients.count(), 0)
+
+    def test_bulk_create_lazy(self):
+        t, configs = self._create_vpn_template_configs(3)
+        app_settings.LAZY_AUTO_CERT = True
+        try:
+            t.config_relations.add(*configs)
+        finally:
+            app_settings.LAZY_AUTO_CERT = False
+        clients = VpnClient.objects.filter(vpn=t.vpn)
+        self.assertEqual(clients.filter(cert__isnull=True).count(), 3)
+
     def _get_vpn_context(self):
         self.test_create_cert()
         c = Config.objects.get(device__name='test-create-cert')
@@ -423,3 +769,296 @@ class TestConfig(CreateConfigMixin, CreateTemplateMixin,
 
     def test_get_template_model_bound(self):
         self.assertIs(Config().get_template_model(), Template)
+
+    def test_export_configs_command(self):
+        configs = []
+        for i in range(3):
+            d = self._create_device(name='export-{0}'.format(i),
+                                    mac_address='00:11:22:33:44:0{0}'.format(i))
+            configs.append(self._create_config(device=d))
+        self._create_config(device=self._create_device(), backend='netjsonconfig.OpenWisp')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.tar')
+            app_settings.EXPORT_BATCH_SIZE = 2
+            try:
+                call_command('export_configs', output=path, backend='netjsonconfig.OpenWrt')
+            finally:
+                app_settings.EXPORT_BATCH_SIZE = 100
+            with tarfile.open(path) as archive:
+                names = sorted(archive.getnames())
+                contents = archive.extractfile('export-0.tar.gz').read()
+        self.assertEqual(names, ['export-0.tar.gz', 'export-1.tar.gz', 'export-2.tar.gz'])
+        self.assertEqual(contents, configs[0].generate().getvalue())
+
+    def test_export_configs_lazy_certs(self):
+        app_settings.LAZY_AUTO_CERT = True
+        try:
+            vpn = self._create_vpn()
+            t = self._create_template(type='vpn', auto_cert=True, vpn=vpn)
+            c = self._create_config(device=self._create_device(name='export-lazy'))
+            c.templates.add(t)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'export.tar')
+                call_command('export_configs', output=path)
+                self.assertTrue(c.vpnclient_set.first().cert_pending)
+                call_command('export_configs', output=path, issue_certs=True)
+                self.assertFalse(c.vpnclient_set.first().cert_pending)
+        finally:
+            app_settings.LAZY_AUTO_CERT = False
+
+    def _create_bulk_configs(self, number=3):
+        configs = []
+        for i in range(number):
+            d = self._create_device(name='bulk-{0}'.format(i),
+                                    mac_address='00:11:22:33:55:0{0}'.format(i))
+            configs.append(self._create_config(device=d))
+        return configs
+
+    def _get_template_names(self, config):
+        return list(config.templates.values_list('name', flat=True))
+
+    def test_queryset_set_status_modified(self):
+        configs = self._create_bulk_configs()
+        for config in configs:
+            config.set_status_applied()
+        received = []
+
+        def receiver(sender, queryset, template, **kwargs):
+            received.append((sender, queryset, template))
+
+        configs_modified.connect(receiver)
+        try:
+            with self.assertNumQueries(2):
+                count = Config.objects.filter(status='applied').set_status_modified()
+        finally:
+            configs_modified.disconnect(receiver)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0][0], Config)
+        self.assertEqual(set(received[0][1]), set(configs))
+        self.assertIsNone(received[0][2])
+        self.assertEqual(Config.objects.filter(status='modified').count(), 3)
+
+    def test_iter_chunks(self):
+        configs = self._create_bulk_configs(number=5)
+        with self.assertNumQueries(3):
+            chunked = list(iter_chunks(Config.objects.all(), size=2))
+        self.assertEqual(chunked, sorted(configs, key=lambda c: c.pk))
+
+    def test_iter_pk_chunks(self):
+        configs = self._create_bulk_configs(number=5)
+        pks = sorted(c.pk for c in configs)
+        queryset = Config.objects.exclude(status='modified')
+        Config.objects.update(status='applied')
+        chunked = []
+        for chunk in iter_pk_chunks(queryset, size=2):
+            # objects can be changed while iterating
+            Config.objects.filter(pk__in=chunk).update(status='modified')
+            chunked.append(chunk)
+        self.assertEqual(chunked, [pks[0:2], pks[2:4], pks[4:]])
+
+    def test_send_config_modified_task(self):
+        c = self._create_config(device=self._create_device())
+        received = []
+
+        def receiver(sender, config, device, **kwargs):
+            received.append(config)
+
+        config_modified.connect(receiver)
+        try:
+            send_config_modified(c._meta.label, [str(c.pk)])
+        finally:
+            config_modified.disconnect(receiver)
+        self.assertEqual(received, [c])
+
+    def test_queryset_add_template(self):
+        dhcp = Template.objects.get(name='dhcp')
+        radio = Template.objects.get(name='radio0')
+        configs = self._create_bulk_configs()
+        configs[0].templates.add(radio)
+        configs[1].templates.add(dhcp)
+        for config in configs:
+            config.set_status_applied()
+        count = Config.objects.all().add_template(dhcp)
+        self.assertEqual(count, 2)
+        self.assertEqual(self._get_template_names(configs[0]), ['radio0', 'dhcp'])
+        self.assertEqual(self._get_template_names(configs[1]), ['dhcp'])
+        self.assertEqual(self._get_template_names(configs[2]), ['dhcp'])
+        configs[1].refresh_from_db()
+        self.assertEqual(configs[1].status, 'applied')
+        self.assertEqual(Config.objects.filter(status='modified').count(), 2)
+
+    def test_queryset_add_template_conflict(self):
+        dhcp = Template.objects.get(name='dhcp')
+        duplicate = Template.objects.create(name='duplicate', backend='netjsonconfig.OpenWrt',
+                                            config=dhcp.config)
+        configs = self._create_bulk_configs()
+        Config.objects.all().add_template(dhcp)
+        with self.assertRaises(ValidationError):
+            Config.objects.all().add_template(duplicate)
+        for config in configs:
+            self.assertEqual(self._get_template_names(config), ['dhcp'])
+
+    def test_queryset_remove_template(self):
+        dhcp = Template.objects.get(name='dhcp')
+        radio = Template.objects.get(name='radio0')
+        configs = self._create_bulk_configs()
+        Config.objects.all().add_template(dhcp)
+        Config.objects.all().add_template(radio)
+        count = Config.objects.exclude(pk=configs[0].pk).remove_template(dhcp)
+        self.assertEqual(count, 2)
+        self.assertEqual(self._get_template_names(configs[0]), ['dhcp', 'radio0'])
+        self.assertEqual(self._get_template_names(configs[1]), ['radio0'])
+
+    def test_queryset_replace_template(self):
+        dhcp = Template.objects.get(name='dhcp')
+        radio = Template.objects.get(name='radio0')
+        other = self._create_template(name='other')
+        configs = self._create_bulk_configs()
+        Config.objects.all().add_template(dhcp)
+        Config.objects.all().add_template(radio)
+        configs[1].templates.add(other)
+        count = Config.objects.all().replace_template(dhcp, other)
+        self.assertEqual(count, 3)
+        self.assertEqual(self._get_template_names(configs[0]), ['other', 'radio0'])
+        self.assertEqual(self._get_template_names(configs[1]), ['radio0', 'other'])
+
+    def test_queryset_vpn_templates(self):
+        vpn = self._create_vpn()
+        t = self._create_template(name='vpn-test', type='vpn', vpn=vpn, auto_cert=True)
+        configs = self._create_bulk_configs()
+        Config.objects.all().add_template(t)
+        self.assertEqual(VpnClient.objects.filter(vpn=vpn).count(), 3)
+        cert_pk = configs[0].vpnclient_set.first().cert.pk
+        Config.objects.filter(pk=configs[0].pk).remove_template(t)
+        self.assertEqual(VpnClient.objects.filter(vpn=vpn).count(), 2)
+        self.assertFalse(Cert.objects.filter(pk=cert_pk).exists())
+
+    def test_update_configs_command(self):
+        dhcp = Template.objects.get(name='dhcp')
+        configs = self._create_bulk_configs()
+        out = StringIO()
+        call_command('update_configs', 'add-template', template='dhcp',
+                     devices=['bulk-0', 'bulk-1'], stdout=out)
+        self.assertIn('2 configurations have been modified', out.getvalue())
+        self.assertEqual(list(dhcp.config_relations.order_by('device__name')), configs[:2])
+        with self.assertRaises(CommandError):
+            call_command('update_configs', 'remove-template', template='wrong')
+
+    def test_lazy_json_decoding(self):
+        c = self._create_config(device=self._create_device(),
+                                context={'ssid': 'lazy'})
+        c = Config.objects.get(pk=c.pk)
+        self.assertIsInstance(c.__dict__['config'], RawJSON)
+        self.assertIsInstance(c.__dict__['context'], RawJSON)
+        self.assertEqual(c.context, {'ssid': 'lazy'})
+        self.assertIsInstance(c.__dict__['config'], RawJSON)
+        self.assertIsInstance(c.config, OrderedDict)
+        self.assertFalse(c.has_changed('config', 'context'))
+        c.context['ssid'] = 'changed'
+        self.assertTrue(c.has_changed('context'))
+
+    def test_lazy_json_save_not_decoded(self):
+        c = self._create_config(device=self._create_device())
+        c = Config.objects.get(pk=c.pk)
+        c.status = 'applied'
+        c.save()
+        self.assertIsInstance(c.__dict__['config'], RawJSON)
+        c.refresh_from_db()
+        self.assertEqual(c.config, {'general': {}})
+
+    def test_defer_json(self):
+        c = self._create_config(device=self._create_device())
+        c = Config.objects.defer_json().get(pk=c.pk)
+        self.assertEqual(c.get_deferred_fields(), {'config', 'context'})
+        with self.assertNumQueries(1):
+            self.assertEqual(c.config, {'general': {}})
+        self.assertFalse(c.has_changed('config'))
+        d = Device.objects.select_related('config').defer_json('config').get(pk=c.device.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(d.config.status, 'modified')
+        self.assertEqual(d.config.get_deferred_fields(), {'config', 'context'})
+
+    def test_default_templates_defer_json(self):
+        t = self._create_template(default=True)
+        c = Config(backend='netjsonconfig.OpenWrt')
+        template = c.get_default_templates().get()
+        self.assertEqual(template, t)
+        self.assertIn('config', template.get_deferred_fields())
+
+    def test_default_templates_cached(self):
+        t = self._create_template(default=True)
+        c = Config(backend='netjsonconfig.OpenWrt')
+        self.assertEqual(get_template_ids(c.get_default_templates()), [t.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_template_ids(c.get_default_templates()), [t.pk])
+        t2 = self._create_template(name='default2', default=True)
+        self.assertEqual(set(get_template_ids(c.get_default_templates())), {t.pk, t2.pk})
+        t2.default = False
+        t2.save()
+        self.assertEqual(get_template_ids(c.get_default_templates()), [t.pk])
+        # bulk updates do not send signals
+        Template.objects.filter(pk=t2.pk).update(default=True)
+        self.assertEqual(set(get_template_ids(c.get_default_templates())), {t.pk, t2.pk})
+        Template.objects.filter(pk=t2.pk).update(default=False)
+        self.assertEqual(get_template_ids(c.get_default_templates()), [t.pk])
+        t.delete()
+        self.assertEqual(get_template_ids(c.get_default_templates()), [])
+
+    def test_template_lookups_bulk_operations(self):
+        t = self._create_template()
+        self._create_config(device=self._create_device())
+        for operation in (lambda: Config.objects.add_template(t),
+                          lambda: Config.objects.remove_template(t)):
+            with mock.patch('django_netjsonconfig.base.config.invalidate') as invalidate:
+                operation()
+            invalidate.assert_called_once_with()
+
+    def test_tagged_templates_cached(self):
+        t = self._create_template()
+        queryset = Template.objects.filter(tags__name__in=['mesh']).distinct()
+        self.assertEqual(get_template_ids(queryset), [])
+        t.tags.add('mesh')
+        self.assertEqual(get_template_ids(queryset), [t.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_template_ids(queryset), [t.pk])
+        tag = t.tags.get()
+        tag.name = 'wds'
+        tag.save()
+        self.assertEqual(get_template_ids(queryset), [])
+        tag.name = 'mesh'
+        tag.save()
+        t.tags.clear()
+        self.assertEqual(get_template_ids(queryset), [])
+        self.assertEqual(get_template_ids(Template.objects.none()), [])
+
+    def test_compact_json_storage(self):
+        c = self._create_config(device=self._create_device(),
+                                config={'general': {'timezone': 'UTC'}})
+        stored = Config.objects.filter(pk=c.pk).values_list('config', flat=True).get()
+        self.assertEqual(stored, '{"general":{"timezone":"UTC"}}')
+        field = Config._meta.get_field('config')
+        self.assertEqual(field.value_from_object(c),
+                         '{\n    "general": {\n        "timezone": "UTC"\n    }\n}')
+
+    def test_convert_json_columns(self):
+        configs = self._create_bulk_configs()
+        pretty = '{\n    "general": {}\n}'
+        Config.objects.filter(pk__in=[c.pk for c in configs[1:]]) \
+                      .update(config=RawJSON(pretty), context=RawJSON('{\n}'))
+        stdout = StringIO()
+        call_command('convert_json_columns', '--text', batch_size=2, stdout=stdout)
+        self.assertIn('configurations: 0 columns converted, 2 rows compacted', stdout.getvalue())
+        rows = Config.objects.values_list('config', 'context')
+        self.assertEqual(set(rows), {('{"general":{}}', '{}'), ('{"general":{}}', None)})
+        # rows which are already compact are skipped
+        stdout = StringIO()
+        call_command('convert_json_columns', stdout=stdout)
+        self.assertIn('configurations: 0 columns converted, 0 rows compacted', stdout.getvalue())
+
+    def test_convert_json_columns_setting_mismatch(self):
+        with self.assertRaises(CommandError):
+            call_command('convert_json_columns', '--native', stdout=StringIO())
+        stdout = StringIO()
+        call_command('convert_json_columns', '--native', '--force', stdout=stdout)
+        self.assertIn('configurations: 0 columns converted', stdout.getvalue())
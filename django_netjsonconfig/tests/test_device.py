@@ -46,6 +46,16 @@ class TestDevice(CreateConfigMixin, TestCase):
         c.refresh_from_db()
         self.assertEqual(c.status, 'modified')
 
+    def test_config_status_unchanged_name(self):
+        c = self._create_config(device=self._create_device(),
+                                status='applied')
+        d = Device.objects.get(pk=c.device.pk)
+        d.notes = 'changed'
+        d.full_clean()
+        d.save()
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'applied')
+
     def test_key_validator(self):
         d = Device(name='test',
                    mac_address=self.TEST_MAC_ADDRESS,
@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import json
+import threading
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+from six.moves import BaseHTTPServer, socketserver
+
+from . import CreateConfigMixin, CreateTemplateMixin
+from ..importer import ImportFailed, fetch_templates, get_json, import_catalog, pool, sync_templates
+from ..models import Config, Device, Template
+from ..tasks import sync_imported_templates
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    serves ``server.documents`` (a dict of paths and
+    JSON serializable objects) with ETag support
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path not in self.server.documents:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        document = self.server.documents[self.path]
+        content = document if isinstance(document, bytes) else json.dumps(document).encode()
+        etag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestImport(CreateConfigMixin, CreateTemplateMixin, TestCase):
+    """
+    tests for django_netjsonconfig.importer
+    """
+    config_model = Config
+    device_model = Device
+    template_model = Template
+
+    def setUp(self):
+        cache.clear()
+        self.server = TestServer(('127.0.0.1', 0), RequestHandler)
+        self.server.documents = {}
+        self.server.requests = []
+        self.server.connections = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(pool.clear)
+
+    def _url(self, path):
+        return 'http://127.0.0.1:{0}{1}'.format(self.server.server_address[1], path)
+
+    def _publish(self, path, **kwargs):
+        document = {
+            'name': 'remote',
+            'description': 'remote template',
+            'type': 'generic',
+            'backend': 'netjsonconfig.OpenWrt',
+            'config': {'interfaces': [{'name': 'eth0', 'type': 'ethernet'}]},
+            'variable': {'ssid': 'remote'}
+        }
+        document.update(kwargs)
+        self.server.documents[path] = document
+        return self._url(path)
+
+    def test_import_template(self):
+        url = self._publish('/template.json')
+        t = self._create_template(name='imported', flag='import', url=url, config={})
+        self.assertEqual(t.config['interfaces'][0]['name'], 'eth0')
+        self.assertEqual(t.variable, {'ssid': 'remote'})
+        self.assertEqual(t.description, 'remote template')
+        self.assertEqual(len(self.server.requests), 1)
+        t = Template.objects.get(pk=t.pk)
+        t.full_clean()
+        t.save()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_import_errors(self):
+        options = {'name': 'imported', 'flag': 'import', 'config': {}}
+        with self.assertRaises(ValidationError) as context:
+            self._create_template(**options)
+        self.assertIn('url', context.exception.message_dict)
+        with self.assertRaises(ValidationError) as context:
+            self._create_template(url=self._url('/missing.json'), **options)
+        self.assertIn('404', context.exception.message_dict['url'][0])
+        # python literals are not evaluated
+        url = self._publish('/literal.json', config="{'interfaces': []}")
+        with self.assertRaises(ValidationError):
+            self._create_template(url=url, **options)
+        url = self._publish('/vpn.json', type='vpn')
+        with self.assertRaises(ValidationError):
+            self._create_template(url=url, **options)
+        self.server.documents['/invalid.json'] = b'{invalid'
+        with self.assertRaises(ValidationError):
+            self._create_template(url=self._url('/invalid.json'), **options)
+
+    def test_import_json_strings(self):
+        url = self._publish('/strings.json',
+                            config=json.dumps({'interfaces': []}),
+                            variable=json.dumps({'ssid': 'test'}))
+        t = self._create_template(name='imported', flag='import', url=url, config={})
+        self.assertEqual(t.config, {'interfaces': []})
+        self.assertEqual(t.variable, {'ssid': 'test'})
+
+    def test_conditional_get(self):
+        url = self._publish('/template.json')
+        data = get_json(url)
+        self.assertEqual(get_json(url), data)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIn('If-None-Match', self.server.requests[1][1])
+        # the connection is reused
+        self.assertEqual(self.server.connections, 1)
+        self._publish('/template.json', description='changed')
+        self.assertEqual(get_json(url)['description'], 'changed')
+
+    def test_fetch_templates(self):
+        urls = [self._publish('/{0}.json'.format(i)) for i in range(10)]
+        urls.append(self._url('/missing.json'))
+        results = fetch_templates(urls, workers=4)
+        self.assertEqual(len(results), 11)
+        self.assertIsInstance(results.pop(urls[-1]), ImportFailed)
+        for values in results.values():
+            self.assertEqual(values['variable'], {'ssid': 'remote'})
+
+    def test_import_catalog(self):
+        entries = []
+        for name in ('first', 'second'):
+            self._publish('/catalog/templates/{0}.json'.format(name), name=name)
+            entries.append({'key': name, 'name': name, 'url': 'templates/{0}.json'.format(name)})
+        entries.append({'key': 'missing', 'name': 'missing', 'url': 'templates/missing.json'})
+        self.server.documents['/catalog/index.json'] = {'templates': entries}
+        catalog_url = self._url('/catalog/index.json')
+        imported, errors = import_catalog(Template, catalog_url)
+        self.assertEqual(imported, 2)
+        self.assertEqual(len(errors), 1)
+        t = Template.objects.get(name='second')
+        self.assertEqual(t.flag, 'import')
+        self.assertEqual(t.url, self._url('/catalog/templates/second.json'))
+        self._publish('/catalog/templates/second.json', variable={'ssid': 'changed'})
+        out = StringIO()
+        call_command('import_templates', catalog_url, keys=['second'], stdout=out)
+        self.assertIn('1 templates imported', out.getvalue())
+        self.assertEqual(Template.objects.filter(flag='import').count(), 2)
+        t.refresh_from_db()
+        self.assertEqual(t.variable, {'ssid': 'changed'})
+
+    def test_sync_templates(self):
+        url = self._publish('/template.json')
+        t = self._create_template(name='imported', flag='import', url=url, config={})
+        c = self._create_config()
+        c.templates.add(t)
+        c.status = 'applied'
+        c.save()
+        modified = t.modified
+        self.assertEqual(sync_templates(Template), (0, []))
+        self.assertIn('If-None-Match', self.server.requests[-1][1])
+        t.refresh_from_db()
+        self.assertEqual(t.modified, modified)
+        # same contents with another description
+        self._publish('/template.json', description='changed')
+        self.assertEqual(sync_templates(Template), (0, []))
+        self._publish('/template.json', config={'interfaces': [{'name': 'eth1', 'type': 'ethernet'}]})
+        self.assertEqual(sync_templates(Template), (1, []))
+        t.refresh_from_db()
+        self.assertEqual(t.config['interfaces'][0]['name'], 'eth1')
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'modified')
+        del self.server.documents['/template.json']
+        updated, errors = sync_templates(Template)
+        self.assertEqual(updated, 0)
+        self.assertEqual(errors[0][0], url)
+
+    def test_sync_templates_task(self):
+        url = self._publish('/template.json')
+        self._create_template(name='imported', flag='import', url=url, config={})
+        self._publish('/template.json', variable={'ssid': 'changed'})
+        sync_imported_templates('django_netjsonconfig.Template')
+        self.assertEqual(Template.objects.get(name='imported').variable, {'ssid': 'changed'})
+        out = StringIO()
+        call_command('sync_templates', stdout=out)
+        self.assertIn('0 templates updated', out.getvalue())
@@ -7,6 +7,8 @@ from netjsonconfig import OpenWrt
 
 from . import CreateConfigMixin, CreateTemplateMixin, TestVpnX509Mixin
 from ..models import Config, Device, Template, Vpn
+from ..signals import config_modified, configs_modified
+from ..tasks import send_template_config_modified
 
 
 class TestTemplate(CreateConfigMixin, CreateTemplateMixin,
@@ -54,6 +56,87 @@ class TestTemplate(CreateConfigMixin, CreateTemplateMixin,
         c.refresh_from_db()
         self.assertEqual(c.status, 'modified')
 
+    def test_config_status_unchanged_same_output(self):
+        t = self._create_template()
+        c = self._create_config(device=self._create_device(name='test-status'))
+        c.templates.add(t)
+        c.set_status_applied()
+        t = Template.objects.get(pk=t.pk)
+        # same output with a different order of keys
+        t.config['interfaces'][0] = {'type': 'ethernet', 'name': 'eth0'}
+        t.full_clean()
+        t.save()
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'applied')
+
+    def test_config_status_modified_after_variable_change(self):
+        t = self._create_template(config={'general': {'description': '{{ ssid }}'}},
+                                  variable={'ssid': 'default', 'unused': 'value'})
+        self.assertEqual(list(t.used_variables.values_list('name', flat=True)), ['ssid'])
+        c1 = self._create_config(device=self._create_device(name='test-status1'))
+        c1.templates.add(t)
+        c1.set_status_applied()
+        # uses the variable in its own configuration
+        other = self._create_template(name='other', config={'general': {}})
+        c2 = self._create_config(device=self._create_device(name='test-status2',
+                                                            mac_address='00:11:22:33:44:56'),
+                                 config={'general': {'description': '{{ ssid }}'}})
+        c2.templates.add(other)
+        c2.set_status_applied()
+        t = Template.objects.get(pk=t.pk)
+        t.variable['unused'] = 'changed'
+        t.full_clean()
+        t.save()
+        c1.refresh_from_db()
+        self.assertEqual(c1.status, 'applied')
+        t.variable['ssid'] = 'changed'
+        t.full_clean()
+        t.save()
+        c1.refresh_from_db()
+        self.assertEqual(c1.status, 'modified')
+        c2.refresh_from_db()
+        self.assertEqual(c2.status, 'applied')
+        other.variable = {'ssid': 'other'}
+        other.full_clean()
+        other.save()
+        c2.refresh_from_db()
+        self.assertEqual(c2.status, 'modified')
+
+    def test_configs_modified_signal(self):
+        t = self._create_template()
+        c = self._create_config(device=self._create_device(name='test-status'))
+        c.templates.add(t)
+        c.set_status_applied()
+        received = []
+
+        def receiver(sender, queryset, template, **kwargs):
+            received.append((sender, list(queryset), template))
+
+        configs_modified.connect(receiver)
+        try:
+            t.config['interfaces'][0]['name'] = 'eth1'
+            t.full_clean()
+            t.save()
+        finally:
+            configs_modified.disconnect(receiver)
+        self.assertEqual(received, [(Config, [c], t)])
+
+    def test_send_template_config_modified_task(self):
+        t = self._create_template()
+        c = self._create_config(device=self._create_device(name='test-status'))
+        c.templates.add(t)
+        received = []
+
+        def receiver(sender, config, device, **kwargs):
+            received.append((config, device))
+
+        config_modified.connect(receiver)
+        try:
+            send_template_config_modified(t._meta.label, str(t.pk))
+        finally:
+            config_modified.disconnect(receiver)
+        self.assertEqual(received, [(c, c.device)])
+
     def test_no_auto_hostname(self):
         t = self._create_template()
         self.assertNotIn('general', t.backend_instance.config)
@@ -1,6 +1,16 @@
+import gzip
+import json
+from unittest import mock
+
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
+from netjsonconfig import OpenWrt
+from netjsonconfig.exceptions import ValidationError as SchemaError
+
+from .. import backends
+from ..views import (ALL_BACKENDS, get_editor_asset, get_editor_url, get_schema, get_schema_asset,
+                     get_schema_url)
 
 User = get_user_model()
 
@@ -26,9 +36,76 @@ class TestViews(TestCase):
         self.assertIn('netjsonconfig.OpenWrt', response.json())
 
     def test_schema_hostname_hidden(self):
-        from ..views import available_schemas
-        for key, schema in available_schemas.items():
+        for path, label in ALL_BACKENDS:
+            schema = get_schema(path)
             if 'general' not in schema['properties']:
                 continue
             if 'hostname' in schema['properties']['general']['properties']:
                 self.fail('hostname property must be hidden')
+
+    def test_backend_registry(self):
+        backend = backends.get_backend('netjsonconfig.OpenWrt')
+        self.assertIs(backends.get_backend('netjsonconfig.OpenWrt'), backend)
+        self.assertIs(backend.backend_class, OpenWrt)
+        self.assertIs(get_schema('netjsonconfig.OpenWrt'), backend.schema)
+        self.assertIs(backend.validator, backends.get_validator(OpenWrt))
+        with self.assertRaises(ImportError):
+            backends.get_backend('netjsonconfig.Wrong')
+        with mock.patch('netjsonconfig.backends.base.backend.validate') as validate:
+            backends.validate(OpenWrt({'general': {'hostname': 'test'}}))
+            with self.assertRaises(SchemaError):
+                backends.validate(OpenWrt({'interfaces': [{'name': 'eth0'}]}))
+        validate.assert_not_called()
+
+    def test_backends_warm_up(self):
+        with mock.patch.dict(backends._backends, clear=True):
+            backends.warm_up()
+            self.assertEqual(set(backends._backends), set(dict(ALL_BACKENDS)))
+
+    def test_backend_schema_403(self):
+        response = self.client.get(get_schema_url('netjsonconfig.OpenWrt'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_backend_schema(self):
+        self.client.force_login(User.objects.get(pk=1))
+        url = get_schema_url('netjsonconfig.OpenWrt')
+        self.assertIn(get_schema_asset('netjsonconfig.OpenWrt')[2], url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response.json(), get_schema('netjsonconfig.OpenWrt'))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content).decode()),
+                         get_schema('netjsonconfig.OpenWrt'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_backend_schema_old_version(self):
+        self.client.force_login(User.objects.get(pk=1))
+        url = reverse('netjsonconfig:backend_schema', kwargs={'backend': 'netjsonconfig.OpenWrt',
+                                                              'version': '0123456789abcdef'})
+        response = self.client.get(url)
+        self.assertRedirects(response, get_schema_url('netjsonconfig.OpenWrt'),
+                             fetch_redirect_response=False)
+
+    def test_backend_schema_404(self):
+        self.client.force_login(User.objects.get(pk=1))
+        url = reverse('netjsonconfig:backend_schema', kwargs={'backend': 'os.path',
+                                                              'version': 'abcdef'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_editor(self):
+        url = get_editor_url()
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('public', response['Cache-Control'])
+        content = gzip.decompress(response.content)
+        self.assertEqual(content, get_editor_asset()[0])
+        self.assertIn(b'JSONEditor.defaults.themes.django', content)
+        response = self.client.get(reverse('netjsonconfig:editor', kwargs={'version': 'abcdef'}))
+        self.assertRedirects(response, url, fetch_redirect_response=False)
@@ -1,9 +1,21 @@
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509 import load_pem_x509_certificate
+from django.apps import apps
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.test import TestCase
 from django_x509.models import Ca, Cert
+from OpenSSL import crypto
 
 from . import CreateConfigMixin, CreateTemplateMixin, TestVpnX509Mixin
-from ..models import Config, Device, Template, Vpn, VpnClient
+from .. import settings as app_settings
+from ..models import Config, Device, DhParameters, Template, Vpn, VpnClient
+from ..tasks import generate_vpn_dh
 from ..vpn_backends import OpenVpn
 
 
@@ -105,6 +117,77 @@ class TestVpn(TestVpnX509Mixin, CreateConfigMixin,
         self.assertEqual(VpnClient.objects.filter(pk=vpnclient.pk).count(), 0)
         self.assertEqual(Cert.objects.filter(pk=cert_pk).count(), 0)
 
+    def _get_public_key(self, cert):
+        return load_pem_x509_certificate(cert.certificate.encode(),
+                                         default_backend()).public_key()
+
+    def _test_ec_key_type(self, key_type, curve_name, curve_size):
+        vpn = self._create_vpn(name=key_type, key_type=key_type)
+        public_key = self._get_public_key(vpn.cert)
+        self.assertIsInstance(public_key, ec.EllipticCurvePublicKey)
+        self.assertEqual(public_key.curve.name, curve_name)
+        key_lengths = dict(Cert._meta.get_field('key_length').choices)
+        self.assertIn(vpn.cert.key_length, key_lengths)
+        self.assertNotEqual(vpn.cert.key_length, '')
+        private_key = vpn.cert.pkey.to_cryptography_key()
+        self.assertIsInstance(private_key, ec.EllipticCurvePrivateKey)
+        t = self._create_template(name=key_type, type='vpn', vpn=vpn, auto_cert=True)
+        c = self._create_config(device=self._create_device(name=key_type))
+        c.templates.add(t)
+        cert = c.vpnclient_set.first().cert
+        public_key = self._get_public_key(cert)
+        self.assertIsInstance(public_key, ec.EllipticCurvePublicKey)
+        self.assertEqual(public_key.curve.name, curve_name)
+        self.assertEqual(cert.ca, vpn.ca)
+        self.assertEqual(cert.x509.get_issuer(), vpn.ca.x509.get_subject())
+        self.assertEqual(cert.x509.get_subject().commonName,
+                         '{mac_address}-{name}'.format(**c.device.__dict__))
+        store = crypto.X509Store()
+        store.add_cert(vpn.ca.x509)
+        crypto.X509StoreContext(store, cert.x509).verify_certificate()
+        extensions = [cert.x509.get_extension(i).get_short_name()
+                      for i in range(cert.x509.get_extension_count())]
+        for name in [b'basicConstraints', b'keyUsage', b'subjectKeyIdentifier',
+                     b'authorityKeyIdentifier', b'nsCertType']:
+            self.assertIn(name, extensions)
+        # the certificates remain valid when edited afterwards
+        for cert in (Cert.objects.get(pk=vpn.cert.pk), Cert.objects.get(pk=cert.pk)):
+            cert.full_clean()
+        # the size of the curve is used when it's a valid choice
+        with mock.patch.object(Cert._meta.get_field('key_length'), 'choices',
+                               tuple(key_lengths.items()) + ((curve_size, curve_size),)):
+            cert = self._create_vpn(name='{0}-size'.format(key_type), key_type=key_type).cert
+            cert.full_clean()
+        self.assertEqual(cert.key_length, curve_size)
+
+    def test_ec_p256_key_type(self):
+        self._test_ec_key_type('ec-p256', 'secp256r1', '256')
+
+    def test_ec_p384_key_type(self):
+        self._test_ec_key_type('ec-p384', 'secp384r1', '384')
+
+    def test_unsupported_key_type(self):
+        choices = (('rsa', 'RSA'),)
+        field = Vpn._meta.get_field('key_type')
+        with mock.patch.object(field, 'choices', choices), \
+                mock.patch('django_netjsonconfig.base.vpn.KEY_TYPE_CHOICES', choices):
+            with self.assertRaises(ValidationError) as context_manager:
+                self._create_vpn(key_type='ec-p256')
+            self.assertIn('key_type', context_manager.exception.message_dict)
+            ca = self._create_ca()
+            with self.assertRaises(ValueError):
+                Vpn.objects.create(name='test', host='vpn1.test.com', ca=ca,
+                                   backend='django_netjsonconfig.vpn_backends.OpenVpn',
+                                   config=self._vpn_config, dh=self._dh, key_type='ec-p256')
+        self.assertEqual(Vpn.objects.count(), 0)
+        self.assertEqual(Cert.objects.count(), 0)
+
+    def test_rsa_key_type(self):
+        vpn = self._create_vpn()
+        self.assertEqual(vpn.key_type, 'rsa')
+        public_key = self._get_public_key(vpn.cert)
+        self.assertIsInstance(public_key, rsa.RSAPublicKey)
+
     def test_vpn_cert_and_ca_mismatch(self):
         ca = self._create_ca()
         different_ca = self._create_ca()
@@ -217,11 +300,93 @@ class TestVpn(TestVpnX509Mixin, CreateConfigMixin,
     def test_dh(self):
         v = self._create_vpn()
         v.dh = None
+        # the pool is empty: the parameters are generated in the background
+        with mock.patch('django_netjsonconfig.base.vpn.run_task') as run_task:
+            v.save()
+        self.assertEqual(v.dh, '')
+        run_task.assert_called_once_with('django_netjsonconfig.tasks.generate_vpn_dh',
+                                         v._meta.label, str(v.pk), 1024, '')
+        app_settings.DH_POOL_SIZE = 1
+        try:
+            generate_vpn_dh(*run_task.call_args[0][1:])
+        finally:
+            app_settings.DH_POOL_SIZE = 5
+        v.refresh_from_db()
+        self.assertIn('-----BEGIN DH PARAMETERS-----', v.dh)
+        self.assertIn('-----END DH PARAMETERS-----', v.dh)
+        # the pool has been refilled
+        self.assertEqual(DhParameters.objects.filter(length=1024).count(), 1)
+
+    def test_dh_changed_meanwhile(self):
+        v = self._create_vpn()
+        v.dh = ''
+        with mock.patch('django_netjsonconfig.base.vpn.run_task') as run_task:
+            v.save()
+        DhParameters.objects.create(length=1024, contents=self._dh)
+        Vpn.objects.filter(pk=v.pk).update(dh='entered by hand')
+        app_settings.DH_POOL_SIZE = 1
+        try:
+            generate_vpn_dh(*run_task.call_args[0][1:])
+        finally:
+            app_settings.DH_POOL_SIZE = 5
+        v.refresh_from_db()
+        self.assertEqual(v.dh, 'entered by hand')
+        # the parameters are returned to the pool
+        self.assertEqual(list(DhParameters.objects.values_list('contents', flat=True)), [self._dh])
+
+    def test_dh_from_pool(self):
+        DhParameters.objects.create(length=1024, contents=self._dh)
+        v = self._create_vpn(dh='')
+        self.assertEqual(v.dh, self._dh)
+        self.assertEqual(DhParameters.objects.count(), 0)
+
+    def test_dh_pool_length(self):
+        DhParameters.objects.create(length=2048, contents='2048 bit')
+        self.assertIsNone(DhParameters.pop(1024))
+        self.assertEqual(DhParameters.pop(2048), '2048 bit')
+        self.assertIsNone(DhParameters.pop(2048))
+
+    def test_dh_length_changed(self):
+        v = self._create_vpn()
+        DhParameters.objects.create(length=2048, contents='2048 bit')
+        v.dh_length = 2048
         v.save()
-        self.assertIsNotNone(v.dh)
-        self.assertNotEqual(v.dh.decode('utf8'), '')
-        self.assertIn('-----BEGIN DH PARAMETERS-----', v.dh.decode('utf8'))
-        self.assertIn('-----END DH PARAMETERS-----', v.dh.decode('utf8'))
+        self.assertEqual(v.dh, '2048 bit')
+
+    def test_dh_kept_on_save(self):
+        DhParameters.objects.create(length=2048, contents='2048 bit')
+        # parameters entered by hand and parameters whose length differs
+        # (eg: set before the length was stored) are never replaced
+        v = self._create_vpn(dh=self._dh, dh_length=2048)
+        self.assertEqual(v.dh, self._dh)
+        v = Vpn.objects.get(pk=v.pk)
+        v.notes = 'changed'
+        v.save()
+        self.assertEqual(v.dh, self._dh)
+        v.dh_length = 1024
+        v.dh = 'entered by hand'
+        v.save()
+        self.assertEqual(v.dh, 'entered by hand')
+        self.assertEqual(DhParameters.objects.count(), 1)
+
+    def test_dh_length_migration(self):
+        migration = import_module('django_netjsonconfig.migrations.0048_dh_parameters_pool')
+        v = self._create_vpn(dh=self._dh, dh_length=2048)
+        v2 = self._create_vpn(name='test2', ca=v.ca, dh='invalid', dh_length=4096)
+        migration.fill_dh_length(apps, None)
+        v.refresh_from_db()
+        self.assertEqual(v.dh_length, 1024)
+        v2.refresh_from_db()
+        self.assertEqual(v2.dh_length, 4096)
+
+    def test_refill_dh_pool_command(self):
+        DhParameters.objects.create(length=1024, contents=self._dh)
+        out = StringIO()
+        call_command('refill_dh_pool', size=2, stdout=out)
+        self.assertIn('1024 bit: 1 DH parameters added', out.getvalue())
+        self.assertEqual(DhParameters.objects.filter(length=1024).count(), 2)
+        dh = DhParameters.objects.exclude(contents=self._dh).first().contents
+        self.assertIn('-----BEGIN DH PARAMETERS-----', dh)
 
     def test_context_empty(self):
         v = Vpn()
@@ -6,4 +6,8 @@ app_name = 'django_netjsonconfig'
 
 urlpatterns = [
     url(r'^netjsonconfig/schema\.json$', views.schema, name='schema'),
+    url(r'^netjsonconfig/schema/(?P<backend>[\w.]+)\.(?P<version>[0-9a-f]+)\.json$',
+        views.backend_schema,
+        name='backend_schema'),
+    url(r'^netjsonconfig/editor\.(?P<version>[0-9a-f]+)\.js$', views.editor, name='editor'),
 ]
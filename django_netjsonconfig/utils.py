@@ -1,4 +1,6 @@
 import logging
+import multiprocessing
+import os
 
 from django.conf.urls import url
 from django.core.exceptions import ValidationError
@@ -120,3 +122,67 @@ def get_random_key():
     generates a device key of 32 characters
     """
     return get_random_string(length=32)
+
+
+def _get_virtual_memory():
+    """
+    returns the virtual memory size of the current process
+    in bytes, or ``None`` if it can't be determined
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _budget_worker(connection, function, args, memory_limit):
+    current = _get_virtual_memory()
+    if memory_limit and current:
+        import resource
+        limit = current + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        result = (True, function(*args))
+    except Exception as e:
+        result = (False, e)
+    try:
+        connection.send(result)
+    except Exception as e:
+        # the exception may not be picklable
+        connection.send((False, RuntimeError(str(e))))
+    connection.close()
+
+
+def call_with_budget(function, args=(), timeout=None, memory_limit=None):
+    """
+    calls ``function`` in a forked process which is killed
+    after ``timeout`` seconds and can allocate at most
+    ``memory_limit`` more bytes than the current process,
+    raises ``TimeoutError`` or ``MemoryError`` if the budget
+    is exceeded and re-raises exceptions of ``function``;
+    the function is called directly if fork is not available
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():  # pragma: nocover
+        return function(*args)
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_budget_worker,
+                              args=(sender, function, args, memory_limit))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            process.terminate()
+            raise TimeoutError('Time budget of {0} seconds exceeded'.format(timeout))
+        try:
+            success, result = receiver.recv()
+        except EOFError:
+            # process killed (eg: out of memory)
+            raise MemoryError('Process terminated unexpectedly')
+    finally:
+        receiver.close()
+        process.join()
+    if not success:
+        raise result
+    return result
@@ -0,0 +1,153 @@
+"""
+Precompiled configuration variables
+
+netjsonconfig evaluates the ``{{ variable }}`` placeholders by walking
+the whole configuration merged with its templates at each render; instead,
+configurations are compiled once into the list of locations which contain
+placeholders (compiled templates are kept in memory, indexed by a hash of
+their configuration), so that variables are evaluated by visiting only
+those locations.
+
+The names of the variables used by each configuration and template are
+stored in their ``used_variables`` relation, which allows to find the
+configurations affected by a change to the value of a variable
+(see ``base.VariablesMixin``).
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from copy import copy
+
+import six
+from jsonfield.encoder import JSONEncoder
+
+from netjsonconfig.utils import var_pattern
+
+# maximum number of compiled templates kept in memory
+CACHE_SIZE = 1000
+
+CompiledConfig = namedtuple('CompiledConfig', ['locations', 'variables'])
+CompiledConfig.__doc__ = """
+``locations`` is a tuple of ``(path, variables)`` tuples, ``path`` being the
+sequence of keys and indexes which leads to a string containing placeholders,
+``variables`` is the set of the names of all the variables used
+"""
+
+_compiled_templates = OrderedDict()
+_lock = threading.Lock()
+
+
+def compile_config(config):
+    """
+    returns the ``CompiledConfig`` of ``config``
+    """
+    locations = []
+    _find_locations(config, (), locations)
+    variables = frozenset(name for path, names in locations for name in names)
+    return CompiledConfig(tuple(locations), variables)
+
+
+def _find_locations(data, path, locations):
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        if isinstance(data, six.string_types) and '{{' in data:
+            names = var_pattern.findall(data)
+            if names:
+                locations.append((path, frozenset(name.strip() for name in names)))
+        return
+    for key, value in items:
+        _find_locations(value, path + (key,), locations)
+
+
+def json_hash(value):
+    """
+    returns a hash of the JSON representation of ``value``
+    """
+    return hashlib.md5(json.dumps(value).encode()).hexdigest()
+
+
+def get_compiled_template(template):
+    """
+    returns the ``CompiledConfig`` of the configuration of
+    ``template``, which is compiled once for each distinct
+    configuration (the cache is indexed by its hash, hence
+    changes which don't go through ``save`` are detected too)
+    """
+    key = json_hash(template.config)
+    with _lock:
+        compiled = _compiled_templates.get(key)
+        if compiled is not None:
+            _compiled_templates.move_to_end(key)
+            return compiled
+    compiled = compile_config(template.config)
+    with _lock:
+        _compiled_templates[key] = compiled
+        while len(_compiled_templates) > CACHE_SIZE:
+            _compiled_templates.popitem(last=False)
+    return compiled
+
+
+def evaluate(config, compiled, context):
+    """
+    returns ``config`` with the placeholders of the variables
+    defined in ``context`` replaced by their values; only the
+    locations listed in ``compiled`` are visited and only the
+    lists and dicts which contain them are copied, hence
+    ``config`` is not modified (and returned if unchanged)
+    """
+    if not context or compiled.variables.isdisjoint(context):
+        return config
+
+    def replace(match):
+        name = match.group(1).strip()
+        if name in context:
+            return six.text_type(context[name])
+        return match.group(0)
+
+    result = copy(config)
+    # containers which have already been copied, indexed by path
+    copies = {(): result}
+    for path, names in compiled.locations:
+        if names.isdisjoint(context):
+            continue
+        parent = result
+        for i in range(1, len(path)):
+            if path[:i] not in copies:
+                parent[path[i - 1]] = copies[path[:i]] = copy(parent[path[i - 1]])
+            parent = copies[path[:i]]
+        parent[path[-1]] = var_pattern.sub(replace, parent[path[-1]])
+    return result
+
+
+def get_template_defaults(templates):
+    """
+    returns the default values of the variables of ``templates``
+    (``Template.variable``), the values of the last templates
+    override the values of the previous ones
+    """
+    defaults = {}
+    for template in templates:
+        for name, value in (template.variable or {}).items():
+            if isinstance(value, six.string_types + six.integer_types + (float,)):
+                defaults[name] = value
+    return defaults
+
+
+def get_checksums(context):
+    """
+    returns the checksum of the value of each variable of ``context``
+    """
+    return dict((name, hashlib.md5(json.dumps(value, cls=JSONEncoder).encode()).hexdigest())
+                for name, value in context.items())
+
+
+def get_changed_variables(old, new):
+    """
+    returns the names of the variables whose
+    values differ between the ``old`` and ``new`` dicts
+    """
+    return set(name for name in set(old) | set(new) if old.get(name) != new.get(name))
@@ -1,56 +1,194 @@
+import hashlib
 import json
-from copy import deepcopy
 
-from django.http import HttpResponse
-from django.utils import timezone
-from django.utils.module_loading import import_string
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.text import compress_string
 from django.utils.translation import ugettext as _
-from django.views.decorators.http import last_modified
 
+import netjsonconfig
+
+from . import get_version
+from .backends import get_backend
 from .settings import BACKENDS, VPN_BACKENDS
 
 ALL_BACKENDS = BACKENDS + VPN_BACKENDS
+# schema and editor URLs contain the hash of their
+# contents, therefore browsers can cache them forever
+ASSET_MAX_AGE = 60 * 60 * 24 * 365
+IMMUTABLE_CACHE_CONTROL = 'max-age={0}, immutable'.format(ASSET_MAX_AGE)
 
-# ``available_schemas`` and ``available_schemas_json``
-# will be generated only once at startup
-available_schemas = {}
-for backend_path, label in ALL_BACKENDS:  # noqa
-    backend = import_string(backend_path)
-    schema = deepcopy(backend.schema)
-    # must use conditional because some custom backends might not specify an hostname
-    if 'general' in schema['properties']:
-        # hide hostname because it's handled via models
-        if 'hostname' in schema['properties']['general']['properties']:
-            del schema['properties']['general']['properties']['hostname']
-        # remove hosname from required properties
-        if 'hostname' in schema['properties']['general'].get('required', []):
-            del schema['properties']['general']['required']
-    # start editor empty by default, except for VPN schemas
-    if (backend_path, label) not in VPN_BACKENDS:
-        schema['defaultProperties'] = []
-    available_schemas[backend_path] = schema
-available_schemas_json = json.dumps(available_schemas)
-
-login_required_error = json.dumps({'error': _('login required')})
-
-# ``start_time`` will contain the datetime of the moment in which the
-# application server is started and it is used in the last-modified
-# header of the HTTP response of ``schema`` view
-start_time = timezone.now()
-
-
-@last_modified(lambda request: start_time)
-def schema(request):
+# scripts of the configuration editor, served as a single
+# bundle when ``NETJSONCONFIG_DEFERRED_EDITOR`` is enabled
+EDITOR_JS = ['lib/advanced-mode.js',
+             'lib/tomorrow_night_bright.js',
+             'lib/jsonschema-ui.js',
+             'jsonschema-ui-theme.js']
+EDITOR_CSS = ['lib/jsonschema-ui.css',
+              'lib/advanced-mode.css']
+
+# schemas and editor bundle are built on first use,
+# see ``get_schema_asset`` and ``get_editor_asset``
+_schema_assets = {}
+_editor_assets = {}
+
+
+def build_asset(content):
+    """
+    returns a ``(content, gzipped content, content hash)`` tuple
+    """
+    return (content, compress_string(content), hashlib.sha1(content).hexdigest()[:16])
+
+
+def get_schema(backend_path):
+    """
+    returns the JSON schema of a backend
+    as shown by the configuration editor
+    """
+    return get_backend(backend_path).schema
+
+
+def get_schema_asset(backend_path):
+    """
+    returns the asset (see ``build_asset``) of the
+    JSON schema of a backend, which is built on first use
+    and stored in the django cache, shared by the workers of
+    the same release (its cache key changes at every release)
+    """
+    asset = _schema_assets.get(backend_path)
+    if asset:
+        return asset
+    cache_key = 'netjsonconfig-schema-{0}-{1}-{2}'.format(backend_path,
+                                                          get_version(),
+                                                          netjsonconfig.get_version())
+    cache_key = cache_key.replace(' ', '')
+    asset = cache.get(cache_key)
+    if asset is None:
+        content = json.dumps(get_schema(backend_path), separators=(',', ':')).encode()
+        asset = build_asset(content)
+        cache.set(cache_key, asset, None)
+    _schema_assets[backend_path] = asset
+    return asset
+
+
+def get_schema_url(backend_path):
+    return reverse('netjsonconfig:backend_schema', kwargs={
+        'backend': backend_path,
+        'version': get_schema_asset(backend_path)[2]
+    })
+
+
+def get_schema_urls():
+    """
+    returns the versioned schema URL of each backend
+    """
+    return dict((path, get_schema_url(path)) for path, label in ALL_BACKENDS)
+
+
+def get_editor_asset():
     """
-    returns configuration checksum
+    returns the asset (see ``build_asset``) of the bundle of the
+    configuration editor scripts, which is built on first use
+    (it's too big for some cache backends, eg: memcached)
     """
+    if 'js' not in _editor_assets:
+        contents = []
+        for path in EDITOR_JS:
+            with open(finders.find('django-netjsonconfig/js/{0}'.format(path)), 'rb') as f:
+                contents.append(f.read())
+        _editor_assets['js'] = build_asset(b'\n;'.join(contents))
+    return _editor_assets['js']
+
+
+def get_editor_url():
+    return reverse('netjsonconfig:editor', kwargs={'version': get_editor_asset()[2]})
+
+
+def login_required_error():
+    return HttpResponse(json.dumps({'error': _('login required')}),
+                        status=403,
+                        content_type='application/json')
+
+
+def is_authenticated(request):
     authenticated = request.user.is_authenticated
     if callable(authenticated):
         authenticated = authenticated()
-    if authenticated:
-        c = available_schemas_json
-        status = 200
+    return authenticated
+
+
+def backend_schema(request, backend, version):
+    """
+    returns the JSON schema of a backend, gzipped if supported
+    by the client and cached forever (URLs are versioned)
+    """
+    if not is_authenticated(request):
+        return login_required_error()
+    if backend not in dict(ALL_BACKENDS):
+        raise Http404()
+    asset = get_schema_asset(backend)
+    # URL of another release
+    if version != asset[2]:
+        return HttpResponseRedirect(get_schema_url(backend))
+    return asset_response(request, asset, 'application/json',
+                          'private, {0}'.format(IMMUTABLE_CACHE_CONTROL))
+
+
+def editor(request, version):
+    """
+    returns the bundle of the configuration editor scripts,
+    gzipped if supported by the client and cached forever
+    """
+    asset = get_editor_asset()
+    if version != asset[2]:
+        return HttpResponseRedirect(get_editor_url())
+    return asset_response(request, asset, 'application/javascript',
+                          'public, {0}'.format(IMMUTABLE_CACHE_CONTROL))
+
+
+def asset_response(request, asset, content_type, cache_control):
+    """
+    returns a response for an asset (see ``build_asset``)
+    whose ETag is the hash of its contents
+    """
+    content, gzipped, content_hash = asset
+    etag = '"{0}"'.format(content_hash)
+    # weak comparison, as required for If-None-Match
+    if_none_match = [tag[2:] if tag.startswith('W/') else tag
+                     for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(gzipped, content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def schema(request):
+    """
+    returns the JSON schemas of all the backends
+    (kept for backward compatibility, the configuration
+    editor loads only the schema of the selected backend)
+    """
+    if not is_authenticated(request):
+        return login_required_error()
+    assets = [(path, get_schema_asset(path)) for path, label in ALL_BACKENDS]
+    content = '{{{0}}}'.format(','.join('{0}:{1}'.format(json.dumps(path), asset[0].decode())
+                                        for path, asset in assets))
+    content_hash = hashlib.sha1(''.join(asset[2] for path, asset in assets).encode())
+    etag = '"{0}"'.format(content_hash.hexdigest())
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
     else:
-        c = login_required_error
-        status = 403
-    return HttpResponse(c, status=status, content_type='application/json')
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
@@ -1,10 +1,20 @@
 from __future__ import absolute_import, unicode_literals
 
+import copy
+import json
+
 from django import forms
 from django.contrib.admin.templatetags.admin_static import static
 from django.contrib.admin.widgets import AdminTextareaWidget
+from django.db.models import Q
 from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
+from sortedm2m.forms import SortedCheckboxSelectMultiple
+
+from . import settings as app_settings
+from .views import EDITOR_CSS, EDITOR_JS, get_editor_url, get_schema_urls
 
 
 class JsonSchemaWidget(AdminTextareaWidget):
@@ -14,21 +24,23 @@ class JsonSchemaWidget(AdminTextareaWidget):
     @property
     def media(self):
         prefix = 'django-netjsonconfig'
+        if app_settings.DEFERRED_EDITOR:
+            # the editor is loaded when editing starts
+            return forms.Media(js=[static('{0}/js/widget.js'.format(prefix))])
         js = [static('{0}/js/{1}'.format(prefix, f))
-              for f in ('lib/advanced-mode.js',
-                        'lib/tomorrow_night_bright.js',
-                        'lib/jsonschema-ui.js',
-                        'widget.js')]
+              for f in EDITOR_JS + ['widget.js']]
         css = {'all': [static('{0}/css/{1}'.format(prefix, f))
-                       for f in ('lib/jsonschema-ui.css',
-                                 'lib/advanced-mode.css')]}
+                       for f in EDITOR_CSS]}
         return forms.Media(js=js, css=css)
 
     def render(self, name, value, attrs={}, renderer=None):
         attrs['class'] = 'vLargeTextField jsoneditor-raw'
         html = """
 <input class="button json-editor-btn-edit advanced-mode" type="button" value="{0}">
-<script>django._netjsonconfigSchemaUrl = "{1}";</script>
+<script>
+    django._netjsonconfigSchemaUrl = "{1}";
+    django._netjsonconfigSchemaUrls = {2};
+</script>
 <label id="netjsonconfig-hint">
     Want learn to use the advanced mode? Consult the
     <a href="http://netjsonconfig.openwisp.org/en/stable/general/basics.html"
@@ -36,6 +48,51 @@ class JsonSchemaWidget(AdminTextareaWidget):
 </label>
 """
         html = html.format(_('Advanced mode (raw JSON)'),
-                           reverse('netjsonconfig:schema'))
+                           reverse('netjsonconfig:schema'),
+                           json.dumps(get_schema_urls()))
+        if app_settings.DEFERRED_EDITOR:
+            html += self.render_editor_loader()
         html += super(JsonSchemaWidget, self).render(name, value, attrs, renderer)
         return html
+
+    def render_editor_loader(self):
+        bundle = {
+            'js': get_editor_url(),
+            'css': [static('django-netjsonconfig/css/{0}'.format(f)) for f in EDITOR_CSS]
+        }
+        return format_html('<script>django._netjsonconfigEditorBundle = {0};</script>'
+                           '<input class="button json-editor-btn-load" type="button" value="{1}">',
+                           mark_safe(json.dumps(bundle)),
+                           _('Open configuration editor'))
+
+
+class SortedAutocompleteWidget(SortedCheckboxSelectMultiple):
+    """
+    Sorted m2m widget which renders only the selected options
+    and the ones matching ``initial_filter``, the other options
+    are loaded page by page from ``url`` when searching
+    """
+    def __init__(self, url, initial_filter=None, attrs=None):
+        super(SortedAutocompleteWidget, self).__init__(attrs)
+        self.url = url
+        self.initial_filter = initial_filter
+
+    @property
+    def media(self):
+        media = forms.Media(SortedCheckboxSelectMultiple.Media)
+        js = [static('django-netjsonconfig/js/sortedm2m-autocomplete.js')]
+        return media + forms.Media(js=js)
+
+    def get_initial_choices(self, value):
+        lookup = Q(pk__in=value or [])
+        if self.initial_filter:
+            lookup |= self.initial_filter
+        queryset = self.choices.queryset.filter(lookup)
+        return [(obj.pk, str(obj)) for obj in queryset]
+
+    def render(self, name, value, attrs=None, choices=(), renderer=None):
+        widget = copy.copy(self)
+        widget.choices = self.get_initial_choices(value)
+        html = super(SortedAutocompleteWidget, widget).render(name, value, attrs, choices, renderer)
+        return format_html('<div class="sortedm2m-autocomplete" data-url="{0}">{1}</div>',
+                           self.url, html)
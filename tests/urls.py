@@ -13,6 +13,8 @@ urlpatterns = [
     # shared among django-netjsonconfig components
     # keep the namespace argument unchanged
     url(r'^', include('django_netjsonconfig.urls', namespace='netjsonconfig')),
+    # template search API
+    url(r'^', include('django_netjsonconfig.api.urls', namespace='api')),
     url(r'^', include('django_x509.urls', namespace='x509')),
 ]
 